@@ -0,0 +1,246 @@
+# script/bench_suite.py
+# Benchmark suite for the pipeline stages at 100 / 1k / 10k keywords.
+# For each size a scratch copy of the repo gets a synthetic corpus in the current
+# layouts (data_monthly/raw/<kw>_<YYYYmmdd>_<HHMM>.csv, data_weekly/raw_windows/<kw>/
+# <kw>_<start>_<end>.csv, queues and master lists with every keyword processed, a few
+# new ones unprocessed and 1% dropped from the master lists), then each stage runs as
+# its own process with the network mocked out (script/fake_trends.py):
+#   stitch_weekly    script_weekly/restitch_weekly.py --force --workers 1
+#   manifest_*       script/manifest.py rebuild-manifest (the raw directory scan)
+#   merge_*          script/merge_files.py, script_weekly/merge_weekly.py (full rebuild)
+#   sync_*           sync_master_and_cleanup.py, sync_master_weekly.py
+#   fetch_*          script/run_batch.py <pipeline> --no-sync --no-merge (fake backend)
+# Per stage: wall and CPU time, peak RSS, and file operations counted with an audit
+# hook (opens outside the Python install, directory scans, renames/removes) plus the
+# read/write syscalls from /proc/self/io where available.
+# Results are compared with a stored baseline (bench/baseline.json by default) and
+# regressions beyond the tolerances are flagged; the exit code is 1 if there are any.
+#
+# Usage: python script/bench_suite.py [--sizes 100 1000 10000] [--stages merge_monthly ...]
+#            [--fetch-keywords 10] [--baseline bench/baseline.json] [--save-baseline]
+#            [--out results.json] [--time-tolerance 0.25] [--memory-tolerance 0.15]
+#            [--io-tolerance 0.05] [--keep]
+
+import argparse, json, os, resource, runpy, shutil, subprocess, sys, sysconfig, tempfile, time
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+SKIP = shutil.ignore_patterns(".git", "cache", "__pycache__", "bench")
+
+# stage -> (script, args); run in this order, later stages rely on earlier output
+STAGES = {
+    "stitch_weekly": ("script_weekly/restitch_weekly.py", ["--force", "--workers", "1"]),
+    "manifest_monthly": ("script/manifest.py", ["rebuild-manifest", "monthly"]),
+    "manifest_weekly": ("script/manifest.py", ["rebuild-manifest", "weekly"]),
+    "merge_monthly": ("script/merge_files.py", []),
+    "merge_weekly": ("script_weekly/merge_weekly.py", []),
+    "sync_monthly": ("script/sync_master_and_cleanup.py", []),
+    "sync_weekly": ("script_weekly/sync_master_weekly.py", []),
+    "fetch_monthly": ("script/run_batch.py", ["monthly", "--no-sync", "--no-merge"]),
+    "fetch_weekly": ("script/run_batch.py", ["weekly", "--no-sync", "--no-merge"]),
+}
+METRICS = ("wall_s", "cpu_s", "peak_rss_mib", "opens", "dir_scans", "renames_removes", "read_syscalls", "write_syscalls")
+
+# ----------------- Synthetic corpus -----------------
+def _series(rng, n):
+    walk = np.exp(np.cumsum(rng.normal(0, 0.08, n)))
+    return np.round(walk / walk.max() * 100).astype(int)
+
+def _write_csv(path, header, dates, values):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header + "\n")
+        f.write("\n".join(f"{d},{v}" for d, v in zip(dates, values)))
+        f.write("\n")
+
+def generate(repo, n, fetch_keywords, seed=0):
+    """Replace the data and queues of a scratch copy with n synthetic keywords."""
+    sys.path.insert(0, os.path.join(repo, "script"))
+    from keyword_queue import KeywordQueue
+    rng = np.random.default_rng(seed)
+    keywords = [f"bench keyword {i:05d}" for i in range(n)]
+    new = [f"bench new {i:03d}" for i in range(fetch_keywords)]
+    dropped = set(keywords[:: 100])  # ~1% removed from the master lists
+    for d in ("data_monthly", "data_weekly", "data_daily"):
+        shutil.rmtree(os.path.join(repo, d), ignore_errors=True)
+    monthly_raw = os.path.join(repo, "data_monthly", "raw")
+    windows_dir = os.path.join(repo, "data_weekly", "raw_windows")
+    for d in (monthly_raw, windows_dir, os.path.join(repo, "data_monthly", "merged"),
+              os.path.join(repo, "data_weekly", "raw_weekly"), os.path.join(repo, "data_weekly", "merged")):
+        os.makedirs(d)
+    months = pd.date_range("2015-01-01", periods=131, freq="MS").strftime("%Y-%m-%d")
+    windows = [("2015-01-01", "2020-01-01"), ("2019-01-01", "2024-01-01"), ("2023-01-01", "2025-12-09")]
+    weeks = [pd.date_range(pd.Timestamp(s) - pd.Timedelta(days=(pd.Timestamp(s).weekday() + 1) % 7), e,
+                           freq="W-SUN").strftime("%Y-%m-%d") for s, e in windows]
+    for kw in keywords:
+        safe = kw.replace(" ", "_")
+        _write_csv(os.path.join(monthly_raw, f"{safe}_20251117_{rng.integers(0, 2400):04d}.csv"),
+                   f"date,{safe}", months, _series(rng, len(months)))
+        os.makedirs(os.path.join(windows_dir, safe))
+        for (s, e), dates in zip(windows, weeks):
+            name = f"{safe}_{s.replace('-', '')}_{e.replace('-', '')}.csv"
+            _write_csv(os.path.join(windows_dir, safe, name), f",{safe}", dates, _series(rng, len(dates)))
+    master = sorted(set(keywords) - dropped) + new
+    for pipeline, master_name in (("monthly", "all_keywords.txt"), ("weekly", "master_keywords.txt")):
+        keydir = os.path.join(repo, f"keywords_{pipeline}")
+        with open(os.path.join(keydir, master_name), "w", encoding="utf-8") as f:
+            f.write("\n".join(master) + "\n")
+        queue = KeywordQueue(pipeline, db_path=os.path.join(keydir, "queue.sqlite"))
+        queue.remove([kw for status in ("unprocessed", "processing", "processed", "failed")
+                      for kw in queue.keywords(status)])
+        queue.add(keywords + new)
+        for kw in keywords:
+            queue.complete(kw)
+        queue.close()
+    sys.path.pop(0)
+
+# ----------------- One stage, inside its own process -----------------
+def _proc_io():
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+def run_stage(script, args, result_path):
+    """Run script as __main__ in this process and write its metrics to result_path."""
+    counts = {"opens": 0, "dir_scans": 0, "renames_removes": 0}
+    stdlib = tuple({sysconfig.get_paths()[k] for k in ("stdlib", "purelib", "platlib")})
+
+    def hook(event, hook_args):
+        if event == "open":
+            path = hook_args[0]
+            if isinstance(path, str) and not path.startswith(stdlib) and not path.endswith((".py", ".pyc", ".so")):
+                counts["opens"] += 1
+        elif event in ("os.listdir", "os.scandir", "glob.glob"):
+            counts["dir_scans"] += 1
+        elif event in ("os.remove", "os.rename", "os.rmdir"):
+            counts["renames_removes"] += 1
+
+    io0 = _proc_io()
+    sys.argv = [script] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    t0, c0 = time.perf_counter(), time.process_time()
+    sys.addaudithook(hook)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    io1 = _proc_io()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak_kib = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children.ru_maxrss)
+    result = dict(counts, wall_s=round(wall, 3), cpu_s=round(cpu + children.ru_utime + children.ru_stime, 3),
+                  peak_rss_mib=round(peak_kib / 1024, 1),
+                  read_syscalls=io1.get("syscr", 0) - io0.get("syscr", 0) if io1 else None,
+                  write_syscalls=io1.get("syscw", 0) - io0.get("syscw", 0) if io1 else None)
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+# ----------------- Suite -----------------
+def bench_size(n, stages, fetch_keywords, keep):
+    base = tempfile.mkdtemp(prefix=f"trends_bench_{n}_")
+    repo = os.path.join(base, "repo")
+    shutil.copytree(ROOT, repo, ignore=SKIP)
+    t0 = time.time()
+    generate(repo, n, fetch_keywords)
+    print(f"-- {n} keywords: corpus generated in {time.time() - t0:.1f}s ({repo})")
+    env = dict(os.environ,
+               TRENDS_FAKE_BACKEND="1", TRENDS_FAKE_LATENCY="0", TRENDS_FAKE_THROTTLE="0",
+               TRENDS_CACHE_DIR=os.path.join(base, "cache"),
+               KEYWORDS_PER_RUN=str(fetch_keywords),
+               MONTHLY_REQUESTS_PER_MINUTE="60000", WEEKLY_REQUESTS_PER_MINUTE="60000", WEEKLY_JITTER="0")
+    env.pop("TRENDS_BASE_URL", None)
+    results = {}
+    for stage in [s for s in STAGES if s in stages]:
+        script, args = STAGES[stage]
+        result_path = os.path.join(base, f"{stage}.json")
+        with open(os.path.join(base, f"{stage}.log"), "w") as log:
+            proc = subprocess.run([sys.executable, os.path.join(repo, "script", "bench_suite.py"),
+                                   "_stage", script, result_path, *args],
+                                  cwd=repo, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if proc.returncode or not os.path.exists(result_path):
+            print(f"   {stage}: FAILED (exit {proc.returncode}, see {os.path.join(base, stage + '.log')})")
+            keep = True
+            continue
+        with open(result_path) as f:
+            results[stage] = json.load(f)
+        r = results[stage]
+        print(f"   {stage:<17} {r['wall_s']:>8.2f}s  {r['peak_rss_mib']:>7.1f} MiB  "
+              f"{r['opens']:>7} opens  {r['dir_scans']:>6} scans")
+    if not keep:
+        shutil.rmtree(base, ignore_errors=True)
+    return results
+
+def compare(results, baseline, tolerances):
+    """Regressions as (size, stage, metric, baseline, now) tuples."""
+    # absolute floors keep noise on tiny numbers from being flagged
+    floors = {"wall_s": 0.2, "cpu_s": 0.2, "peak_rss_mib": 8, "opens": 5, "dir_scans": 2,
+              "renames_removes": 5, "read_syscalls": 200, "write_syscalls": 200}
+    kinds = {"wall_s": "time", "cpu_s": "time", "peak_rss_mib": "memory"}
+    found = []
+    for size, stages in results.items():
+        for stage, now in stages.items():
+            old = baseline.get(size, {}).get(stage)
+            if not old:
+                continue
+            for metric in METRICS:
+                a, b = old.get(metric), now.get(metric)
+                if a is None or b is None:
+                    continue
+                tol = tolerances[kinds.get(metric, "io")]
+                if b > a * (1 + tol) and b - a > floors[metric]:
+                    found.append((size, stage, metric, a, b))
+    return found
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Time the pipeline stages on synthetic corpora.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    ap.add_argument("--fetch-keywords", type=int, default=10, help="new keywords fetched by the fetch stages")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    ap.add_argument("--out", help="also write the results to this JSON file")
+    ap.add_argument("--time-tolerance", type=float, default=0.25)
+    ap.add_argument("--memory-tolerance", type=float, default=0.15)
+    ap.add_argument("--io-tolerance", type=float, default=0.05)
+    ap.add_argument("--keep", action="store_true", help="keep the scratch copies")
+    args = ap.parse_args(argv)
+
+    results = {str(n): bench_size(n, args.stages, args.fetch_keywords, args.keep) for n in args.sizes}
+    doc = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+           "fetch_keywords": args.fetch_keywords, "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=1)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f).get("results", {})
+        stored.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(dict(doc, results=stored), f, indent=1)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f).get("results", {})
+    tolerances = {"time": args.time_tolerance, "memory": args.memory_tolerance, "io": args.io_tolerance}
+    regressions = compare(results, baseline, tolerances)
+    for size, stage, metric, a, b in regressions:
+        print(f"REGRESSION {size} keywords / {stage} / {metric}: {a} -> {b} ({(b - a) / a * 100 if a else float('inf'):+.0f}%)")
+    if not regressions:
+        print("No regressions against", args.baseline)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_stage":
+        run_stage(sys.argv[2], sys.argv[4:], sys.argv[3])
+        sys.exit(0)
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# script/columnar_store.py
+# Binary columnar copy of a merged wide CSV, written next to it by the merges.
+# <merged>.store/ (e.g. data_monthly/merged/main_dataset.store/) holds plain .npy files
+# that np.load can memory-map, so opening the store reads no data at all:
+# - dates.npy     datetime64[D], the date index (sorted)
+# - values.npy    keywords x dates matrix, keyword-major so one keyword is one
+#                 contiguous row; uint8 when every value is an integer in 0-255
+#                 (raw Trends data), otherwise float32 if that holds every value
+#                 exactly and float64 if not (stitched weekly series), so the merges
+#                 can regenerate the CSV from the store (script/incremental_merge.py)
+# - mask.npy      bool, same shape, True where the CSV has a value
+# - keywords.json keyword dictionary (column order = row order), dtype and the
+#                 sha256 of the CSV the store was built from
+# The CSV stays the source of truth; a store whose recorded CSV hash doesn't match
+# is rebuilt on the next merge.
+#
+# Usage: python script/columnar_store.py [monthly|weekly]   (rebuild + describe)
+
+import json, os, shutil, sys
+import numpy as np
+import pandas as pd
+from manifest import file_sha256
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MERGED = {
+    "monthly": os.path.join(ROOT, "data_monthly", "merged", "main_dataset.csv"),
+    "weekly": os.path.join(ROOT, "data_weekly", "merged", "weekly_dataset.csv"),
+}
+FORMAT = 1
+
+def store_dir(csv_path):
+    return os.path.splitext(csv_path)[0] + ".store"
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, "keywords.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_current(csv_path, csv_sha=None):
+    """True if the store next to csv_path was built from the CSV as it is now."""
+    meta = read_meta(store_dir(csv_path))
+    if meta is None or meta.get("format") != FORMAT:
+        return False
+    return meta.get("source_sha256") == (csv_sha or file_sha256(csv_path))
+
+def _fits_uint8(block):
+    present = block[~np.isnan(block)]
+    return bool(np.all((present >= 0) & (present <= 255) & (present == np.round(present))))
+
+def _fits_float32(block):
+    present = block[~np.isnan(block)]
+    return bool(np.all(present.astype(np.float32).astype(float) == present))
+
+def _dtype(data, n_kw, chunk):
+    # the narrowest type that loses nothing
+    for dtype, fits in ((np.uint8, _fits_uint8), (np.float32, _fits_float32)):
+        if all(fits(np.asarray(data[i:i + chunk], dtype=float)) for i in range(0, n_kw, chunk)):
+            return dtype
+    return np.float64
+
+def write(frame, csv_path, csv_sha=None):
+    """Write the store for a merged frame (date index x keyword columns) that was
+    just saved to csv_path."""
+    return write_matrix(csv_path, frame.index, frame.columns, frame.to_numpy(dtype=float).T, csv_sha)
+
+def write_matrix(csv_path, dates, keywords, data, csv_sha=None, chunk=256):
+    """Write the store from a keywords x dates float array (NaN = no value), e.g.
+    the scratch file of the streaming merge. data is read `chunk` keywords at a
+    time, so memory stays bounded. The directory is swapped in whole."""
+    path = store_dir(csv_path)
+    tmp, old = path + ".tmp", path + ".old"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    n_kw, n_dates = len(keywords), len(dates)
+    dtype = _dtype(data, n_kw, chunk)
+    np.save(os.path.join(tmp, "dates.npy"), pd.DatetimeIndex(dates).to_numpy(dtype="datetime64[D]"))
+    # written sequentially block by block, so no more than one block is in memory
+    with open(os.path.join(tmp, "values.npy"), "wb") as fv, open(os.path.join(tmp, "mask.npy"), "wb") as fm:
+        for f, dt in ((fv, dtype), (fm, bool)):
+            np.lib.format.write_array_header_1_0(
+                f, {"descr": np.dtype(dt).str, "fortran_order": False, "shape": (n_kw, n_dates)})
+        for i in range(0, n_kw, chunk):
+            block = np.asarray(data[i:i + chunk], dtype=float)
+            present = ~np.isnan(block)
+            fm.write(present.tobytes())
+            fv.write((np.where(present, block, 0) if dtype is np.uint8 else block).astype(dtype).tobytes())
+    meta = {
+        "format": FORMAT,
+        "keywords": [str(c) for c in keywords],
+        "dtype": np.dtype(dtype).name,
+        "shape": [n_kw, n_dates],
+        "source_sha256": csv_sha or file_sha256(csv_path),
+    }
+    with open(os.path.join(tmp, "keywords.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+        f.write("\n")
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return path
+
+def write_from_csv(csv_path):
+    frame = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+    return write(frame, csv_path)
+
+def remove(csv_path):
+    shutil.rmtree(store_dir(csv_path), ignore_errors=True)
+
+class ColumnarStore:
+    """Read-only view of a store. dates, values and mask are memory-mapped; only
+    the rows and date ranges a caller asks for are ever paged in."""
+
+    def __init__(self, path):
+        meta = read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"No columnar store at {path}")
+        self.path = path
+        self.meta = meta
+        self.keywords = meta["keywords"]
+        self.rows = {kw: i for i, kw in enumerate(self.keywords)}
+        self.dates = np.load(os.path.join(path, "dates.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        self.mask = np.load(os.path.join(path, "mask.npy"), mmap_mode="r")
+
+    def __contains__(self, keyword):
+        return keyword in self.rows
+
+    def date_slice(self, start=None, end=None):
+        """Slice of the date axis between start and end (inclusive)."""
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), "D"))
+        hi = len(self.dates) if end is None else np.searchsorted(
+            self.dates, np.datetime64(pd.Timestamp(end), "D"), side="right")
+        return slice(int(lo), int(hi))
+
+    def raw(self, keyword, start=None, end=None):
+        """(dates, values, mask) views of one keyword; no copy."""
+        row, span = self.rows[keyword], self.date_slice(start, end)
+        return self.dates[span], self.values[row, span], self.mask[row, span]
+
+    def column(self, keyword, start=None, end=None):
+        """One keyword as a float Series (NaN where the CSV is empty)."""
+        dates, values, mask = self.raw(keyword, start, end)
+        data = np.where(mask, values, np.nan)
+        return pd.Series(data, index=pd.DatetimeIndex(dates, name="date"), name=keyword)
+
+    def frame(self, keywords=None, start=None, end=None):
+        """date x keyword DataFrame for a subset of keywords and dates."""
+        keywords = self.keywords if keywords is None else list(keywords)
+        rows, span = [self.rows[kw] for kw in keywords], self.date_slice(start, end)
+        values = self.values[rows, span].astype(float)
+        values[~self.mask[rows, span]] = np.nan
+        index = pd.DatetimeIndex(self.dates[span], name="date")
+        return pd.DataFrame(values.T, index=index, columns=keywords)
+
+def open_store(csv_or_store_path):
+    path = csv_or_store_path
+    if not path.endswith(".store"):
+        path = store_dir(path)
+    return ColumnarStore(path)
+
+def describe(csv_path):
+    store = open_store(csv_path)
+    size = sum(os.path.getsize(os.path.join(store.path, n)) for n in os.listdir(store.path))
+    n_kw, n_dates = store.values.shape
+    span = f"{store.dates[0]} .. {store.dates[-1]}" if n_dates else "no dates"
+    return (f"{store.path}: {n_kw} keywords x {n_dates} dates ({span}), {store.meta['dtype']}, "
+            f"{int(store.mask.sum())} values, {size / 1024:.0f} KiB, "
+            f"{'current' if is_current(csv_path) else 'STALE'}")
+
+if __name__ == "__main__":
+    datasets = sys.argv[1:] or list(MERGED)
+    for name in datasets:
+        if name not in MERGED:
+            print("Usage: python script/columnar_store.py [monthly|weekly]")
+            sys.exit(1)
+        csv_path = MERGED[name]
+        if not os.path.exists(csv_path):
+            print(f"{name}: no merged dataset at {csv_path}")
+            continue
+        if not is_current(csv_path):
+            write_from_csv(csv_path)
+        print(describe(csv_path))
@@ -0,0 +1,62 @@
+# script/daily_store.py
+# Compact per-keyword store for stitched daily series.
+# data_daily/store/<safe_kw>.npz holds the first date and one contiguous float32
+# array (NaN = no data), about 4 bytes per day before compression, instead of a
+# CSV with a date string on every row. Weekly (Sunday-start weeks, like Google's
+# weekly rows) and monthly levels are averaged from it on load.
+
+import os
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+STORE_DIR = os.path.join(ROOT, "data_daily", "store")
+
+# level -> (resample rule, resample kwargs, days a complete period needs)
+LEVELS = {
+    "W": ("W-SUN", {"label": "left", "closed": "left"}, lambda idx: np.full(len(idx), 7)),
+    "M": ("MS", {}, lambda idx: idx.days_in_month),
+}
+
+def store_path(safe_kw, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"{safe_kw}.npz")
+
+def save(safe_kw, series, store_dir=STORE_DIR):
+    """Write a daily Series (gaps allowed) to the store. Returns the path."""
+    series = series.sort_index()
+    first = series.index.min().normalize()
+    days = pd.date_range(first, series.index.max().normalize(), freq="D")
+    values = series.reindex(days).to_numpy(dtype=np.float32)
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(safe_kw, store_dir)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, start=np.datetime64(first.date(), "D"), values=values)
+    os.replace(tmp, path)
+    return path
+
+def load(safe_kw, level="D", store_dir=STORE_DIR):
+    """Daily series of a keyword, or its weekly ("W") / monthly ("M") averages."""
+    with np.load(store_path(safe_kw, store_dir)) as z:
+        start, values = z["start"][()], z["values"]
+    idx = pd.date_range(pd.Timestamp(start), periods=len(values), freq="D", name="date")
+    series = pd.Series(values.astype(float), index=idx, name=safe_kw)
+    return series if level == "D" else rollup(series, level)
+
+def rollup(series, level):
+    """Average a daily series into complete weeks or months (partial edges dropped)."""
+    rule, kwargs, needed = LEVELS[level]
+    days = pd.Series(1, index=series.index).resample(rule, **kwargs).sum()
+    means = series.resample(rule, **kwargs).mean()
+    return means[days.to_numpy() >= needed(means.index)]
+
+def describe(path):
+    """Manifest fields (rows, date range, content hash) for a store file."""
+    from manifest import file_sha256
+    with np.load(path) as z:
+        start, n = pd.Timestamp(z["start"][()]), len(z["values"])
+    return {
+        "rows": int(n),
+        "start": start.strftime("%Y-%m-%d") if n else None,
+        "end": (start + pd.Timedelta(days=n - 1)).strftime("%Y-%m-%d") if n else None,
+        "sha256": file_sha256(path),
+    }
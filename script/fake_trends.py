@@ -0,0 +1,129 @@
+# script/fake_trends.py
+# Offline stand-in for pytrends.TrendReq used to exercise the fetchers without Google.
+# Series are deterministic per (keyword, date), so overlapping windows agree and
+# stitching can be checked; sub-national geos (LK-1 ...) get their own share of the
+# national series. Faults (429s, empty payloads, latency) are injectable.
+
+import os, random, threading, time, zlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pytrends.exceptions import TooManyRequestsError
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+def _seed(keyword):
+    return zlib.crc32(keyword.lower().encode("utf-8"))
+
+def true_volume(keyword, dates, geo=""):
+    """Unnormalized search volume for keyword on each of dates (a DatetimeIndex),
+    nationally or in a sub-national geo such as "LK-3"."""
+    if geo and "-" in geo:
+        # a region: its own level and seasonal lag around the national series
+        seed = _seed(f"{keyword}|{geo}")
+        days = (dates - pd.Timestamp("2015-01-01")).days.to_numpy().astype(float)
+        share = (0.3 + 1.4 * (seed % 1000) / 1000.0) * (1 + 0.2 * np.sin(2 * np.pi * (days + seed % 365) / 365.25))
+        return true_volume(keyword, dates) * share
+    seed = _seed(keyword)
+    level = 20 + seed % 80
+    phase = (seed >> 8) % 365
+    trend = ((seed >> 16) % 21 - 10) / 1000.0
+    days = (dates - pd.Timestamp("2015-01-01")).days.to_numpy().astype(float)
+    season = 1 + 0.3 * np.sin(2 * np.pi * (days + phase) / 365.25)
+    noise = np.array([(zlib.crc32(f"{seed}:{int(d)}".encode()) % 1000) / 1000.0 for d in days])
+    return level * season * np.exp(trend * days / 30.0) * (0.85 + 0.3 * noise)
+
+def parse_timeframe(timeframe):
+    start, end = timeframe.split(" ")
+    return datetime.strptime(start, "%Y-%m-%d"), datetime.strptime(end, "%Y-%m-%d")
+
+def frequency_for(start, end):
+    """Resolution Google returns for a custom timeframe of this length."""
+    span = (end - start).days
+    if span < 270:
+        return "D"
+    # weekly up to about 5 years, with room for the weekly fetcher's 5-year windows
+    # once they are widened to whole weeks
+    if span <= 5 * 366 + 14:
+        return "W-SUN"
+    return "MS"
+
+def interest_frame(kw_list, timeframe, geos=None):
+    """Build the frame TrendReq.interest_over_time() would return for kw_list, or
+    for kw_list[0] compared across geos (columns named by geo)."""
+    start, end = parse_timeframe(timeframe)
+    freq = frequency_for(start, end)
+    first = pd.Timestamp(start)
+    if freq == "W-SUN":
+        first -= pd.Timedelta(days=(first.weekday() + 1) % 7)
+    idx = pd.date_range(first, end, freq=freq, name="date")
+    if geos:
+        raw = pd.DataFrame({g: true_volume(kw_list[0], idx, g) for g in geos}, index=idx)
+    else:
+        raw = pd.DataFrame({kw: true_volume(kw, idx) for kw in kw_list}, index=idx)
+    peak = raw.values.max() if len(raw) else 0
+    df = (raw * (100.0 / peak)).round().astype(int) if peak > 0 else raw.astype(int)
+    df["isPartial"] = False
+    return df
+
+class FakeTrendReq:
+    """Drop-in for TrendReq(...) with the build_payload/interest_over_time subset we use.
+
+    Fault rates are class attributes so a whole run can be configured at once:
+        FakeTrendReq.throttle_rate = 0.2
+    or, for fetchers started as subprocesses, with TRENDS_FAKE_THROTTLE /
+    TRENDS_FAKE_EMPTY / TRENDS_FAKE_LATENCY.
+    """
+    throttle_rate = float(os.environ.get("TRENDS_FAKE_THROTTLE", "0"))
+    empty_rate = float(os.environ.get("TRENDS_FAKE_EMPTY", "0"))
+    latency = float(os.environ.get("TRENDS_FAKE_LATENCY", "0"))
+    retry_after = None
+    calls = 0
+    _rng = random.Random(0)
+    _lock = threading.Lock()
+
+    def __init__(self, hl="en-US", tz=360, geo="", timeout=(2, 5), proxies="", retries=0,
+                 backoff_factor=0, requests_args=None):
+        self.hl = hl
+        self.tz = tz
+        self.geo = geo
+        self.kw_list = []
+        self.geos = None
+        self.timeframe = None
+
+    @classmethod
+    def configure(cls, throttle_rate=0.0, empty_rate=0.0, latency=0.0, retry_after=None, seed=0):
+        cls.throttle_rate = throttle_rate
+        cls.empty_rate = empty_rate
+        cls.latency = latency
+        cls.retry_after = retry_after
+        cls.calls = 0
+        cls._rng = random.Random(seed)
+
+    def build_payload(self, kw_list, cat=0, timeframe="today 5-y", geo="", gprop=""):
+        self.kw_list = list(kw_list)
+        self.geos = None
+        self.timeframe = timeframe
+        self.geo = geo or self.geo
+
+    def build_geo_payload(self, keyword, geos, timeframe, cat=0, gprop=""):
+        self.kw_list = [keyword]
+        self.geos = list(geos)
+        self.timeframe = timeframe
+
+    def interest_over_time(self):
+        cls = type(self)
+        with cls._lock:
+            cls.calls += 1
+            roll = cls._rng.random()
+        if cls.latency:
+            time.sleep(cls.latency)
+        if roll < cls.throttle_rate:
+            headers = {"Retry-After": str(cls.retry_after)} if cls.retry_after else {}
+            raise TooManyRequestsError.from_response(FakeResponse(429, headers))
+        if roll < cls.throttle_rate + cls.empty_rate:
+            return pd.DataFrame()
+        return interest_frame(self.kw_list, self.timeframe, self.geos)
@@ -2,10 +2,17 @@
 # Fetch one Google Trends keyword (safe for GitHub Actions)
 # Requirements: pytrends, pandas
 
-import csv, os, time, traceback
+import argparse, csv, os, socket, time, traceback
 from datetime import datetime
 from pytrends.request import TrendReq
 import pandas as pd
+from throttle import ThrottleController, CircuitOpen
+from trends_cache import CachedTrendReq, CacheMiss, default_cache
+from incremental import splice, weekly_to_monthly
+from manifest import Manifest
+from keyword_queue import KeywordQueue, parse_shard
+from sessions import SessionPool
+import telemetry, profiling
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 KEYWORDS_DIR = os.path.join(ROOT, "keywords_monthly")
@@ -14,12 +21,12 @@ LOGS_DIR = os.path.join(ROOT, "logs")
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
 
-UNPROCESSED = os.path.join(KEYWORDS_DIR, "unprocessed.txt")
-PROCESSING = os.path.join(KEYWORDS_DIR, "processing.txt")
-PROCESSED = os.path.join(KEYWORDS_DIR, "processed.txt")
-FAILED = os.path.join(KEYWORDS_DIR, "failed.txt")
 RUN_LOG = os.path.join(LOGS_DIR, "runs.log")
 
+# Keyword status lives in keywords_monthly/queue.sqlite (script/keyword_queue.py);
+# the unprocessed/processing/processed/failed.txt files are exports of it
+QUEUE = KeywordQueue("monthly")
+
 # Config
 GEO = "LK"
 START_DATE = "2015-01-01"
@@ -36,109 +43,342 @@ TIMEFRAME = f"{START_DATE} {END_DATE}"
 
 TZ = 330  # Sri Lanka +5:30
 MAX_RETRIES = 5
-INITIAL_BACKOFF = 60
-
-def append_line(path, line):
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(line.strip() + "\n")
-
-def pop_first_unprocessed():
-    # Atomically read unprocessed, pop first non-empty (ignore comment lines)
-    if not os.path.exists(UNPROCESSED):
-        return None
-    with open(UNPROCESSED, "r", encoding="utf-8") as f:
-        lines = [l.rstrip("\n") for l in f.readlines()]
-    # find first valid
-    idx = None
-    for i, l in enumerate(lines):
-        s = l.strip()
-        if s and not s.startswith("#"):
-            idx = i
-            kw = s
-            break
-    if idx is None:
-        return None
-    # remove that line and write back remaining
-    remaining = lines[:idx] + lines[idx+1:]
-    with open(UNPROCESSED, "w", encoding="utf-8") as f:
-        f.write("\n".join(remaining) + ("\n" if remaining else ""))
-    return kw
-
-def move_from_processing_to(target_file, keyword):
-    # remove keyword from processing if present
-    if os.path.exists(PROCESSING):
-        with open(PROCESSING, "r", encoding="utf-8") as f:
-            lines = [l.rstrip("\n") for l in f.readlines()]
-        lines = [l for l in lines if l.strip() != keyword]
-        with open(PROCESSING, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines) + ("\n" if lines else ""))
-    append_line(target_file, keyword)
-
-def fetch_keyword(kw):
-    pytrends = TrendReq(hl="en-US", tz=TZ)
+INITIAL_BACKOFF = 60  # first 429 backoff; doubles with each further 429 in a row
+REQUESTS_PER_MINUTE = float(os.environ.get("MONTHLY_REQUESTS_PER_MINUTE", "6"))
+
+# One controller per run: AIMD rate, 429-streak backoff, Retry-After, circuit breaker
+THROTTLE = ThrottleController(REQUESTS_PER_MINUTE, base_backoff=INITIAL_BACKOFF)
+# Responses are cached on disk (script/trends_cache.py); retries and re-runs of
+# already-fetched payloads cost no network calls
+CACHE = default_cache()
+# One JSON line per Trends request in logs/requests.jsonl (script/telemetry.py)
+REQUESTS = telemetry.RequestLog("monthly", os.path.join(LOGS_DIR, "requests.jsonl"))
+
+# Incremental refresh: a keyword that already has a raw file only fetches the last
+# INCREMENTAL_MONTHS (overlapping the file), rescales them onto it and appends the
+# new months. A poor overlap fit falls back to a full-history fetch.
+INCREMENTAL = os.environ.get("TRENDS_INCREMENTAL", "1") != "0"
+INCREMENTAL_MONTHS = 24
+
+# Batched mode: up to BATCH_SIZE keywords share one payload. Google scales a payload
+# so its loudest keyword peaks at 100, so each keyword is put back on its own 0-100
+# scale by dividing by its peak in the batch. That approximates the single-keyword
+# series: the batch values are already rounded, so a keyword peaking at p in its
+# batch can be off by up to about 50 / p + 1 points (1 in practice at MIN_BATCH_PEAK).
+# Keywords peaking lower (drowned out by louder batch members) are not taken from
+# that payload. Their peaks in it already say how loud they are relative to each
+# other, so they are regrouped with keywords of similar volume (each within
+# MIN_BATCH_PEAK% of its group's loudest) and fetched together again, filled up with
+# whatever else is left. Every payload settles at least its loudest keyword.
+BATCH_SIZE = 5
+MIN_BATCH_PEAK = 80
+
+# Worker mode (--worker): keep claiming batches under a lease until the wall-clock
+# budget is spent. Several workers can drain the queue side by side, optionally
+# split with --shard i/N; a dead worker's keywords come back once their lease expires.
+# Set TRENDS_FAKE_BACKEND=1 to run against script/fake_trends.py instead of Google.
+LEASE_MINUTES = 30
+BUDGET_MINUTES = 300
+FAKE_BACKEND = os.environ.get("TRENDS_FAKE_BACKEND", "") not in ("", "0")
+# TRENDS_BASE_URL=http://127.0.0.1:8765/trends sends pytrends to script/mock_trends_server.py
+if os.environ.get("TRENDS_BASE_URL"):
+    from mock_trends_server import point_pytrends
+    point_pytrends(os.environ["TRENDS_BASE_URL"])
+
+def safe_name(kw):
+    return kw.replace(" ", "_").replace("/", "_")
+
+def _clean(df):
+    if "isPartial" in df.columns:
+        df = df.drop(columns=["isPartial"])
+    return df
+
+def request_interest(pytrends, kw_list, label, timeframe=TIMEFRAME):
+    """One interest_over_time call for kw_list with retries. Returns (df, status).
+
+    Raises CircuitOpen when THROTTLE decides the run should stop and CacheMiss
+    in replay-only cache mode."""
     for attempt in range(1, MAX_RETRIES + 1):
+        pytrends.build_payload(kw_list, cat=0, timeframe=timeframe, geo=GEO, gprop="")
+        if not pytrends.needs_network():
+            span = REQUESTS.span(label, timeframe, attempt, cached=True)
+            df = pytrends.interest_over_time()
+            span.ok(df)
+            return (None, "empty") if df is None or df.empty else (_clean(df), "ok")
+        THROTTLE.before_request()
+        span = REQUESTS.span(label, timeframe, attempt)
         try:
-            pytrends.build_payload([kw], cat=0, timeframe=TIMEFRAME, geo=GEO, gprop="")
             df = pytrends.interest_over_time()
-            if df is None or df.empty:
-                return None, "empty"
-            if "isPartial" in df.columns:
-                df = df.drop(columns=["isPartial"])
-            # rename column to safe name
-            safe_name = kw.replace(" ", "_").replace("/", "_")
-            df = df.rename(columns={kw: safe_name})
-            return df, "ok"
+        except CacheMiss:
+            raise
         except Exception as e:
-            # log and retry with exponential backoff
+            # log and retry with 429-aware backoff (on a fresh session after a 429)
             err = str(e)
+            pytrends.reset(e)
+            THROTTLE.record_failure(e)
+            if THROTTLE.tripped:
+                span.failed(e)
+                raise CircuitOpen(err)
             # If last attempt, return failure
             if attempt == MAX_RETRIES:
+                span.failed(e)
                 return None, f"error_final: {err}"
             # Backoff
-            backoff = INITIAL_BACKOFF * (2 ** (attempt - 1))
-            log(f"Attempt {attempt} failed for '{kw}': {err}. Backing off {backoff}s")
+            backoff = THROTTLE.backoff_for(e)
+            span.failed(e, backoff)
+            log(f"Attempt {attempt} failed for '{label}': {err}. Backing off {backoff:.0f}s")
             time.sleep(backoff)
+            continue
+        span.ok(df)
+        THROTTLE.record_success()
+        if df is None or df.empty:
+            return None, "empty"
+        return _clean(df), "ok"
     return None, "unknown"
 
+def make_trendreq(user_agent=None):
+    if FAKE_BACKEND:
+        from fake_trends import FakeTrendReq
+        return FakeTrendReq(hl="en-US", tz=TZ)
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    return TrendReq(hl="en-US", tz=TZ, requests_args=telemetry.requests_args({"headers": headers}))
+
+# warm sessions for the whole process, retired after a 429 (script/sessions.py)
+SESSIONS = SessionPool(make_trendreq)
+
+def new_client():
+    return CachedTrendReq(SESSIONS, CACHE, TZ)
+
+def fetch_keyword(kw, pytrends=None):
+    pytrends = pytrends or new_client()
+    df, status = request_interest(pytrends, [kw], kw)
+    if df is None:
+        return None, status
+    # rename column to safe name
+    df = df.rename(columns={kw: safe_name(kw)})
+    return df, "ok"
+
+def to_own_scale(series):
+    """Rescale a batch column so its peak is 100, rounded like a single-keyword payload."""
+    peak = series.max()
+    return (series.astype(float) * (100.0 / peak)).round().astype(int)
+
+def similar_volume_groups(peaks):
+    """Split {kw: peak in a shared payload} into groups of keywords loud enough next
+    to each other that each one peaks at MIN_BATCH_PEAK or more in its group's payload.
+    Keywords with no data in the payload (peak 0) end up in a group of their own."""
+    groups = []
+    for kw in sorted(peaks, key=lambda k: -peaks[k]):
+        if groups and peaks[kw] * 100 >= MIN_BATCH_PEAK * peaks[groups[-1][0]]:
+            groups[-1].append(kw)
+        else:
+            groups.append([kw])
+    return groups
+
+def fetch_batch(kws, results=None):
+    """Fetch up to BATCH_SIZE keywords in as few payloads as their volumes allow.
+
+    Returns {kw: (df, status)} with each keyword on its own 0-100 scale (see
+    MIN_BATCH_PEAK for how close that is to fetch_keyword's frame). Keywords
+    drowned out by louder batch members go into the next payload, next to the
+    ones of similar volume and any other keyword still left; each payload
+    settles at least its loudest keyword, so this never takes more requests
+    than fetching one by one. Entries are added to `results` as they complete,
+    so a CircuitOpen raised mid-batch keeps what was already fetched."""
+    results = {} if results is None else results
+    pytrends = new_client()
+    # groups of keywords still to fetch, each loudest first and of similar volume
+    pending = [[kw] for kw in kws[:BATCH_SIZE]]
+    while pending:
+        group = []
+        while pending and len(group) < BATCH_SIZE:
+            take = pending[0][:BATCH_SIZE - len(group)]
+            group += take
+            pending[0] = pending[0][len(take):]
+            if not pending[0]:
+                pending.pop(0)
+        if len(group) == 1:
+            results[group[0]] = fetch_keyword(group[0], pytrends)
+            continue
+        df, status = request_interest(pytrends, group, ", ".join(group))
+        if df is None:
+            for kw in group:
+                # nothing came back for the whole batch; let each keyword speak for itself
+                results[kw] = fetch_keyword(kw, pytrends) if status == "empty" else (None, status)
+            continue
+        quiet = {}
+        for kw in group:
+            raw_peak = df[kw].max() if kw in df.columns else 0
+            if raw_peak < MIN_BATCH_PEAK:
+                quiet[kw] = raw_peak
+            else:
+                results[kw] = (to_own_scale(df[kw]).to_frame(safe_name(kw)), "ok")
+        if len(quiet) == len(group):
+            # no keyword stood out (all-zero payload): asking again would change nothing
+            for kw in group:
+                results[kw] = fetch_keyword(kw, pytrends)
+            continue
+        if quiet:
+            regrouped = similar_volume_groups(quiet)
+            log(f"Batch peaks {quiet} below {MIN_BATCH_PEAK}; refetching as {regrouped}")
+            pending = regrouped + pending
+    return results
+
+def latest_raw_file(kw):
+    return Manifest.shared("monthly").latest_file(kw)
+
+def refresh_keyword(kw, existing):
+    """Append the months missing from `existing` (a raw CSV path) for kw.
+
+    Returns (df, status) like fetch_keyword, with status "up_to_date" when
+    nothing new is available yet."""
+    old = pd.read_csv(existing, index_col=0, parse_dates=True).iloc[:, 0]
+    end = pd.Timestamp(END_DATE)
+    last = old.index.max()
+    if last >= end.replace(day=1):
+        return old.to_frame(safe_name(kw)), "up_to_date"
+    start = min(end - pd.DateOffset(months=INCREMENTAL_MONTHS), last - pd.DateOffset(months=6))
+    start = max(start, pd.Timestamp(START_DATE))
+    timeframe = f"{start:%Y-%m-%d} {END_DATE}"
+    df, status = request_interest(new_client(), [kw], kw, timeframe)
+    if df is None:
+        return None, status
+    new = df[kw]
+    if len(new) > 1 and (new.index[1] - new.index[0]).days < 28:
+        new = weekly_to_monthly(new)
+    spliced, err = splice(old, new)
+    if spliced is None:
+        log(f"Incremental fit for '{kw}' too poor (error {err:.2f}); refetching full history")
+        return None, "poor_fit"
+    peak = spliced.max()
+    if peak > 100:
+        spliced = spliced * (100.0 / peak)
+    out = spliced.round().astype(int).to_frame(safe_name(kw))
+    out.index.name = old.index.name
+    log(f"Incremental '{kw}': +{len(out) - len(old)} months (fit error {err:.2f})")
+    return out, "ok"
+
 def log(msg):
     ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
     print(msg)
     with open(RUN_LOG, "a", encoding="utf-8") as f:
         f.write(f"{ts} - {msg}\n")
 
-def main():
+def save_result(kw, df, status, ts):
+    if status == "up_to_date":
+        log(f"Already up to date: {kw}")
+        QUEUE.complete(kw)
+    elif df is not None and status == "ok":
+        outfile = os.path.join(DATA_DIR, f"{safe_name(kw)}_{ts}.csv")
+        df.to_csv(outfile)
+        Manifest.shared("monthly").record(kw, outfile)
+        log(f"Saved file: {outfile}")
+        QUEUE.complete(kw)
+        # add run summary
+        log(f"SUCCESS: {kw}")
+    else:
+        # failure or empty
+        reason = status
+        log(f"FAILED for {kw}: {reason}")
+        QUEUE.fail(kw, reason)
+
+def process_keywords(kws):
+    """Fetch and save a claimed batch. Returns False if the run should stop
+    (circuit breaker open, or a cache miss in replay-only mode)."""
+    for kw in kws:
+        log(f"Selected keyword: {kw}")
+
+    # keywords with history are refreshed incrementally; a poor fit falls through
+    # to the full fetch below
+    results = {}
+    existing = {kw: latest_raw_file(kw) for kw in kws} if INCREMENTAL else {}
+    # fetch: single-keyword payload unless batching is on and there is company
+    batchable = [kw for kw in kws if not existing.get(kw)]
+    stopped = False
+    try:
+        with profiling.span("fetch"):
+            for kw in kws:
+                if existing.get(kw):
+                    df, status = refresh_keyword(kw, existing[kw])
+                    if status != "poor_fit" and status != "empty":
+                        results[kw] = (df, status)
+            if BATCH_SIZE > 1 and len(batchable) > 1:
+                fetch_batch(batchable, results)
+            for kw in kws:
+                if kw not in results:
+                    results[kw] = fetch_keyword(kw)
+    except (CircuitOpen, CacheMiss) as e:
+        log(f"Stopping early ({type(e).__name__}: {e})")
+        stopped = True
+        # keep what was already fetched, hand the rest back to the queue
+        for kw in reversed(kws):
+            if kw not in results:
+                QUEUE.requeue(kw)
+                log(f"Re-queued: {kw}")
+        kws = [kw for kw in kws if kw in results]
+    ts = datetime.utcnow().strftime("%Y%m%d_%H%M")
+    with profiling.span("save"):
+        for kw in kws:
+            df, status = results[kw]
+            save_result(kw, df, status, ts)
+    return not stopped
+
+def run_worker(shard=None, lease_minutes=LEASE_MINUTES, budget_minutes=BUDGET_MINUTES, max_keywords=None):
+    """Claim and process batches until the queue (or shard) is empty, the budget is
+    spent or max_keywords have been claimed. Returns the number of keywords claimed."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.time() + budget_minutes * 60
+    done = 0
+    log(f"Worker {worker} started (shard {shard}, lease {lease_minutes:g} min, budget {budget_minutes:.0f} min)")
+    while time.time() < deadline:
+        n = max(BATCH_SIZE, 1)
+        if max_keywords is not None:
+            n = min(n, max_keywords - done)
+            if n <= 0:
+                break
+        with profiling.span("pop"):
+            kws = QUEUE.claim(n, lease=lease_minutes * 60, shard=shard, worker=worker)
+        if not kws:
+            log("No unprocessed keywords left for this worker.")
+            break
+        done += len(kws)
+        with QUEUE.keep_alive(kws, lease_minutes * 60, worker):
+            if not process_keywords(kws):
+                break
+    else:
+        log("Wall-clock budget spent.")
+    log(f"Worker {worker} finished after {done} keywords; {SESSIONS.summary()}")
+    return done
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch monthly Google Trends keywords from the queue.")
+    ap.add_argument("--worker", action="store_true", help="keep claiming keywords until the budget is spent")
+    ap.add_argument("--shard", type=parse_shard, help="only take keywords of shard i of N (e.g. 0/4)")
+    ap.add_argument("--lease-minutes", type=float, default=LEASE_MINUTES)
+    ap.add_argument("--budget-minutes", type=float, default=BUDGET_MINUTES)
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     try:
-        kw = pop_first_unprocessed()
-        if not kw:
+        if args.worker or args.shard:
+            run_worker(args.shard, args.lease_minutes, args.budget_minutes)
+            return
+        # claim = pop from unprocessed + mark processing, in one transaction
+        with profiling.span("pop"):
+            kws = QUEUE.claim(max(BATCH_SIZE, 1))
+        if not kws:
             log("No unprocessed keywords remaining. Exiting.")
             return
-        # mark processing
-        append_line(PROCESSING, kw)
-        log(f"Selected keyword: {kw}")
-
-        # fetch
-        df, status = fetch_keyword(kw)
-        ts = datetime.utcnow().strftime("%Y%m%d_%H%M")
-        if df is not None and status == "ok":
-            safe_kw = kw.replace(" ", "_").replace("/", "_")
-            outfile = os.path.join(DATA_DIR, f"{safe_kw}_{ts}.csv")
-            df.to_csv(outfile)
-            log(f"Saved file: {outfile}")
-            move_from_processing_to(PROCESSED, kw)
-            # add run summary
-            log(f"SUCCESS: {kw}")
-        else:
-            # failure or empty
-            reason = status
-            log(f"FAILED for {kw}: {reason}")
-            move_from_processing_to(FAILED, kw)
+        process_keywords(kws)
     except Exception as e:
         log("Unexpected exception: " + repr(e))
         traceback.print_exc()
     finally:
         # finishing
+        QUEUE.export_txt()
         log("Run finished.\n")
 
 if __name__ == "__main__":
+    profiling.setup("fetch_one_keyword", "monthly")
     main()
-
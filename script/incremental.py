@@ -0,0 +1,56 @@
+# script/incremental.py
+# Helpers for "append new periods only" refreshes.
+# A short trailing window that overlaps an existing series is scaled onto it with the
+# same median-ratio rule stitch_windows uses; a poor overlap fit means the caller
+# should fall back to a full-history fetch.
+
+import numpy as np
+import pandas as pd
+
+MIN_OVERLAP = 6        # periods both series must share
+MAX_FIT_ERROR = 0.15   # mean abs error of the scaled overlap, relative to the old mean
+
+def overlap_fit(old, new, min_overlap=MIN_OVERLAP):
+    """Scale factor for `new` onto `old` and the relative error of that fit.
+
+    Returns (None, inf) when the overlap is too short or `new` has no volume there."""
+    both = pd.concat([old, new], axis=1, join="inner").dropna()
+    if len(both) < min_overlap:
+        return None, np.inf
+    o, n = both.iloc[:, 0].astype(float), both.iloc[:, 1].astype(float)
+    if n.median() <= 0:
+        return None, np.inf
+    scale = o.median() / n.median()
+    err = (o - n * scale).abs().mean() / max(o.mean(), 1e-9)
+    return scale, err
+
+def splice(old, new, min_overlap=MIN_OVERLAP, max_error=MAX_FIT_ERROR):
+    """Append the periods of `new` after old's last date, scaled onto old.
+
+    Both are Series on the same resolution. Returns (series, fit_error), with
+    series None when the overlap fit is poor."""
+    scale, err = overlap_fit(old.dropna(), new, min_overlap)
+    if scale is None or err > max_error:
+        return None, err
+    tail = new[new.index > old.index.max()].dropna() * scale
+    return pd.concat([old, tail]).sort_index(), err
+
+def splice_trailing(series, window, min_overlap=MIN_OVERLAP, max_error=MAX_FIT_ERROR):
+    """splice() for a trailing window fetched after `series` was saved: the last
+    stored period may have been partial then, so the window replaces it.
+
+    The weekly fetcher and script_weekly/restitch_weekly.py both use this, so a
+    restitch reproduces what the fetcher wrote."""
+    return splice(series.iloc[:-1], window.astype(float), min_overlap, max_error)
+
+def weekly_to_monthly(series):
+    """Average a weekly (or daily) series into month-start buckets, complete months only."""
+    series = series.dropna()
+    if len(series) < 2:
+        return series.iloc[:0]
+    monthly = series.resample("MS").mean()
+    last = series.index.max()
+    step = pd.Series(series.index).diff().median()
+    if (last + step).month == last.month:
+        monthly = monthly.iloc[:-1]  # the last month is not fully covered yet
+    return monthly
@@ -0,0 +1,194 @@
+# script/incremental_merge.py
+# Incremental wide merge: only re-read the raw files whose content hash changed since
+# the last merge and patch their columns in. The merged CSV itself is never parsed:
+# the unchanged columns come from the binary copy every merge keeps next to it
+# (script/columnar_store.py, which stores values losslessly), and the CSV is written
+# from that plus the changed columns.
+# The merge state (input hashes, date ranges, dtypes, index, output hash) sits next to
+# the output as <output>.state.json. Anything unexpected (no state, output edited by
+# hand, a stale or missing store, a keyword whose date range shrank) falls back to a
+# full rebuild, so the result always matches what a full pd.concat of the inputs would
+# produce. Very wide merges go through script/streaming_merge.py.
+
+import json, os
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+from manifest import file_sha256
+import columnar_store, streaming_merge, profiling
+
+def _state_path(out_path):
+    return os.path.splitext(out_path)[0] + ".state.json"
+
+def load_state(out_path):
+    path = _state_path(out_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_state(out_path, inputs, order, index=None):
+    state = {"output_sha256": file_sha256(out_path), "columns": order, "inputs": inputs}
+    if index is not None:
+        state["index"] = index
+    tmp = _state_path(out_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, _state_path(out_path))
+
+def clear_state(out_path):
+    # called when the merged output is removed; its columnar store goes with it
+    if os.path.exists(_state_path(out_path)):
+        os.remove(_state_path(out_path))
+    columnar_store.remove(out_path)
+
+def _covers(new, old):
+    # the new version of a column still spans every date of the old one
+    return (new.get("start") or "") <= (old.get("start") or "") \
+        and (new.get("end") or "") >= (old.get("end") or "") \
+        and new.get("rows", 0) >= old.get("rows", 0)
+
+def _inputs(columns):
+    order = [name for name, _, _ in columns]
+    return order, {name: {k: info.get(k) for k in ("sha256", "start", "end", "rows")}
+                   for name, _, info in columns}
+
+def _index_state(index):
+    # what the patch needs to rebuild the index from the store's datetime64[D] dates
+    return {"name": index.name, "dates_only": bool((index == index.normalize()).all())}
+
+def _write(merged, out_path):
+    tmp = out_path + ".tmp"
+    merged.to_csv(tmp)
+    os.replace(tmp, out_path)
+
+def concat_columns(columns, read_column, order, inputs):
+    """Full in-memory merge (every column plus the concatenated copy held at once).
+    Unreadable columns are dropped from order/inputs. Returns the frame or None."""
+    dfs = []
+    for name, path, _ in columns:
+        df = read_column(name, path)
+        if df is None:
+            order.remove(name)
+            inputs.pop(name)
+        else:
+            inputs[name]["integer"] = is_integer_dtype(df[name].dtype)
+            dfs.append(df)
+    if not dfs:
+        return None
+    merged = pd.concat(dfs, axis=1)
+    merged = merged[~merged.index.duplicated(keep="last")]
+    merged.sort_index(inplace=True)
+    return merged
+
+def patch_columns(columns, read_column, state, changed, order, inputs, out_path):
+    """The merged frame rebuilt from the columnar store with the `changed` columns
+    re-read, without parsing the merged CSV. Returns None when the store can't stand
+    in for the CSV (stale, or the state predates what the patch needs)."""
+    index = state.get("index") or {}
+    old_inputs = state.get("inputs", {})
+    if not index.get("dates_only") or not columnar_store.is_current(out_path, state["output_sha256"]):
+        return None
+    if any("integer" not in old_inputs.get(n, {}) for n in order if n not in changed):
+        return None
+    store = columnar_store.open_store(out_path)
+    if store.keywords != state.get("columns"):
+        return None
+    fresh = {}
+    for name, path, _ in columns:
+        if name not in changed:
+            inputs[name]["integer"] = old_inputs[name]["integer"]
+            continue
+        s = streaming_merge._column(read_column, name, path)
+        if s is None:
+            if name in old_inputs:
+                return None  # its dates may leave the index; only a rebuild knows
+            order.remove(name)
+            inputs.pop(name)
+            continue
+        stamps = pd.DatetimeIndex(s.index)
+        # pd.concat keeps the index name only while every input agrees on it
+        if s.index.name != index["name"] or not (stamps == stamps.normalize()).all():
+            return None
+        fresh[name] = (stamps.as_unit("ns").asi8, pd.to_numeric(s, errors="coerce").to_numpy(dtype=float))
+        inputs[name]["integer"] = is_integer_dtype(s.dtype)
+    dates = store.dates.astype("datetime64[ns]").view("i8")
+    axis = dates
+    for stamps, _ in fresh.values():
+        axis = np.union1d(axis, stamps)
+    block = np.full((len(axis), len(order)), np.nan)
+    at = np.searchsorted(axis, dates)
+    for j, name in enumerate(order):
+        if name in fresh:
+            stamps, values = fresh[name]
+            block[np.searchsorted(axis, stamps), j] = values
+        else:
+            row = store.rows[name]
+            block[at, j] = np.where(store.mask[row], store.values[row], np.nan)
+    # an integer column stays integer only if it covers every date, as with pd.concat
+    is_int = np.array([inputs[n]["integer"] for n in order], dtype=bool) & ~np.isnan(block).any(axis=0)
+    return streaming_merge._frame(block, pd.DatetimeIndex(axis.view("datetime64[ns]"), name=index["name"]),
+                                  order, is_int)
+
+def merge_columns(columns, out_path, read_column, chunk_columns=None):
+    with profiling.span("merge"):
+        return _merge_columns(columns, out_path, read_column, chunk_columns)
+
+def _merge_columns(columns, out_path, read_column, chunk_columns=None):
+    """Write the wide merge of `columns` to out_path, touching as little as possible.
+
+    columns: ordered list of (column name, file path, manifest entry).
+    read_column(name, path) returns a one-column DataFrame named `name`, or None
+    to skip an unreadable file. Merges of more than chunk_columns columns
+    (MERGE_CHUNK_COLUMNS) are rebuilt with the constant-memory streaming merge
+    instead of being patched or concatenated in memory.
+    Returns "unchanged", "patched", "rebuilt", "streamed" or "empty"."""
+    chunk_columns = chunk_columns or streaming_merge.CHUNK_COLUMNS
+    order, inputs = _inputs(columns)
+    state = load_state(out_path)
+    usable = (
+        state is not None
+        and os.path.exists(out_path)
+        and state.get("output_sha256") == file_sha256(out_path)
+    )
+    if usable:
+        old_inputs = state.get("inputs", {})
+        changed = [n for n in order if old_inputs.get(n, {}).get("sha256") != inputs[n]["sha256"]]
+        removed = [n for n in old_inputs if n not in inputs]
+        if not changed and not removed and state.get("columns") == order:
+            if not columnar_store.is_current(out_path, state["output_sha256"]):
+                columnar_store.write_from_csv(out_path)
+            return "unchanged"
+        usable = all(n not in old_inputs or _covers(inputs[n], old_inputs[n]) for n in changed) and not removed
+
+    if len(columns) > chunk_columns:
+        # patching would hold every column in memory; stream a rebuild instead
+        written = streaming_merge.stream_merge(columns, out_path, read_column, chunk_columns)
+        if not written:
+            return "empty"
+        for name in [n for n in order if n not in written]:
+            order.remove(name)
+            inputs.pop(name)
+        save_state(out_path, inputs, order)
+        return "streamed"
+
+    with profiling.span("parse"):
+        merged = None
+        if usable:
+            merged = patch_columns(columns, read_column, state, changed, order, inputs, out_path)
+            status = "patched"
+        if merged is None:
+            order, inputs = _inputs(columns)  # the patch may have dropped some
+            merged = concat_columns(columns, read_column, order, inputs)
+            if merged is None:
+                return "empty"
+            status = "rebuilt"
+    with profiling.span("write"):
+        _write(merged, out_path)
+        save_state(out_path, inputs, order, _index_state(merged.index))
+        columnar_store.write(merged, out_path)
+    return status
@@ -0,0 +1,448 @@
+# script/keyword_queue.py
+# Transactional keyword queue backed by one SQLite file per pipeline.
+# Replaces read-modify-write of unprocessed/processing/processed/failed.txt:
+# - claim / complete / fail / requeue are single indexed transactions (BEGIN IMMEDIATE),
+#   so two runners can never take the same keyword or lose one
+# - per-keyword attempt counts, last error and timestamps
+# - export_txt() rewrites the four .txt files for humans (and the e-mail report)
+# - claims can carry a lease and a shard (i of N, by crc32 of the keyword); processing
+#   rows whose lease ran out (dead runner) go back to unprocessed on the next claim
+#   (or to processed, due right away, when they already have data)
+# - failures are classified (empty / throttled / malformed / network / error) and get a
+#   retry time from RETRY_POLICY: transient classes come back within hours, keywords
+#   Google has no volume for are a negative cache entry re-probed after weeks; failed
+#   rows whose retry time has passed go back to unprocessed on the next claim
+# - claims go by priority (highest first), then queue order; processed keywords are
+#   claimed again for a refresh once their due time has passed. Both are set by
+#   script/scheduler.py; a failed refresh leaves the keyword processed (its data stays)
+# The first open imports the existing .txt files, keeping unprocessed order. queue.sqlite
+# is not committed: CI restores it from the Actions cache, and a missing one is rebuilt
+# from the .txt exports (retry times and failure classes then start over).
+#
+# Usage: python script/keyword_queue.py export [monthly|weekly|daily|regional]
+#        python script/keyword_queue.py failures [monthly|weekly|daily|regional]
+
+import os, re, sqlite3, sys, threading, time, zlib
+from datetime import datetime
+from contextlib import contextmanager
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+STATUSES = ("unprocessed", "processing", "processed", "failed")
+DEFAULT_LEASE = 6 * 3600  # processing rows without a lease (older runs) expire after this
+
+# failure class -> (first retry delay, longest delay) in seconds; the delay doubles with
+# each further failure of the same class in a row. "empty" is the negative cache: Google
+# has too little volume for the keyword, so it is only re-probed rarely (and cheaply,
+# see the weekly fetcher). Failed rows from before classification ("unknown") are
+# re-probed on the next claim.
+DAY = 86400
+NEGATIVE_TTL = float(os.environ.get("NEGATIVE_TTL_DAYS", "30")) * DAY
+RETRY_POLICY = {
+    "network": (900, DAY / 2),
+    "malformed": (1800, DAY),
+    "throttled": (3600, DAY),
+    "error": (6 * 3600, 7 * DAY),
+    "empty": (NEGATIVE_TTL, 6 * NEGATIVE_TTL),
+    "unknown": (0, 0),
+}
+TRANSIENT = ("network", "malformed", "throttled")
+
+# (class, pattern) checked in order against the failure reason / exception text
+_CLASSIFY = (
+    ("throttled", re.compile(r"429|too many requests|rate limit|circuit", re.I)),
+    ("empty", re.compile(r"^empty|no data|no volume", re.I)),
+    ("malformed", re.compile(r"json|expecting value|unterminated|decode|malformed|did not return", re.I)),
+    ("network", re.compile(r"connection|timed? ?out|timeout|name resolution|temporarily|reset by peer|"
+                           r"remote end closed|max retries|ssl|\b5\d\d\b", re.I)),
+)
+
+# pipeline -> (keyword dir, master file name)
+PIPELINES = {
+    "monthly": (os.path.join(ROOT, "keywords_monthly"), "all_keywords.txt"),
+    "weekly": (os.path.join(ROOT, "keywords_weekly"), "master_keywords.txt"),
+    "daily": (os.path.join(ROOT, "keywords_daily"), "master_keywords.txt"),
+    # (keyword x province) jobs fanned out from the monthly and weekly lists, see
+    # script_regional/fetch_regional.py
+    "regional": (os.path.join(ROOT, "keywords_regional"), None),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keywords (
+    keyword     TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    claimed_at  REAL,
+    lease_until REAL,
+    worker      TEXT,
+    shard_key   INTEGER,
+    failure_class TEXT,
+    failures    INTEGER NOT NULL DEFAULT 0,
+    retry_at    REAL,
+    priority    REAL NOT NULL DEFAULT 0,
+    due_at      REAL,
+    has_data    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS keywords_status_position ON keywords (status, position);
+"""
+
+# columns added after the first schema; ALTERed into older queue files on open
+MIGRATIONS = (("lease_until", "REAL"), ("worker", "TEXT"), ("shard_key", "INTEGER"),
+              ("failure_class", "TEXT"), ("failures", "INTEGER NOT NULL DEFAULT 0"), ("retry_at", "REAL"),
+              ("priority", "REAL NOT NULL DEFAULT 0"), ("due_at", "REAL"), ("has_data", "INTEGER NOT NULL DEFAULT 0"))
+
+def failure_class(reason):
+    """Class of a failure reason or exception: empty, throttled, malformed, network or error."""
+    text = f"{type(reason).__name__}: {reason}" if isinstance(reason, BaseException) else str(reason or "")
+    for cls, rx in _CLASSIFY:
+        if rx.search(text):
+            return cls
+    return "error"
+
+def retry_delay(cls, failures):
+    """Seconds until a keyword failed `failures` times in a row with `cls` is retried."""
+    first, longest = RETRY_POLICY.get(cls, RETRY_POLICY["error"])
+    return min(first * 2 ** max(failures - 1, 0), longest)
+
+def shard_key(keyword):
+    return zlib.crc32(keyword.encode("utf-8"))
+
+def parse_shard(text):
+    """'i/N' -> (i, N)."""
+    i, n = (int(x) for x in text.split("/"))
+    if not 0 <= i < n:
+        raise ValueError(f"shard {text}: need 0 <= i < N")
+    return i, n
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [l.strip() for l in f if l.strip() and not l.strip().startswith("#")]
+
+class KeywordQueue:
+    def __init__(self, pipeline, db_path=None):
+        self.pipeline = pipeline
+        self.keydir = PIPELINES[pipeline][0]
+        self.db_path = db_path or os.path.join(self.keydir, "queue.sqlite")
+        fresh = not os.path.exists(self.db_path)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        if fresh:
+            self.import_txt()
+        # also classifies imported failed rows, so they get a retry time
+        self._migrate()
+
+    def _migrate(self):
+        have = {row[1] for row in self.conn.execute("PRAGMA table_info(keywords)")}
+        for name, kind in MIGRATIONS:
+            if name not in have:
+                self.conn.execute(f"ALTER TABLE keywords ADD COLUMN {name} {kind}")
+        if "has_data" not in have:
+            self.conn.execute("UPDATE keywords SET has_data = 1 WHERE status = 'processed'")
+        missing = self.conn.execute("SELECT keyword FROM keywords WHERE shard_key IS NULL").fetchall()
+        if missing:
+            self.conn.executemany("UPDATE keywords SET shard_key = ? WHERE keyword = ?",
+                                  [(shard_key(kw), kw) for (kw,) in missing])
+        # failed rows from before classification: class from the stored error, or
+        # "unknown" (re-probed on the next claim)
+        unclassified = self.conn.execute(
+            "SELECT keyword, last_error, updated_at FROM keywords "
+            "WHERE status = 'failed' AND failure_class IS NULL").fetchall()
+        if unclassified:
+            rows = []
+            for kw, error, updated in unclassified:
+                cls = failure_class(error) if error else "unknown"
+                rows.append((cls, updated + retry_delay(cls, 1), kw))
+            self.conn.executemany(
+                "UPDATE keywords SET failure_class = ?, failures = 1, retry_at = ? WHERE keyword = ?", rows)
+
+    def txt_path(self, status):
+        return os.path.join(self.keydir, f"{status}.txt")
+
+    # ----------------- transactions -----------------
+    def _tx(self, fn):
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(cur)
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            return result
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def import_txt(self):
+        """Load the existing status files (processing wins over the others, as in the sync scripts)."""
+        def run(cur):
+            now = time.time()
+            for status in ("processed", "failed", "unprocessed", "processing"):
+                for i, kw in enumerate(_read_lines(self.txt_path(status))):
+                    cur.execute(
+                        "INSERT INTO keywords (keyword, status, position, created_at, updated_at, shard_key, has_data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(keyword) DO UPDATE SET "
+                        "status = excluded.status, position = excluded.position, "
+                        "has_data = has_data OR excluded.has_data",
+                        (kw, status, i, now, now, shard_key(kw), status == "processed"),
+                    )
+        self._tx(run)
+
+    def _reclaim(self, cur, now):
+        # like requeue(): a keyword that already has data goes back to processed, due now
+        return cur.execute(
+            "UPDATE keywords SET status = CASE WHEN has_data THEN 'processed' ELSE 'unprocessed' END, "
+            "due_at = CASE WHEN has_data THEN ? ELSE due_at END, lease_until = NULL, worker = NULL, "
+            "updated_at = ? WHERE status = 'processing' AND "
+            "COALESCE(lease_until, claimed_at + ?, 0) < ?", (now, now, DEFAULT_LEASE, now)).rowcount
+
+    def reclaim_expired(self):
+        """Return processing keywords whose lease ran out to unprocessed (to processed,
+        due for a refresh, if they already have data). Returns the count."""
+        return self._tx(lambda cur: self._reclaim(cur, time.time()))
+
+    def _release(self, cur, now):
+        # failed rows due for a retry: transient failures to the front of the queue,
+        # negative-cache re-probes to the back
+        due = cur.execute(
+            "SELECT keyword, failure_class FROM keywords WHERE status = 'failed' "
+            "AND retry_at IS NOT NULL AND retry_at <= ? ORDER BY retry_at", (now,)).fetchall()
+        if not due:
+            return 0
+        lo, hi = cur.execute("SELECT COALESCE(MIN(position), 0), COALESCE(MAX(position), 0) FROM keywords").fetchone()
+        for kw, cls in due:
+            if cls in TRANSIENT:
+                lo -= 1
+                pos = lo
+            else:
+                hi += 1
+                pos = hi
+            cur.execute(
+                "UPDATE keywords SET status = 'unprocessed', position = ?, updated_at = ? WHERE keyword = ?",
+                (pos, now, kw))
+        return len(due)
+
+    def release_due(self):
+        """Return failed keywords whose retry time has passed to unprocessed. Returns the count."""
+        return self._tx(lambda cur: self._release(cur, time.time()))
+
+    def claim(self, n=1, lease=None, shard=None, worker=None):
+        """Atomically move up to n keywords to processing: unprocessed ones and
+        processed ones due for a refresh, highest priority first, then queue order.
+
+        lease: seconds the claim is valid for (DEFAULT_LEASE when None); once it
+        runs out the keyword can be claimed again. shard: (i, N) to only take
+        keywords with crc32(keyword) % N == i."""
+        def run(cur):
+            now = time.time()
+            self._reclaim(cur, now)
+            self._release(cur, now)
+            sql = ("SELECT keyword FROM keywords WHERE (status = 'unprocessed' "
+                   "OR (status = 'processed' AND due_at <= ?))")
+            args = [now]
+            if shard is not None:
+                sql += " AND shard_key % ? = ?"
+                args += [shard[1], shard[0]]
+            rows = cur.execute(sql + " ORDER BY priority DESC, position LIMIT ?", args + [n]).fetchall()
+            until = now + (lease or DEFAULT_LEASE)
+            for (kw,) in rows:
+                cur.execute(
+                    "UPDATE keywords SET status = 'processing', attempts = attempts + 1, "
+                    "claimed_at = ?, lease_until = ?, worker = ?, updated_at = ? WHERE keyword = ?",
+                    (now, until, worker, now, kw))
+            return [kw for (kw,) in rows]
+        return self._tx(run)
+
+    def renew(self, keywords, lease, worker=None):
+        """Extend the lease of keywords this worker is still processing."""
+        def run(cur):
+            until = time.time() + lease
+            cur.executemany(
+                "UPDATE keywords SET lease_until = ? WHERE keyword = ? AND status = 'processing' "
+                "AND worker IS ?", [(until, kw, worker) for kw in keywords])
+        self._tx(run)
+
+    @contextmanager
+    def keep_alive(self, keywords, lease, worker=None):
+        """Renew the lease of `keywords` every lease/3 seconds while the block runs,
+        so slow keywords (long 429 backoffs) are not reclaimed by another worker."""
+        stop = threading.Event()
+        def beat():
+            while not stop.wait(lease / 3):
+                self.renew(keywords, lease, worker)
+        t = threading.Thread(target=beat, daemon=True)
+        t.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            t.join()
+
+    def _finish(self, keyword, status, error=None, cls=None):
+        def run(cur):
+            now = time.time()
+            failures, retry_at, due_at, final = 0, None, None, status
+            if cls is not None:
+                row = cur.execute("SELECT failure_class, failures, has_data FROM keywords WHERE keyword = ?",
+                                  (keyword,)).fetchone()
+                failures = (row[1] or 0) + 1 if row and row[0] == cls else 1
+                retry_at = now + retry_delay(cls, failures)
+                if row and row[2]:
+                    # a refresh that failed: the keyword keeps its data and is due again at retry_at
+                    final, due_at = "processed", retry_at
+            cur.execute(
+                "UPDATE keywords SET status = ?, last_error = ?, failure_class = ?, failures = ?, retry_at = ?, "
+                "due_at = ?, has_data = has_data OR ?, claimed_at = NULL, lease_until = NULL, worker = NULL, "
+                "updated_at = ? WHERE keyword = ?",
+                (final, error, cls, failures, retry_at, due_at, status == "processed", now, keyword))
+        self._tx(run)
+
+    def complete(self, keyword):
+        self._finish(keyword, "processed")
+
+    def fail(self, keyword, error=None, cls=None):
+        """Mark failed and schedule the retry for its class (derived from error unless given).
+        A keyword that already has data stays processed and is refreshed at the retry time."""
+        self._finish(keyword, "failed", error, cls or failure_class(error))
+
+    def requeue(self, keyword, front=True):
+        """Back to unprocessed, at the front of the queue by default. A keyword that
+        already has data goes back to processed, due for a refresh right away."""
+        def run(cur):
+            now = time.time()
+            if front:
+                (pos,) = cur.execute("SELECT COALESCE(MIN(position), 0) - 1 FROM keywords").fetchone()
+            else:
+                (pos,) = cur.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM keywords").fetchone()
+            cur.execute(
+                "UPDATE keywords SET status = CASE WHEN has_data THEN 'processed' ELSE 'unprocessed' END, "
+                "due_at = CASE WHEN has_data THEN ? ELSE due_at END, position = ?, claimed_at = NULL, "
+                "lease_until = NULL, worker = NULL, updated_at = ? WHERE keyword = ?", (now, pos, now, keyword))
+        self._tx(run)
+
+    def schedule(self, rows):
+        """Store [(keyword, priority, due_at)] computed by script/scheduler.py."""
+        def run(cur):
+            cur.executemany("UPDATE keywords SET priority = ?, due_at = ? WHERE keyword = ?",
+                            [(prio, due, kw) for kw, prio, due in rows])
+        self._tx(run)
+
+    def add(self, keywords):
+        """Append new keywords to the end of the queue; known keywords are left alone."""
+        def run(cur):
+            (pos,) = cur.execute("SELECT COALESCE(MAX(position), 0) FROM keywords").fetchone()
+            now = time.time()
+            added = []
+            for kw in keywords:
+                pos += 1
+                cur.execute(
+                    "INSERT OR IGNORE INTO keywords (keyword, status, position, created_at, updated_at, shard_key) "
+                    "VALUES (?, 'unprocessed', ?, ?, ?, ?)", (kw, pos, now, now, shard_key(kw)))
+                if cur.rowcount:
+                    added.append(kw)
+            return added
+        return self._tx(run)
+
+    def remove(self, keywords):
+        def run(cur):
+            cur.executemany("DELETE FROM keywords WHERE keyword = ?", [(kw,) for kw in keywords])
+        self._tx(run)
+
+    # ----------------- reads -----------------
+    def keywords(self, status):
+        return [kw for (kw,) in self._query(
+            "SELECT keyword FROM keywords WHERE status = ? ORDER BY position, keyword", (status,))]
+
+    def with_data(self):
+        """Keywords whose data belongs in the merged dataset: processed ones, and ones
+        with data that are being refreshed (processing) or wait for a retry."""
+        return [kw for (kw,) in self._query(
+            "SELECT keyword FROM keywords WHERE has_data OR status = 'processed' ORDER BY position, keyword")]
+
+    def status_of(self, keyword):
+        row = self._query("SELECT status FROM keywords WHERE keyword = ?", (keyword,))
+        return row[0][0] if row else None
+
+    def info(self, keyword):
+        rows = self._query(
+            "SELECT keyword, status, attempts, last_error, created_at, updated_at, claimed_at, "
+            "lease_until, worker, failure_class, failures, retry_at, priority, due_at, has_data "
+            "FROM keywords WHERE keyword = ?", (keyword,))
+        if not rows:
+            return None
+        keys = ("keyword", "status", "attempts", "last_error", "created_at", "updated_at", "claimed_at",
+                "lease_until", "worker", "failure_class", "failures", "retry_at", "priority", "due_at", "has_data")
+        return dict(zip(keys, rows[0]))
+
+    def last_failure(self, keyword):
+        """Failure class of the keyword's last failed attempt (None if it has not failed since it last succeeded)."""
+        row = self._query("SELECT failure_class FROM keywords WHERE keyword = ?", (keyword,))
+        return row[0][0] if row else None
+
+    def failures(self):
+        """[(keyword, class, failures in a row, retry_at, last_error)] of failed keywords, next retry first."""
+        return self._query(
+            "SELECT keyword, failure_class, failures, retry_at, last_error FROM keywords "
+            "WHERE status = 'failed' ORDER BY retry_at IS NULL, retry_at, keyword")
+
+    def schedule_inputs(self):
+        """[(keyword, status, failure class, failures in a row, retry_at)] of all keywords, queue order."""
+        return self._query(
+            "SELECT keyword, status, failure_class, failures, retry_at FROM keywords ORDER BY position, keyword")
+
+    def due(self, now=None):
+        """Keywords a claim would take now, in claim order: [(keyword, status, priority)]."""
+        return self._query(
+            "SELECT keyword, status, priority FROM keywords WHERE status = 'unprocessed' "
+            "OR (status = 'processed' AND due_at <= ?) ORDER BY priority DESC, position",
+            (time.time() if now is None else now,))
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(dict(self._query("SELECT status, COUNT(*) FROM keywords GROUP BY status")))
+        return counts
+
+    def export_txt(self):
+        """Rewrite unprocessed/processing/processed/failed.txt from the queue."""
+        for status in STATUSES:
+            path = self.txt_path(status)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for kw in self.keywords(status):
+                    f.write(kw + "\n")
+            os.replace(tmp, path)
+
+    def close(self):
+        self.conn.close()
+
+def print_failures(q):
+    rows = q.failures()
+    print(f"{q.pipeline}: {len(rows)} failed")
+    for kw, cls, n, retry_at, error in rows:
+        when = datetime.utcfromtimestamp(retry_at).strftime("%Y-%m-%d %H:%M UTC") if retry_at else "never"
+        print(f"  {kw:<40} {cls or '-':<10} x{n or 0:<3} retry {when}  {error or ''}")
+
+def main(argv):
+    if not argv or argv[0] not in ("export", "failures"):
+        print("Usage: python script/keyword_queue.py export|failures [monthly|weekly|daily|regional]")
+        sys.exit(1)
+    for pipeline in (argv[1:] or list(PIPELINES)):
+        q = KeywordQueue(pipeline)
+        if argv[0] == "failures":
+            print_failures(q)
+            continue
+        q.export_txt()
+        print(f"{pipeline}: {q.counts()}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
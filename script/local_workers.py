@@ -0,0 +1,110 @@
+# script/local_workers.py
+# Run several fetcher workers side by side against the offline fake backend
+# (script/fake_trends.py) to exercise leases, shards and reclaiming locally.
+# Everything happens in a scratch copy of the repo, so the real queue and data are
+# never touched. At the end the queue of the copy is checked: every keyword should
+# be processed exactly once, except keywords of a killed worker, which are claimed
+# again after their lease expired.
+#
+# Usage: python script/local_workers.py [monthly|weekly|daily] [--workers 4] [--shards]
+#            [--keywords 40] [--budget-minutes 5] [--lease-minutes 0.5]
+#            [--kill-after 10] [--latency 0.2] [--throttle 0.0] [--keep]
+
+import argparse, os, shutil, signal, subprocess, sys, tempfile, time
+from keyword_queue import KeywordQueue, PIPELINES
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FETCHERS = {
+    "monthly": os.path.join("script", "fetch_one_keyword.py"),
+    "weekly": os.path.join("script_weekly", "fetch_weekly_one_keyword.py"),
+    "daily": os.path.join("script_daily", "fetch_daily_one_keyword.py"),
+}
+SKIP = shutil.ignore_patterns(".git", "cache", "__pycache__")
+
+def scratch_copy():
+    base = tempfile.mkdtemp(prefix="trends_workers_")
+    repo = os.path.join(base, "repo")
+    shutil.copytree(ROOT, repo, ignore=SKIP)
+    return base, repo
+
+def open_queue(repo, pipeline):
+    keydir = os.path.relpath(PIPELINES[pipeline][0], ROOT)
+    # only db-level calls below: export_txt() would write to this checkout
+    return KeywordQueue(pipeline, db_path=os.path.join(repo, keydir, "queue.sqlite"))
+
+def seed(queue, n):
+    """Replace the queue of the copy with n synthetic keywords."""
+    queue.remove([kw for status in ("unprocessed", "processing", "processed", "failed")
+                  for kw in queue.keywords(status)])
+    queue.add([f"local worker test {i:04d}" for i in range(n)])
+
+def main():
+    ap = argparse.ArgumentParser(description="Run fetcher workers against the fake backend in a scratch copy.")
+    ap.add_argument("pipeline", nargs="?", default="weekly", choices=list(FETCHERS))
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--shards", action="store_true", help="give worker i --shard i/N instead of lease-only")
+    ap.add_argument("--keywords", type=int, default=40, help="synthetic keywords (0 = keep the real queue)")
+    ap.add_argument("--budget-minutes", type=float, default=5)
+    ap.add_argument("--lease-minutes", type=float, default=0.5)
+    ap.add_argument("--kill-after", type=float, default=None, help="SIGKILL worker 0 after this many seconds")
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--throttle", type=float, default=0.0)
+    ap.add_argument("--keep", action="store_true", help="keep the scratch copy")
+    args = ap.parse_args()
+
+    base, repo = scratch_copy()
+    queue = open_queue(repo, args.pipeline)
+    if args.keywords:
+        seed(queue, args.keywords)
+    print(f"Scratch copy: {repo}")
+    print(f"Queue before: {queue.counts()}")
+
+    env = dict(os.environ,
+               TRENDS_FAKE_BACKEND="1",
+               TRENDS_FAKE_LATENCY=str(args.latency),
+               TRENDS_FAKE_THROTTLE=str(args.throttle),
+               TRENDS_CACHE_DIR=os.path.join(base, "cache"),
+               WEEKLY_REQUESTS_PER_MINUTE="600",
+               DAILY_REQUESTS_PER_MINUTE="600")
+    def start(i, shard=None):
+        cmd = [sys.executable, FETCHERS[args.pipeline], "--worker",
+               "--budget-minutes", str(args.budget_minutes), "--lease-minutes", str(args.lease_minutes)]
+        if shard:
+            cmd += ["--shard", shard]
+        out = open(os.path.join(base, f"worker{i}.log"), "w")
+        return subprocess.Popen(cmd, cwd=repo, env=env, stdout=out, stderr=subprocess.STDOUT), out
+
+    procs = [start(i, f"{i}/{args.workers}" if args.shards else None) for i in range(args.workers)]
+
+    started = time.time()
+    killed = False
+    while any(p.poll() is None for p, _ in procs):
+        if args.kill_after is not None and not killed and time.time() - started >= args.kill_after:
+            procs[0][0].send_signal(signal.SIGKILL)
+            killed = True
+            print(f"Killed worker 0 after {args.kill_after:.0f}s")
+        time.sleep(0.5)
+    if killed and queue.counts()["processing"]:
+        # the killed worker's keywords are stuck until their lease runs out; a late
+        # worker then picks them up (in shard mode it has to take the same shard)
+        print(f"Waiting {args.lease_minutes * 60:.0f}s for the killed worker's lease to expire")
+        time.sleep(args.lease_minutes * 60 + 1)
+        procs.append(start(len(procs), f"0/{args.workers}" if args.shards else None))
+        procs[-1][0].wait()
+    for _, out in procs:
+        out.close()
+    elapsed = time.time() - started
+
+    counts = queue.counts()
+    rows = [queue.info(kw) for status in counts for kw in queue.keywords(status)]
+    repeated = [r["keyword"] for r in rows if r["attempts"] > 1]
+    print(f"Queue after {elapsed:.0f}s: {counts}")
+    print(f"Claimed more than once: {len(repeated)}" + (f" ({', '.join(repeated[:5])} ...)" if repeated else ""))
+    for i, (p, _) in enumerate(procs):
+        print(f"worker {i}: exit {p.returncode}, log {os.path.join(base, f'worker{i}.log')}")
+    queue.close()
+    if not args.keep:
+        shutil.rmtree(base, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
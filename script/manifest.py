@@ -0,0 +1,255 @@
+# script/manifest.py
+# Keyword manifest: keyword -> stable id -> latest raw file, row count, date range, content hash.
+# Fetchers record every successful save; merge and sync scripts look keywords up here
+# instead of globbing the raw directory and guessing keywords with rsplit("_", 2).
+# "updated" is when the keyword's file was fetched (script/scheduler.py ages keywords by it).
+# Saves merge this process's changes into the file on disk under a lock, so one
+# loaded manifest can be kept for a whole batch while other workers write too.
+#
+# Usage: python script/manifest.py rebuild-manifest [monthly|weekly|daily|all]
+
+import hashlib, json, os, re, sys, threading
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+try:
+    import fcntl
+except ImportError:  # Windows: saves are still atomic, just not serialized between processes
+    fcntl = None
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# dataset -> (manifest path, raw dir, keyword files, filename regex for a safe name)
+DATASETS = {
+    "monthly": (
+        os.path.join(ROOT, "data_monthly", "manifest.json"),
+        os.path.join(ROOT, "data_monthly", "raw"),
+        [os.path.join(ROOT, "keywords_monthly", n) for n in
+         ("all_keywords.txt", "unprocessed.txt", "processing.txt", "processed.txt", "failed.txt")],
+        lambda safe: re.compile(rf"^{re.escape(safe)}_\d{{8}}_\d{{4}}\.csv$"),
+    ),
+    "weekly": (
+        os.path.join(ROOT, "data_weekly", "manifest.json"),
+        os.path.join(ROOT, "data_weekly", "raw_weekly"),
+        [os.path.join(ROOT, "keywords_weekly", n) for n in
+         ("master_keywords.txt", "unprocessed.txt", "processing.txt", "processed.txt", "failed.txt")],
+        lambda safe: re.compile(rf"^{re.escape(safe)}_weekly\.csv$"),
+    ),
+    "daily": (
+        os.path.join(ROOT, "data_daily", "manifest.json"),
+        os.path.join(ROOT, "data_daily", "store"),
+        [os.path.join(ROOT, "keywords_daily", n) for n in
+         ("master_keywords.txt", "unprocessed.txt", "processing.txt", "processed.txt", "failed.txt")],
+        lambda safe: re.compile(rf"^{re.escape(safe)}\.npz$"),
+    ),
+}
+
+def keyword_id(keyword):
+    """Stable id for a keyword, independent of how its file name was sanitized."""
+    return hashlib.sha1(keyword.strip().encode("utf-8")).hexdigest()[:12]
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def describe_file(path):
+    """Row count, date range and content hash of a raw CSV (or daily store file)."""
+    if path.endswith(".npz"):
+        from daily_store import describe
+        return describe(path)
+    df = pd.read_csv(path, index_col=0, parse_dates=True)
+    idx = df.index.dropna()
+    return {
+        "rows": int(len(df)),
+        "start": idx.min().strftime("%Y-%m-%d") if len(idx) else None,
+        "end": idx.max().strftime("%Y-%m-%d") if len(idx) else None,
+        "sha256": file_sha256(path),
+    }
+
+STAMP = "%Y-%m-%dT%H:%M:%SZ"
+_NAME_STAMP = re.compile(r"_(\d{8})_(\d{4})\.csv$")
+
+def name_timestamp(path):
+    """Fetch time from a timestamped raw file name (<safe>_YYYYmmdd_HHMM.csv), or None."""
+    m = _NAME_STAMP.search(os.path.basename(path))
+    if not m:
+        return None
+    return datetime.strptime("".join(m.groups()), "%Y%m%d%H%M").strftime(STAMP)
+
+def data_timestamp(info):
+    """Earliest time a file with this row count and date range can have been fetched:
+    one period past its last date (the last period was complete by then)."""
+    if not info.get("end"):
+        return None
+    start, end = pd.Timestamp(info["start"]), pd.Timestamp(info["end"])
+    step = (end - start) / (info["rows"] - 1) if info.get("rows", 0) > 1 else pd.Timedelta(0)
+    return (end + step).strftime(STAMP)
+
+def _read_entries(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("keywords", {})
+
+@contextmanager
+def _file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+_SHARED = {}
+
+class Manifest:
+    def __init__(self, dataset, load=True):
+        self.dataset = dataset
+        self.path = DATASETS[dataset][0]
+        self.entries = _read_entries(self.path) if load else {}
+        self._changed = {}  # keyword -> entry, or None if removed; not saved yet
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, dataset):
+        """Load the manifest, rebuilding it from the raw directory if it does not exist yet."""
+        if not os.path.exists(DATASETS[dataset][0]):
+            return rebuild(dataset)
+        return cls(dataset)
+
+    @classmethod
+    def shared(cls, dataset):
+        """One manifest per process and dataset, for runs that handle many keywords."""
+        if dataset not in _SHARED:
+            _SHARED[dataset] = cls.load(dataset)
+        return _SHARED[dataset]
+
+    def save(self, replace=False):
+        """Write the manifest. Unless replace is set, entries written by other
+        processes since it was loaded are kept and picked up."""
+        with _file_lock(self.path):
+            if replace:
+                entries = dict(self.entries)
+            else:
+                entries = _read_entries(self.path)
+                for kw, entry in self._changed.items():
+                    if entry is None:
+                        entries.pop(kw, None)
+                    else:
+                        entries[kw] = entry
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dataset": self.dataset, "keywords": entries}, f, indent=1, sort_keys=True)
+                f.write("\n")
+            os.replace(tmp, self.path)
+        self.entries = entries
+        self._changed = {}
+
+    def record(self, keyword, path, save=True, updated=None):
+        """Register `path` as the latest file for keyword, fetched at `updated`
+        (a STAMP string; now by default, for a file that was just written)."""
+        info = describe_file(path)
+        info.update({
+            "id": keyword_id(keyword),
+            "file": os.path.relpath(path, ROOT).replace(os.sep, "/"),
+            "updated": updated or datetime.utcnow().strftime(STAMP),
+        })
+        with self._lock:
+            self.entries[keyword] = info
+            self._changed[keyword] = info
+            if save:
+                self.save()
+        return info
+
+    def remove(self, keyword, save=True):
+        with self._lock:
+            removed = self.entries.pop(keyword, None)
+            self._changed[keyword] = None
+            if removed is not None and save:
+                self.save()
+        return removed
+
+    def annotate(self, keyword, **fields):
+        """Add fields to a keyword's entry (saved with the next save())."""
+        with self._lock:
+            entry = dict(self.entries[keyword], **fields)
+            self.entries[keyword] = entry
+            self._changed[keyword] = entry
+
+    def get(self, keyword):
+        return self.entries.get(keyword)
+
+    def latest_file(self, keyword):
+        """Absolute path of the latest file for keyword, or None."""
+        entry = self.entries.get(keyword)
+        if not entry:
+            return None
+        path = os.path.join(ROOT, entry["file"])
+        return path if os.path.exists(path) else None
+
+def _read_keywords(paths):
+    seen = []
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                s = line.strip()
+                if s and not s.startswith("#") and s not in seen:
+                    seen.append(s)
+    return seen
+
+def _candidate_safe_names(keyword):
+    # the fetchers have used both sanitizers over time
+    simple = keyword.replace(" ", "_").replace("/", "_")
+    strict = "".join(c if c.isalnum() or c in (" ", "_") else "_" for c in keyword).strip().replace(" ", "_")
+    return [simple] if simple == strict else [simple, strict]
+
+def rebuild(dataset):
+    """Recreate the manifest from the raw directory and the keyword status files.
+
+    Files are matched to keywords by exact name pattern, so a keyword whose safe
+    name is a prefix of another keyword's no longer picks up the wrong file.
+    "updated" is the fetch time in the file name, or for files without one the
+    earliest time their data can have been fetched (see data_timestamp), never
+    the time of the rebuild."""
+    _, raw_dir, keyword_files, pattern_for = DATASETS[dataset]
+    names = sorted(os.listdir(raw_dir)) if os.path.isdir(raw_dir) else []
+    m = Manifest(dataset, load=False)
+    claimed = set()
+    for kw in _read_keywords(keyword_files):
+        matches = []
+        for safe in _candidate_safe_names(kw):
+            rx = pattern_for(safe)
+            matches.extend(n for n in names if rx.match(n))
+        if matches:
+            latest = max(matches)  # timestamped names sort chronologically
+            stamp = name_timestamp(latest)
+            info = m.record(kw, os.path.join(raw_dir, latest), save=False, updated=stamp)
+            if stamp is None:
+                info["updated"] = data_timestamp(info) or info["updated"]
+            claimed.update(matches)
+    for n in names:
+        if n.endswith(".csv") and n not in claimed:
+            print(f"Unmatched file in {raw_dir}: {n}")
+    m.save(replace=True)
+    print(f"Rebuilt {dataset} manifest: {len(m.entries)} keywords -> {m.path}")
+    return m
+
+def main(argv):
+    if not argv or argv[0] != "rebuild-manifest":
+        print("Usage: python script/manifest.py rebuild-manifest [monthly|weekly|daily|all]")
+        sys.exit(1)
+    which = argv[1] if len(argv) > 1 else "all"
+    for dataset in (DATASETS if which == "all" else [which]):
+        rebuild(dataset)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
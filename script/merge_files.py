@@ -1,64 +1,57 @@
 # script/merge_files.py
-import os, glob, pandas as pd
+import os, pandas as pd
+from manifest import Manifest
+from incremental_merge import merge_columns, clear_state
+from keyword_queue import KeywordQueue
+import profiling
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA_DIR = os.path.join(ROOT, "data_monthly", "raw")
 MERGED_DIR = os.path.join(ROOT, "data_monthly", "merged")
 KEYDIR = os.path.join(ROOT, "keywords_monthly")
-PROCED = os.path.join(KEYDIR, "processed.txt")
 os.makedirs(MERGED_DIR, exist_ok=True)
 
-def read_lines(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return [l.strip() for l in f if l.strip()]
-
-def latest_file_per_keyword():
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    latest = {}
-    for f in files:
-        name = os.path.basename(f)
-        parts = name.rsplit("_", 2)
-        if len(parts) >= 2:
-            kw = parts[0]
-        else:
-            kw = name.replace(".csv", "")
-        mtime = os.path.getmtime(f)
-        if kw not in latest or mtime > latest[kw][0]:
-            latest[kw] = (mtime, f)
-    return {k: v[1] for k, v in latest.items()}
+def read_column(name, fpath):
+    try:
+        df = pd.read_csv(fpath, index_col=0, parse_dates=True)
+    except Exception as e:
+        print("Skipping", fpath, e)
+        return None
+    df.columns = [name]
+    return df
 
 def main():
-    processed = read_lines(PROCED)
+    processed = KeywordQueue("monthly").with_data()
     if not processed:
         print("No processed keywords. Removing merged dataset if exists.")
         mainf = os.path.join(MERGED_DIR, "main_dataset.csv")
         if os.path.exists(mainf):
             os.remove(mainf)
+            clear_state(mainf)
             print("Removed merged dataset.")
         return
-    files_map = latest_file_per_keyword()
-    dfs = []
+    manifest = Manifest.load("monthly")
+    columns = []
     for pk in processed:
         safe_pk = pk.replace(" ", "_").replace("/", "_")
-        fpath = files_map.get(safe_pk)
+        fpath = manifest.latest_file(pk)
         if fpath:
-            try:
-                df = pd.read_csv(fpath, index_col=0, parse_dates=True)
-                df.columns = [safe_pk]
-                dfs.append(df)
-            except Exception as e:
-                print("Skipping", fpath, e)
+            columns.append((safe_pk, fpath, manifest.get(pk)))
         else:
             print("No raw file found for processed keyword:", pk)
-    if not dfs:
+    if not columns:
         print("No dfs to merge.")
         return
-    merged = pd.concat(dfs, axis=1)
-    merged.sort_index(inplace=True)
+    # only files whose content hash changed since the last merge are re-read
     out = os.path.join(MERGED_DIR, "main_dataset.csv")
-    merged.to_csv(out)
-    print("Merged saved to:", out)
+    status = merge_columns(columns, out, read_column)
+    if status == "unchanged":
+        print("Merged dataset unchanged:", out)
+    elif status == "empty":
+        print("No dfs to merge.")
+    else:
+        print(f"Merged saved to ({status}):", out)
 
 if __name__ == "__main__":
-    main()
+    profiling.setup("merge_files", "monthly")
+    with profiling.span("merge"):
+        main()
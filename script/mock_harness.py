@@ -0,0 +1,97 @@
+# script/mock_harness.py
+# End-to-end load test of the fetchers against script/mock_trends_server.py: real
+# pytrends, real HTTP, no Google. For each pipeline a scratch copy of the repo gets
+# N synthetic keywords, the fetcher runs in worker mode with TRENDS_BASE_URL pointing
+# at the mock server, and the run is summed up: wall time, keywords per minute, queue
+# outcome and what the server saw (requests, 429s, empty and malformed payloads).
+# Use it to compare throughput and backoff settings with the same fault mix, e.g.
+#   python script/mock_harness.py --keywords 20 --throttle-rate 0.1 --requests-per-minute 120
+#
+# Usage: python script/mock_harness.py [monthly weekly daily ...] [--keywords 10] [--workers 1]
+#            [--requests-per-minute 120] [--budget-minutes 10] [--json] [--keep]
+#            [--latency 0.05] [--throttle-rate 0] [--empty-rate 0] [--malformed-rate 0]
+#            [--retry-after 1] [--seed 0]
+
+import argparse, json, os, shutil, subprocess, sys, time
+from local_workers import FETCHERS, scratch_copy, open_queue, seed
+from mock_trends_server import MockTrendsServer, add_fault_args, faults_from_args
+
+def run_pipeline(pipeline, server, args):
+    base, repo = scratch_copy()
+    queue = open_queue(repo, pipeline)
+    seed(queue, args.keywords)
+    rpm = str(args.requests_per_minute)
+    env = dict(os.environ,
+               TRENDS_BASE_URL=server.url,
+               TRENDS_CACHE_DIR=os.path.join(base, "cache"),
+               MONTHLY_REQUESTS_PER_MINUTE=rpm,
+               WEEKLY_REQUESTS_PER_MINUTE=rpm,
+               DAILY_REQUESTS_PER_MINUTE=rpm)
+    env.pop("TRENDS_FAKE_BACKEND", None)
+    server.faults.reset()
+    started = time.time()
+    procs = []
+    for i in range(args.workers):
+        out = open(os.path.join(base, f"{pipeline}{i}.log"), "w")
+        cmd = [sys.executable, FETCHERS[pipeline], "--worker", "--budget-minutes", str(args.budget_minutes)]
+        procs.append((subprocess.Popen(cmd, cwd=repo, env=env, stdout=out, stderr=subprocess.STDOUT), out))
+    for p, out in procs:
+        p.wait()
+        out.close()
+    elapsed = time.time() - started
+    counts = queue.counts()
+    queue.close()
+    stats = server.stats()
+    api = stats["explore"] + stats["multiline"]
+    result = {
+        "pipeline": pipeline,
+        "keywords": args.keywords,
+        "seconds": round(elapsed, 2),
+        "keywords_per_minute": round(counts["processed"] / elapsed * 60, 2) if elapsed else None,
+        "api_requests_per_second": round(api / elapsed, 2) if elapsed else None,
+        "queue": counts,
+        "server": stats,
+        "exit_codes": [p.returncode for p, _ in procs],
+        "logs": [os.path.join(base, f"{pipeline}{i}.log") for i in range(args.workers)],
+    }
+    if not args.keep:
+        shutil.rmtree(base, ignore_errors=True)
+        result.pop("logs")
+    return result
+
+def report(r):
+    s, q = r["server"], r["queue"]
+    print(f"== {r['pipeline']}: {r['keywords']} keywords in {r['seconds']:.1f}s "
+          f"({r['keywords_per_minute']} keywords/min, {r['api_requests_per_second']} API requests/s)")
+    print(f"   queue: {q['processed']} processed, {q['failed']} failed, "
+          f"{q['unprocessed']} unprocessed, {q['processing']} processing")
+    print(f"   server: {s['explore']} explore + {s['multiline']} multiline, {s['cookie']} cookie bootstraps; "
+          f"served {s['throttled']} x 429, {s['empty']} empty, {s['malformed']} malformed, "
+          f"{s['bad_request']} bad requests")
+    print(f"   exit codes: {r['exit_codes']}" + (f", logs: {' '.join(r['logs'])}" if "logs" in r else ""))
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the fetchers end to end against the mock Trends server.")
+    ap.add_argument("pipelines", nargs="*", choices=list(FETCHERS), default=["monthly", "weekly"])
+    ap.add_argument("--keywords", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--requests-per-minute", type=float, default=120)
+    ap.add_argument("--budget-minutes", type=float, default=10)
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch copies and logs")
+    add_fault_args(ap)
+    args = ap.parse_args()
+
+    results = []
+    with MockTrendsServer(**faults_from_args(args)) as server:
+        if not args.json:
+            print(f"Mock server {server.url}: {json.dumps(faults_from_args(args))}")
+        for pipeline in args.pipelines:
+            results.append(run_pipeline(pipeline, server, args))
+            if not args.json:
+                report(results[-1])
+    if args.json:
+        print(json.dumps(results, indent=1))
+
+if __name__ == "__main__":
+    main()
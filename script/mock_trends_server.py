@@ -0,0 +1,244 @@
+# script/mock_trends_server.py
+# Local HTTP stand-in for the Google Trends endpoints pytrends.TrendReq talks to,
+# for load-testing the fetchers without touching Google:
+# - GET  /trends/explore/                      cookie bootstrap (sets an NID cookie)
+# - POST /trends/api/explore                   widget tokens for a payload
+# - GET  /trends/api/widgetdata/multiline      interest over time
+# - GET  /__stats                              request / fault counters as JSON
+# Series are the deterministic ones of script/fake_trends.py (any keyword, any custom
+# "YYYY-mm-dd YYYY-mm-dd" timeframe, Google's daily/weekly/monthly resolution by span),
+# so overlapping windows agree and stitching can be checked.
+# Faults are drawn per API request from a seeded RNG: latency, 429s (with an optional
+# Retry-After), empty timelines and malformed (truncated) JSON payloads.
+#
+# Point a fetcher at it with TRENDS_BASE_URL=http://127.0.0.1:<port>/trends (every
+# fetcher calls point_pytrends() when that is set); script/mock_harness.py runs the
+# fetchers end to end against it.
+#
+# Usage: python script/mock_trends_server.py [--port 8765] [--latency 0.05] [--throttle-rate 0.1]
+#            [--empty-rate 0] [--malformed-rate 0] [--retry-after 1] [--seed 0]
+
+import argparse, json, random, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+from fake_trends import interest_frame, parse_timeframe
+
+# pytrends strips these many characters before json.loads (see TrendReq._tokens and
+# TrendReq.interest_over_time); Google sends the same anti-XSSI prefixes
+EXPLORE_PREFIX = ")]}'"
+WIDGET_PREFIX = ")]}',"
+
+def point_pytrends(base_url):
+    """Send every pytrends.TrendReq request of this process to base_url
+    (e.g. http://127.0.0.1:8765/trends) instead of https://trends.google.com/trends."""
+    import pytrends.request as request
+    base = base_url.rstrip("/")
+    request.BASE_TRENDS_URL = base  # read by GetGoogleCookie at call time
+    request.TrendReq.GENERAL_URL = f"{base}/api/explore"
+    request.TrendReq.INTEREST_OVER_TIME_URL = f"{base}/api/widgetdata/multiline"
+
+def _token(widget_request):
+    return f"mock{zlib.crc32(json.dumps(widget_request, sort_keys=True).encode()):08x}"
+
+def timeline(kw_list, timeframe, geos=None):
+    """timelineData entries as the multiline endpoint returns them (one value per
+    comparison item; geos when one keyword is compared across regions)."""
+    df = interest_frame(kw_list, timeframe, geos).drop(columns="isPartial")
+    points = []
+    for date, row in df.iterrows():
+        values = [int(v) for v in row]
+        points.append({
+            "time": str(int(pd.Timestamp(date).timestamp())),
+            "formattedTime": f"{date:%b %-d, %Y}",
+            "value": values,
+            "hasData": [v > 0 for v in values],
+            "formattedValue": [str(v) for v in values],
+        })
+    return points
+
+class Faults:
+    """Fault configuration plus counters, shared by all handler threads."""
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, empty_rate=0.0, malformed_rate=0.0,
+                 retry_after=None, seed=0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.empty_rate = empty_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self.counts = {k: 0 for k in ("cookie", "explore", "multiline", "throttled", "empty",
+                                      "malformed", "ok", "bad_request")}
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def roll(self):
+        with self._lock:
+            return self._rng.random()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    faults = None  # set on a per-server subclass
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json; charset=UTF-8", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _params(self):
+        url = urlsplit(self.path)
+        return url.path.rstrip("/"), {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    def _fault(self):
+        """Apply latency and maybe answer with a 429. Returns the roll for the
+        caller's own faults, or None if the request was already answered."""
+        if self.faults.latency:
+            time.sleep(self.faults.latency)
+        roll = self.faults.roll()
+        if roll < self.faults.throttle_rate:
+            self.faults.count("throttled")
+            headers = {"Retry-After": str(self.faults.retry_after)} if self.faults.retry_after else {}
+            self._send(429, "<html>Too Many Requests</html>", "text/html; charset=UTF-8", headers)
+            return None
+        return roll - self.faults.throttle_rate
+
+    def _bad(self, msg):
+        self.faults.count("bad_request")
+        self._send(400, json.dumps({"error": msg}))
+
+    def do_GET(self):
+        path, params = self._params()
+        if path == "/__stats":
+            return self._send(200, json.dumps(self.faults.stats()))
+        if path == "/trends/explore":
+            self.faults.count("cookie")
+            n = self.faults.stats()["cookie"]
+            return self._send(200, "<html></html>", "text/html; charset=UTF-8",
+                              {"Set-Cookie": f"NID=mock-{n}; Path=/"})
+        if path != "/trends/api/widgetdata/multiline":
+            return self._send(404, json.dumps({"error": "not found"}))
+        self.faults.count("multiline")
+        roll = self._fault()
+        if roll is None:
+            return
+        try:
+            req = json.loads(params["req"])
+            if params.get("token") != _token(req):
+                return self._bad("bad token")
+            items = req["comparisonItem"]
+            kw_list = [it["keyword"] for it in items]
+            geos = [it.get("geo", "") for it in items]
+            parse_timeframe(items[0]["time"])
+        except (KeyError, ValueError, IndexError, TypeError) as e:
+            return self._bad(f"bad request: {e}")
+        if roll < self.faults.empty_rate:
+            self.faults.count("empty")
+            return self._send(200, WIDGET_PREFIX + json.dumps({"default": {"timelineData": []}}))
+        geos = geos if len(set(geos)) > 1 else None
+        body = WIDGET_PREFIX + json.dumps({"default": {"timelineData": timeline(kw_list, items[0]["time"], geos)}})
+        if roll < self.faults.empty_rate + self.faults.malformed_rate:
+            self.faults.count("malformed")
+            return self._send(200, body[: len(body) // 2])
+        self.faults.count("ok")
+        self._send(200, body)
+
+    def do_POST(self):
+        path, params = self._params()
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if path != "/trends/api/explore":
+            return self._send(404, json.dumps({"error": "not found"}))
+        self.faults.count("explore")
+        if self._fault() is None:
+            return
+        try:
+            req = json.loads(params["req"])
+            items = [{"keyword": it["keyword"], "time": it["time"], "geo": it.get("geo", "")}
+                     for it in req["comparisonItem"]]
+        except (KeyError, ValueError, TypeError) as e:
+            return self._bad(f"bad payload: {e}")
+        widget_request = {"comparisonItem": items, "tz": params.get("tz"), "hl": params.get("hl")}
+        widgets = [{"id": "TIMESERIES", "title": "Interest over time",
+                    "request": widget_request, "token": _token(widget_request)}]
+        self._send(200, EXPLORE_PREFIX + json.dumps({"widgets": widgets}))
+
+class MockTrendsServer:
+    """Threaded server on 127.0.0.1; port 0 picks a free one.
+
+        with MockTrendsServer(throttle_rate=0.1) as server:
+            env["TRENDS_BASE_URL"] = server.url
+    """
+
+    def __init__(self, port=0, **faults):
+        self.faults = Faults(**faults)
+        handler = type("MockHandler", (Handler,), {"faults": self.faults})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/trends"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        return self.faults.stats()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def add_fault_args(ap):
+    ap.add_argument("--latency", type=float, default=0.05, help="seconds added to every API request")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="share of API requests answered with 429")
+    ap.add_argument("--empty-rate", type=float, default=0.0, help="share of timelines returned empty")
+    ap.add_argument("--malformed-rate", type=float, default=0.0, help="share of timelines truncated mid-JSON")
+    ap.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429s (0 = none)")
+    ap.add_argument("--seed", type=int, default=0)
+
+def faults_from_args(args):
+    return dict(latency=args.latency, throttle_rate=args.throttle_rate, empty_rate=args.empty_rate,
+                malformed_rate=args.malformed_rate, retry_after=args.retry_after or None, seed=args.seed)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Serve synthetic Google Trends responses locally.")
+    ap.add_argument("--port", type=int, default=8765)
+    add_fault_args(ap)
+    args = ap.parse_args()
+    server = MockTrendsServer(args.port, **faults_from_args(args))
+    print(f"Mock Trends server on {server.url} (TRENDS_BASE_URL={server.url}); Ctrl-C to stop")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats()))
+        server.httpd.server_close()
@@ -0,0 +1,228 @@
+# script/profiling.py
+# Opt-in run profiling shared by the scripts in script/ and script_weekly/.
+# Turn it on with --profile on any of them (or TRENDS_PROFILE=1 in the environment):
+#   --profile                  timing spans + tracemalloc peaks (same as --profile=time,mem)
+#   --profile=time             timing spans only (no tracemalloc overhead)
+#   --profile=time,mem,cprofile  ... plus cProfile of the main thread
+# Stages are wrapped in named spans (sync, pop, fetch, stitch, save, merge, ...); nested
+# spans are reported as paths ("sync/merge/parse"), a span directly inside one of the same
+# name is folded into it. Per span: calls, wall and CPU time, and with mem the peak
+# traced memory (main thread). At exit one report per run is written next to the logs:
+#   logs/profile/<script>_<YYYYmmdd_HHMMSS>_<pid>.txt   (+ .json, + .prof with cprofile)
+# (logs_weekly/profile/ for the weekly scripts). The text report also lists startup time
+# (interpreter + imports, from the process start), the top allocation sites at the end
+# of the span with the highest memory peak, and the top cProfile functions.
+# With profiling off, span() is a no-op context manager.
+
+import atexit, cProfile, io, json, os, pstats, socket, sys, threading, time, tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from telemetry import LOG_DIRS
+
+ENV = "TRENDS_PROFILE"
+DEFAULT_MODES = ("time", "mem")
+TOP_ALLOCATIONS = 15
+TOP_FUNCTIONS = 40
+
+_run = None          # set by setup() when profiling is on
+_local = threading.local()
+_lock = threading.Lock()
+
+def parse_modes(value):
+    """'1' / '' -> time,mem; otherwise a comma list of time, mem, cprofile."""
+    if value in ("1", "true", "yes", ""):
+        return set(DEFAULT_MODES)
+    modes = {m.strip() for m in value.split(",") if m.strip()}
+    unknown = modes - {"time", "mem", "cprofile"}
+    if unknown:
+        raise ValueError(f"unknown profile mode(s): {', '.join(sorted(unknown))}")
+    return modes | {"time"}
+
+def _process_start():
+    # wall-clock start of this process (Linux), for the startup/import share
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def setup(name, pipeline="monthly", argv=None):
+    """Start profiling this run if --profile[=modes] is in argv (removed from it, so
+    the script's own argument parsing never sees it) or TRENDS_PROFILE is set.
+    Call from the script's __main__ block before main(). Returns True if on."""
+    global _run
+    argv = sys.argv if argv is None else argv
+    value = os.environ.get(ENV)
+    for arg in list(argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            value = arg.partition("=")[2] or "1"
+            argv.remove(arg)
+    if not value or value == "0" or _run is not None:
+        return _run is not None
+    modes = parse_modes(value)
+    _run = {
+        "name": name,
+        "dir": os.path.join(LOG_DIRS[pipeline], "profile"),
+        "modes": modes,
+        "started": time.time(),
+        "process_start": _process_start(),
+        "cpu0": time.process_time(),
+        "argv": list(argv),
+        "spans": {},
+        "first": {},  # path -> order of first start, to list spans as they ran
+        "top_peak": (0, None, None),  # (peak bytes, span path, snapshot)
+        "profiler": None,
+    }
+    if "mem" in modes:
+        tracemalloc.start()
+    if "cprofile" in modes:
+        _run["profiler"] = cProfile.Profile()
+        _run["profiler"].enable()
+    atexit.register(write_report)
+    return True
+
+def enabled():
+    return _run is not None
+
+@contextmanager
+def span(name):
+    """Time a stage: with profiling.span("merge"): ..."""
+    if _run is None:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack and stack[-1]["name"] == name:
+        yield  # folded into the enclosing span of the same name
+        return
+    main = threading.current_thread() is threading.main_thread()
+    mem = main and tracemalloc.is_tracing()
+    frame = {"name": name, "path": "/".join([f["path"] for f in stack[-1:]] + [name]), "peak": 0}
+    if mem:
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    with _lock:
+        _run["first"].setdefault(frame["path"], len(_run["first"]))
+    stack.append(frame)
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - t0, time.thread_time() - c0
+        stack.pop()
+        peak = None
+        if mem:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            if peak > _run["top_peak"][0] and len(stack) <= 1:
+                _run["top_peak"] = (peak, frame["path"], tracemalloc.take_snapshot())
+        _record(frame["path"], len(stack), wall, cpu, peak)
+
+def _record(path, depth, wall, cpu, peak):
+    with _lock:
+        s = _run["spans"].setdefault(path, {"depth": depth, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                            "max_wall_s": 0.0, "peak_mb": None})
+        s["calls"] += 1
+        s["wall_s"] += wall
+        s["cpu_s"] += cpu
+        s["max_wall_s"] = max(s["max_wall_s"], wall)
+        if peak is not None:
+            s["peak_mb"] = max(s["peak_mb"] or 0, peak / 2**20)
+
+def _order(first, path):
+    parts = path.split("/")
+    return [first.get("/".join(parts[:i + 1]), 0) for i in range(len(parts))]
+
+def _allocations(snapshot):
+    # module code objects loaded by imports are not interesting here
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                                       tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")])
+    stats = snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    return [{"site": f"{st.traceback[0].filename}:{st.traceback[0].lineno}",
+             "mb": st.size / 2**20, "blocks": st.count} for st in stats]
+
+def write_report():
+    """Write the run report (called at exit). Returns the .txt path."""
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return None
+    if run["profiler"] is not None:
+        run["profiler"].disable()
+    wall = time.time() - run["started"]
+    startup = run["started"] - run["process_start"] if run["process_start"] else None
+    top = sum(s["wall_s"] for p, s in run["spans"].items() if s["depth"] == 0)
+    summary = {
+        "script": run["name"],
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "argv": run["argv"],
+        "started": datetime.utcfromtimestamp(run["started"]).strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "modes": sorted(run["modes"]),
+        "startup_s": startup,
+        "wall_s": wall,
+        "cpu_s": time.process_time() - run["cpu0"],
+        "outside_spans_s": wall - top,
+        "spans": {p: run["spans"][p] for p in sorted(run["spans"], key=lambda p: _order(run["first"], p))},
+    }
+    if tracemalloc.is_tracing():
+        # peaks are reset per span, so the run peak is the largest one seen
+        summary["peak_mb"] = max([s["peak_mb"] or 0 for s in run["spans"].values()]
+                                 + [tracemalloc.get_traced_memory()[1] / 2**20])
+        peak, path, snapshot = run["top_peak"]
+        if snapshot is not None:
+            summary["peak_span"] = {"span": path, "peak_mb": peak / 2**20, "allocations": _allocations(snapshot)}
+        tracemalloc.stop()
+
+    os.makedirs(run["dir"], exist_ok=True)
+    stem = os.path.join(run["dir"], f"{run['name']}_{datetime.utcnow():%Y%m%d_%H%M%S}_{os.getpid()}")
+    functions = ""
+    if run["profiler"] is not None:
+        run["profiler"].dump_stats(stem + ".prof")
+        out = io.StringIO()
+        pstats.Stats(run["profiler"], stream=out).strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        functions = out.getvalue()
+        summary["cprofile"] = stem + ".prof"
+    with open(stem + ".json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    with open(stem + ".txt", "w", encoding="utf-8") as f:
+        f.write(format_report(summary))
+        if functions:
+            f.write(f"\n== cProfile, main thread, top {TOP_FUNCTIONS} by cumulative time ({stem}.prof)\n")
+            f.write(functions)
+    print(f"Profile report: {stem}.txt")
+    return stem + ".txt"
+
+def format_report(summary):
+    lines = [f"Profile of {summary['script']} ({' '.join(summary['argv'])}) on {summary['host']}, "
+             f"started {summary['started']}, modes {','.join(summary['modes'])}"]
+    startup = f"{summary['startup_s']:.2f}s" if summary["startup_s"] is not None else "n/a"
+    lines.append(f"wall {summary['wall_s']:.2f}s, cpu {summary['cpu_s']:.2f}s, "
+                 f"startup (interpreter + imports) {startup}, outside spans {summary['outside_spans_s']:.2f}s"
+                 + (f", traced peak {summary['peak_mb']:.1f} MiB" if "peak_mb" in summary else ""))
+    lines.append("")
+    spans = summary["spans"]
+    width = max([len(p) + 2 * s["depth"] for p, s in spans.items()] + [4])
+    lines.append(f"{'span':<{width}} {'calls':>6} {'wall s':>9} {'cpu s':>9} {'max s':>8} {'% run':>6} {'peak MiB':>9}")
+    for path in spans:
+        s = spans[path]
+        share = 100 * s["wall_s"] / summary["wall_s"] if summary["wall_s"] else 0
+        peak = f"{s['peak_mb']:.1f}" if s["peak_mb"] is not None else "-"
+        label = "  " * s["depth"] + path.rsplit("/", 1)[-1]
+        lines.append(f"{label:<{width}} {s['calls']:>6} {s['wall_s']:>9.2f} {s['cpu_s']:>9.2f} "
+                     f"{s['max_wall_s']:>8.2f} {share:>6.1f} {peak:>9}")
+    if not spans:
+        lines.append("(no spans recorded)")
+    if "peak_span" in summary:
+        p = summary["peak_span"]
+        lines.append("")
+        lines.append(f"== Live allocations after the highest-peak span '{p['span']}' ({p['peak_mb']:.1f} MiB peak)")
+        for a in p["allocations"]:
+            lines.append(f"{a['mb']:>9.2f} MiB {a['blocks']:>8} blocks  {a['site']}")
+    return "\n".join(lines) + "\n"
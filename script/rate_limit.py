@@ -0,0 +1,49 @@
+# script/rate_limit.py
+# Thread-safe token bucket shared by every concurrent Trends request in a run.
+
+import threading, time
+
+class TokenBucket:
+    """Allow `rate_per_minute` requests on average, bursting up to `capacity`.
+
+    acquire() blocks the calling thread until a token is free, so any number of
+    worker threads can share one bucket and the run as a whole never exceeds
+    the configured ceiling."""
+
+    def __init__(self, rate_per_minute, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self._rate = rate_per_minute / 60.0  # tokens per second
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate_per_minute(self):
+        return self._rate * 60.0
+
+    def set_rate(self, rate_per_minute):
+        with self._lock:
+            self._refill()
+            self._rate = max(rate_per_minute, 1e-6) / 60.0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def acquire(self):
+        """Take one token, sleeping as needed. Returns seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self._rate
+            self._sleep(wait)
+            waited += wait
@@ -0,0 +1,239 @@
+# script/regional_cube.py
+# keyword x region x date cube of provincial interest (script_regional/fetch_regional.py).
+# data_regional/cube/ holds plain .npy files that np.load memory-maps, like the
+# columnar store, so a reader only pages in the slices it asks for:
+# - dates.npy    datetime64[D], month starts (sorted)
+# - values.npy   float32, capacity x regions x dates, NaN = not fetched / no data;
+#                keyword-major, so one keyword (all regions) is one contiguous block
+# - fetched.npy  float64, capacity x regions, unix time each cell was last fetched (0 = never)
+# - cube.json    keyword dictionary (row order), regions, unit and shape
+# Rows are allocated in blocks (capacity doubles, at least MIN_CAPACITY), so a new
+# keyword is usually written in place; a new keyword past capacity or a new month
+# rewrites the cube into cube.tmp/ and swaps the directory in whole.
+# Values are on one scale per keyword: the national peak of the keyword over the
+# whole range is 100 (UNIT), so regions of one keyword compare directly.
+#
+# Usage: python script/regional_cube.py describe
+#        python script/regional_cube.py show "<keyword>" [--region LK-1] [--start 2020-01-01]
+
+import argparse, json, os, shutil, sys, warnings
+import numpy as np
+import pandas as pd
+from manifest import _file_lock
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CUBE_DIR = os.path.join(ROOT, "data_regional", "cube")
+FORMAT = 1
+MIN_CAPACITY = 64
+UNIT = "national peak = 100"
+
+# ISO 3166-2:LK provinces (Google's sub-region codes for Sri Lanka)
+REGIONS = {
+    "LK-1": "Western",
+    "LK-2": "Central",
+    "LK-3": "Southern",
+    "LK-4": "Northern",
+    "LK-5": "Eastern",
+    "LK-6": "North Western",
+    "LK-7": "North Central",
+    "LK-8": "Uva",
+    "LK-9": "Sabaragamuwa",
+}
+
+def read_meta(path=CUBE_DIR):
+    try:
+        with open(os.path.join(path, "cube.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(path, meta):
+    tmp = os.path.join(path, "cube.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp, os.path.join(path, "cube.json"))
+
+def _rewrite(path, meta, dates, capacity, old=None):
+    """Write a cube with `dates` and room for `capacity` keywords into path.tmp/, copy
+    the cells of the `old` cube over (by keyword, region and date) and swap it in."""
+    tmp, prev = path + ".tmp", path + ".old"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    regions = meta["regions"]
+    np.save(os.path.join(tmp, "dates.npy"), pd.DatetimeIndex(dates).to_numpy(dtype="datetime64[D]"))
+    values = np.lib.format.open_memmap(os.path.join(tmp, "values.npy"), mode="w+", dtype=np.float32,
+                                       shape=(capacity, len(regions), len(dates)))
+    values[:] = np.nan
+    fetched = np.lib.format.open_memmap(os.path.join(tmp, "fetched.npy"), mode="w+", dtype=np.float64,
+                                        shape=(capacity, len(regions)))
+    fetched[:] = 0
+    if old is not None:
+        # dates and regions only ever grow, so every old cell has a place in the new cube
+        r_new = [regions.index(r) for r in old.regions]
+        t_new = pd.DatetimeIndex(dates).get_indexer(pd.DatetimeIndex(old.dates))
+        for i in range(len(old.keywords)):
+            values[i][np.ix_(r_new, t_new)] = old.values[i]
+            fetched[i, r_new] = old.fetched[i]
+    values.flush()
+    fetched.flush()
+    del values, fetched
+    meta = dict(meta, format=FORMAT, capacity=capacity, shape=[capacity, len(regions), len(dates)])
+    _write_meta(tmp, meta)
+    shutil.rmtree(prev, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, prev)
+    os.replace(tmp, path)
+    shutil.rmtree(prev, ignore_errors=True)
+
+def update(results, fetched_at, path=CUBE_DIR, regions=tuple(REGIONS)):
+    """Store fetched regional series: results is {keyword: date x region DataFrame}
+    (month starts, columns = region codes, UNIT scale), fetched_at a unix time.
+    Cells of a keyword's fetched regions are replaced whole (NaN where the frame has
+    no value). Safe against concurrent workers (file lock). Returns the cube path."""
+    if not results:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _file_lock(path):
+        meta = read_meta(path)
+        if meta is None or meta.get("format") != FORMAT:
+            meta = {"keywords": [], "regions": list(regions), "unit": UNIT}
+            old = None
+        else:
+            old = RegionalCube(path)
+        known = set(meta["regions"])
+        extra = [r for frame in results.values() for r in frame.columns if r not in known]
+        meta["regions"] = meta["regions"] + list(dict.fromkeys(extra))
+        new_kws = [kw for kw in results if kw not in set(meta["keywords"])]
+        meta["keywords"] = meta["keywords"] + new_kws
+        dates = pd.DatetimeIndex(old.dates if old is not None else [])
+        for frame in results.values():
+            dates = dates.union(frame.index.normalize())
+        capacity = meta.get("capacity", 0)
+        grow = old is None or len(meta["keywords"]) > capacity or extra or len(dates) != len(old.dates)
+        if grow:
+            if len(meta["keywords"]) > capacity:
+                capacity = max(MIN_CAPACITY, capacity * 2, len(meta["keywords"]))
+            _rewrite(path, meta, dates, capacity, old)
+        elif new_kws:
+            _write_meta(path, dict(meta))
+        del old
+        # the cube now has every keyword, region and date: write the cells in place
+        rows = {kw: i for i, kw in enumerate(meta["keywords"])}
+        cols = {r: j for j, r in enumerate(meta["regions"])}
+        stamp = np.load(os.path.join(path, "dates.npy"))
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r+")
+        fetched = np.load(os.path.join(path, "fetched.npy"), mmap_mode="r+")
+        for kw, frame in results.items():
+            t = np.searchsorted(stamp, frame.index.normalize().to_numpy(dtype="datetime64[D]"))
+            for region in frame.columns:
+                block = np.full(len(stamp), np.nan, dtype=np.float32)
+                block[t] = frame[region].to_numpy(dtype=np.float32)
+                values[rows[kw], cols[region]] = block
+                fetched[rows[kw], cols[region]] = fetched_at
+        values.flush()
+        fetched.flush()
+    return path
+
+class RegionalCube:
+    """Read-only view of the cube. values and fetched are memory-mapped; only the
+    keywords, regions and dates a caller asks for are ever paged in."""
+
+    def __init__(self, path=CUBE_DIR):
+        meta = read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"No regional cube at {path}")
+        self.path = path
+        self.meta = meta
+        self.keywords = meta["keywords"]
+        self.regions = meta["regions"]
+        self.rows = {kw: i for i, kw in enumerate(self.keywords)}
+        self.cols = {r: j for j, r in enumerate(self.regions)}
+        self.dates = np.load(os.path.join(path, "dates.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        self.fetched = np.load(os.path.join(path, "fetched.npy"), mmap_mode="r")
+
+    def __contains__(self, keyword):
+        return keyword in self.rows
+
+    def date_slice(self, start=None, end=None):
+        """Slice of the date axis between start and end (inclusive)."""
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), "D"))
+        hi = len(self.dates) if end is None else np.searchsorted(
+            self.dates, np.datetime64(pd.Timestamp(end), "D"), side="right")
+        return slice(int(lo), int(hi))
+
+    def fetched_at(self, keyword, region):
+        """Unix time the keyword's region was last fetched (None if never)."""
+        if keyword not in self.rows or region not in self.cols:
+            return None
+        t = float(self.fetched[self.rows[keyword], self.cols[region]])
+        return t or None
+
+    def slice(self, keywords=None, regions=None, start=None, end=None):
+        """keywords x regions x dates float array (a copy) for a subset of the cube."""
+        rows = [self.rows[kw] for kw in (self.keywords if keywords is None else keywords)]
+        cols = [self.cols[r] for r in (self.regions if regions is None else regions)]
+        return np.asarray(self.values[np.ix_(rows, cols, np.arange(len(self.dates))[self.date_slice(start, end)])],
+                          dtype=float)
+
+    def _index(self, start, end):
+        return pd.DatetimeIndex(self.dates[self.date_slice(start, end)], name="date")
+
+    def series(self, keyword, region, start=None, end=None):
+        """One keyword in one region as a float Series (NaN = no value)."""
+        data = np.asarray(self.values[self.rows[keyword], self.cols[region], self.date_slice(start, end)], dtype=float)
+        return pd.Series(data, index=self._index(start, end), name=region)
+
+    def frame(self, keyword, regions=None, start=None, end=None):
+        """date x region DataFrame of one keyword."""
+        regions = self.regions if regions is None else list(regions)
+        data = self.slice([keyword], regions, start, end)[0]
+        return pd.DataFrame(data.T, index=self._index(start, end), columns=regions)
+
+    def region_frame(self, region, keywords=None, start=None, end=None):
+        """date x keyword DataFrame of one region."""
+        keywords = self.keywords if keywords is None else list(keywords)
+        data = self.slice(keywords, [region], start, end)[:, 0]
+        return pd.DataFrame(data.T, index=self._index(start, end), columns=keywords)
+
+    def snapshot(self, start=None, end=None, keywords=None):
+        """keyword x region DataFrame of mean interest between start and end."""
+        keywords = self.keywords if keywords is None else list(keywords)
+        data = self.slice(keywords, None, start, end)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # regions with no values stay NaN
+            means = np.nanmean(data, axis=2) if data.shape[2] else np.full(data.shape[:2], np.nan)
+        return pd.DataFrame(means, index=pd.Index(keywords, name="keyword"), columns=self.regions)
+
+def describe(path=CUBE_DIR):
+    cube = RegionalCube(path)
+    size = sum(os.path.getsize(os.path.join(cube.path, n)) for n in os.listdir(cube.path))
+    n_kw, n_dates = len(cube.keywords), len(cube.dates)
+    span = f"{cube.dates[0]} .. {cube.dates[-1]}" if n_dates else "no dates"
+    filled = int(np.count_nonzero(~np.isnan(cube.values[:n_kw]))) if n_kw else 0
+    return (f"{cube.path}: {n_kw} keywords (capacity {cube.meta['capacity']}) x {len(cube.regions)} regions x "
+            f"{n_dates} months ({span}), {filled} values, {size / 1024:.0f} KiB, unit: {cube.meta['unit']}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inspect the keyword x region x date cube.")
+    ap.add_argument("cmd", choices=("describe", "show"))
+    ap.add_argument("keyword", nargs="?")
+    ap.add_argument("--region", action="append", help="region code (repeatable; default: all)")
+    ap.add_argument("--start")
+    ap.add_argument("--end")
+    args = ap.parse_args(argv)
+    if read_meta() is None:
+        print(f"No regional cube at {CUBE_DIR}")
+        sys.exit(1)
+    if args.cmd == "describe":
+        print(describe())
+        return
+    cube = RegionalCube()
+    if not args.keyword or args.keyword not in cube:
+        ap.error(f"unknown keyword {args.keyword!r}")
+    frame = cube.frame(args.keyword, args.region, args.start, args.end)
+    print(frame.rename(columns=lambda r: f"{r} {REGIONS.get(r, '')}".strip()).round(1).to_string())
+
+if __name__ == "__main__":
+    main()
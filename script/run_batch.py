@@ -0,0 +1,76 @@
+# script/run_batch.py
+# Batch runner: one process per workflow run instead of one per keyword.
+# - syncs the master list into the queue once
+# - fetches keywords in worker mode (one throttle, one session, one loaded manifest)
+#   until --max-keywords or the --budget-minutes wall clock is used up
+# - merges once at the end and exports the queue .txt files
+# The default budget leaves room under the 6-hour GitHub Actions job limit for
+# setup, the merge and the commit step.
+# --profile (script/profiling.py) reports the sync, worker (pop/fetch/stitch/save) and
+# merge stages to logs/profile/ or logs_weekly/profile/.
+#
+# Usage: python script/run_batch.py [monthly|weekly] [--max-keywords N] [--budget-minutes M]
+#            [--shard i/N] [--no-sync] [--no-merge] [--profile[=time,mem,cprofile]]
+
+import argparse, os, sys, time, traceback
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script_weekly"))
+from keyword_queue import parse_shard
+import profiling
+
+MAX_KEYWORDS = int(os.environ.get("KEYWORDS_PER_RUN", "25"))
+BUDGET_MINUTES = float(os.environ.get("BATCH_BUDGET_MINUTES", "300"))
+
+def stages(pipeline):
+    """(sync module, fetch module, merge module) for a pipeline, imported lazily."""
+    if pipeline == "monthly":
+        import sync_master_and_cleanup as sync, fetch_one_keyword as fetch, merge_files as merge
+    else:
+        import sync_master_weekly as sync, fetch_weekly_one_keyword as fetch, merge_weekly as merge
+    return sync, fetch, merge
+
+def timed(label, fn, *args, span=None, **kwargs):
+    t0 = time.time()
+    print(f"== {label} ({datetime.utcnow():%H:%M:%S} UTC)")
+    with profiling.span(span or label):
+        result = fn(*args, **kwargs)
+    print(f"== {label} done in {time.time() - t0:.1f}s")
+    return result
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sync, fetch many keywords and merge in one process.")
+    ap.add_argument("pipeline", nargs="?", default="monthly", choices=("monthly", "weekly"))
+    ap.add_argument("--max-keywords", type=int, default=MAX_KEYWORDS)
+    ap.add_argument("--budget-minutes", type=float, default=BUDGET_MINUTES)
+    ap.add_argument("--shard", type=parse_shard)
+    ap.add_argument("--no-sync", action="store_true")
+    ap.add_argument("--no-merge", action="store_true")
+    args = ap.parse_args(argv)
+
+    t0 = time.time()
+    with profiling.span("import"):
+        sync, fetch, merge = stages(args.pipeline)
+    done = 0
+    try:
+        if not args.no_sync:
+            timed("sync", sync.main)
+        # the sync counts against the budget too
+        budget = args.budget_minutes - (time.time() - t0) / 60
+        done = timed("fetch", fetch.run_worker, shard=args.shard, budget_minutes=budget,
+                     max_keywords=args.max_keywords, span="worker")
+    except Exception as e:
+        fetch.log("Unexpected exception: " + repr(e))
+        traceback.print_exc()
+    finally:
+        fetch.QUEUE.export_txt()
+    if not args.no_merge:
+        timed("merge", merge.main)
+    elapsed = time.time() - t0
+    per_kw = f", {elapsed / done:.1f}s per keyword" if done else ""
+    fetch.log(f"Batch run finished: {done} keywords in {elapsed:.0f}s{per_kw}.\n")
+
+if __name__ == "__main__":
+    profiling.setup("run_batch", "weekly" if "weekly" in sys.argv[1:] else "monthly")
+    main()
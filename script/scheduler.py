@@ -0,0 +1,158 @@
+# script/scheduler.py
+# Refresh scheduler: which keywords the fetchers claim first, and when a processed
+# keyword is fetched again. Every keyword gets a priority from
+# - staleness: days since its latest raw file was fetched over the pipeline's refresh
+#   interval (<PIPELINE>_REFRESH_DAYS); never fetched = MAX_STALENESS. The fetch time is
+#   the timestamp in the file name where there is one (monthly), otherwise the manifest's
+#   "updated", but never later than one period past the data's last date
+# - volatility: how much the recent series moves, mean absolute step plus the shift
+#   between the halves of the last year / half year / month (monthly / weekly / daily
+#   points), relative to their mean; kept in the manifest entry so each file is read once
+# - failure history: halved for every failure in a row (keyword_queue failures column)
+#   priority = staleness * (1 + VOLATILITY_WEIGHT * volatility) * 0.5 ** failures
+# A processed keyword is due for a refresh once its priority reaches 1 (volatile series
+# sooner than flat ones, not before a failed refresh's retry time). Claims take
+# unprocessed and due keywords highest priority first, so however many keywords a run's
+# request budget covers, they are the most out of date and fastest moving ones.
+# The sync scripts (and the daily fetcher) call reschedule() before fetching. The
+# regional jobs have no manifest; script_regional/fetch_regional.py schedules them.
+#
+# Usage: python script/scheduler.py plan [monthly|weekly|daily] [--budget 20]
+#        python script/scheduler.py reschedule [monthly|weekly|daily]
+
+import argparse, os, time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from manifest import Manifest, ROOT, STAMP, name_timestamp, data_timestamp
+from keyword_queue import KeywordQueue, DAY
+
+REFRESH_DAYS = {
+    "monthly": float(os.environ.get("MONTHLY_REFRESH_DAYS", "30")),
+    "weekly": float(os.environ.get("WEEKLY_REFRESH_DAYS", "7")),
+    "daily": float(os.environ.get("DAILY_REFRESH_DAYS", "1")),
+}
+MAX_STALENESS = 8.0
+VOLATILITY_WEIGHT = float(os.environ.get("SCHEDULER_VOLATILITY_WEIGHT", "1"))
+MAX_VOLATILITY = 2.0
+FAILURE_DECAY = 0.5
+# median spacing of the series (days) -> recent points the volatility looks at
+RECENT_POINTS = ((28, 12), (7, 26), (0, 28))
+
+def volatility(series):
+    """Relative movement of the recent part of a series (0 = flat, capped at MAX_VOLATILITY)."""
+    s = pd.Series(series).dropna().astype(float)
+    if len(s) < 2:
+        return 0.0
+    spacing = float(np.median(np.diff(s.index.values).astype("timedelta64[s]").astype(float))) / DAY
+    s = s.tail(next(n for days, n in RECENT_POINTS if spacing >= days))
+    mean = s.mean()
+    if len(s) < 4 or not mean > 0:
+        return 0.0
+    half = len(s) // 2
+    step = s.diff().abs().mean() / mean
+    shift = abs(s.iloc[half:].mean() - s.iloc[:half].mean()) / mean
+    return round(min(step + shift, MAX_VOLATILITY), 4)
+
+def read_series(path):
+    if path.endswith(".npz"):
+        import daily_store
+        return daily_store.load(os.path.basename(path)[:-4], store_dir=os.path.dirname(path))
+    return pd.read_csv(path, index_col=0, parse_dates=True).iloc[:, 0]
+
+def entry_volatility(manifest, keyword):
+    """Volatility of the keyword's latest file, cached in its manifest entry (None without a file)."""
+    entry = manifest.get(keyword)
+    if not entry:
+        return None
+    if entry.get("volatility_sha256") != entry.get("sha256"):
+        path = os.path.join(ROOT, entry["file"])
+        try:
+            value = volatility(read_series(path))
+        except (OSError, ValueError, IndexError) as e:
+            print(f"Volatility of {keyword} unavailable ({path}: {e})")
+            value = 0.0
+        manifest.annotate(keyword, volatility=value, volatility_sha256=entry.get("sha256"))
+    return manifest.get(keyword)["volatility"]
+
+def _epoch(stamp):
+    return datetime.strptime(stamp, STAMP).replace(tzinfo=timezone.utc).timestamp()
+
+def _updated(entry):
+    """When the keyword's latest file was fetched (epoch seconds)."""
+    stamp = name_timestamp(entry["file"])
+    if stamp is not None:
+        return _epoch(stamp)
+    # "updated" of older manifests may be the time they were rebuilt
+    stamps = [s for s in (entry.get("updated"), data_timestamp(entry)) if s]
+    return min(_epoch(s) for s in stamps) if stamps else None
+
+def score(pipeline, updated, vol, failures, now):
+    """(priority, staleness, seconds after `updated` at which the priority reaches 1)."""
+    interval = REFRESH_DAYS[pipeline] * DAY
+    boost = (1 + VOLATILITY_WEIGHT * (vol or 0.0)) * FAILURE_DECAY ** (failures or 0)
+    if updated is None:
+        return MAX_STALENESS * boost, MAX_STALENESS, 0.0
+    staleness = min(max(now - updated, 0.0) / interval, MAX_STALENESS)
+    return staleness * boost, staleness, interval / boost
+
+def plan(pipeline, queue=None, manifest=None, now=None):
+    """Priority and refresh time of every keyword in the queue:
+    [{keyword, status, priority, staleness, volatility, failures, due_at}], best first."""
+    queue = queue or KeywordQueue(pipeline)
+    manifest = manifest or Manifest.load(pipeline)
+    now = time.time() if now is None else now
+    rows, measured = [], 0
+    for kw, status, cls, failures, retry_at in queue.schedule_inputs():
+        entry = manifest.get(kw)
+        measured += bool(entry) and entry.get("volatility_sha256") != entry.get("sha256")
+        vol = entry_volatility(manifest, kw)
+        updated = _updated(entry) if entry else None
+        priority, staleness, after = score(pipeline, updated, vol, failures, now)
+        due_at = (updated + after) if updated is not None else now
+        if cls is not None and retry_at:
+            due_at = max(due_at, retry_at)
+        rows.append({"keyword": kw, "status": status, "priority": round(priority, 4),
+                     "staleness": round(staleness, 3), "volatility": vol, "failures": failures or 0,
+                     "due_at": due_at})
+    if measured:
+        manifest.save()
+    rows.sort(key=lambda r: -r["priority"])
+    return rows
+
+def reschedule(pipeline, queue=None, manifest=None, now=None):
+    """Store fresh priorities and refresh times in the queue. Returns the plan."""
+    queue = queue or KeywordQueue(pipeline)
+    rows = plan(pipeline, queue, manifest, now)
+    queue.schedule([(r["keyword"], r["priority"], r["due_at"]) for r in rows])
+    return rows
+
+def print_plan(pipeline, rows, budget, now=None):
+    now = time.time() if now is None else now
+    due = [r for r in rows if r["status"] == "unprocessed" or (r["status"] == "processed" and r["due_at"] <= now)]
+    print(f"{pipeline}: {len(due)} of {len(rows)} keywords to fetch (unprocessed or due for a refresh)"
+          + (f", next {budget}:" if budget else ":"))
+    print(f"  {'priority':>8} {'stale':>6} {'volat.':>6} {'fails':>5}  {'status':<11} keyword")
+    for r in due[:budget or None]:
+        vol = "-" if r["volatility"] is None else f"{r['volatility']:.2f}"
+        print(f"  {r['priority']:>8.3f} {r['staleness']:>6.2f} {vol:>6} {r['failures']:>5}  {r['status']:<11} {r['keyword']}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compute keyword refresh priorities.")
+    ap.add_argument("cmd", choices=("plan", "reschedule"))
+    ap.add_argument("pipelines", nargs="*", help="monthly, weekly and/or daily (default: all)")
+    ap.add_argument("--budget", type=int, default=20, help="keywords to list (0 = all)")
+    args = ap.parse_args(argv)
+    for pipeline in args.pipelines or list(REFRESH_DAYS):
+        if pipeline not in REFRESH_DAYS:
+            ap.error(f"unknown pipeline {pipeline!r} (choose from {', '.join(REFRESH_DAYS)})")
+        queue = KeywordQueue(pipeline)
+        if args.cmd == "reschedule":
+            rows = reschedule(pipeline, queue)
+            print(f"{pipeline}: rescheduled {len(rows)} keywords, {len(queue.due())} to fetch")
+        else:
+            print_plan(pipeline, plan(pipeline, queue), args.budget)
+        queue.close()
+
+if __name__ == "__main__":
+    main()
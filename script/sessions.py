@@ -0,0 +1,118 @@
+# script/sessions.py
+# Pool of warm pytrends sessions shared by all threads of a run.
+# Building a TrendReq costs a cookie bootstrap request to Google before any data call.
+# The pool keeps built sessions (with their cookies) and hands them out again across
+# windows, retries and keywords:
+# - a session is leased for one request and released to the idle pool after a response
+#   (CachedTrendReq does both), so any thread can pick it up next
+# - every new session gets the next user agent of USER_AGENTS: agents rotate per
+#   session, not per request, so one cookie always travels with the same agent
+# - a session that got a 429 is retired (Google ties throttling to the cookie); other
+#   errors are retried on the same session until MAX_ERRORS in a row, and sessions
+#   older than TRENDS_SESSION_MAX_AGE_MINUTES are retired instead of handed out
+# - stats(): hits (warm session handed out), misses (none idle), bootstraps (sessions
+#   built), retired (by reason), idle
+# The factory is called with the user agent (None if the pool has none).
+
+import itertools, os, random, threading, time
+from collections import deque
+from throttle import is_throttled
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1"
+]
+MAX_AGE = float(os.environ.get("TRENDS_SESSION_MAX_AGE_MINUTES", "60")) * 60
+MAX_ERRORS = 3
+
+class _Session:
+    __slots__ = ("client", "user_agent", "born", "errors")
+
+    def __init__(self, client, user_agent, born):
+        self.client = client
+        self.user_agent = user_agent
+        self.born = born
+        self.errors = 0
+
+class SessionPool:
+    """Callable TrendReq factory: pool() leases a session, release(client) returns it,
+    discard(client, exc) reports a failed request (retires it on a 429)."""
+
+    def __init__(self, factory, user_agents=USER_AGENTS, max_age=MAX_AGE, max_errors=MAX_ERRORS,
+                 clock=time.monotonic):
+        self.factory = factory
+        self.user_agents = list(user_agents or [])
+        self.max_age = max_age
+        self.max_errors = max_errors
+        self.clock = clock
+        self._agents = itertools.cycle(random.sample(self.user_agents, len(self.user_agents)))
+        self._idle = deque()
+        self._leased = {}  # id(client) -> _Session
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.retired = {"throttled": 0, "errors": 0, "age": 0}
+
+    @property
+    def built(self):
+        return self.misses
+
+    def _build(self):
+        ua = next(self._agents) if self.user_agents else None
+        return _Session(self.factory(ua), ua, self.clock())
+
+    def __call__(self):
+        with self._lock:
+            now = self.clock()
+            session = None
+            while self._idle:
+                s = self._idle.popleft()
+                if now - s.born > self.max_age:
+                    self.retired["age"] += 1
+                    continue
+                session = s
+                self.hits += 1
+                break
+            if session is None:
+                self.misses += 1
+        if session is None:
+            session = self._build()  # cookie bootstrap outside the lock
+        with self._lock:
+            self._leased[id(session.client)] = session
+        return session.client
+
+    def release(self, client):
+        """Return a session whose request got a response to the idle pool."""
+        with self._lock:
+            session = self._leased.pop(id(client), None)
+            if session is not None:
+                session.errors = 0
+                self._idle.append(session)
+
+    def discard(self, client, exc=None):
+        """A request on this session raised: retire it on a 429, after max_errors
+        failures in a row (or an unknown cause), otherwise keep it for the retry."""
+        with self._lock:
+            session = self._leased.pop(id(client), None)
+            if session is None:
+                return
+            session.errors += 1
+            if exc is not None and is_throttled(exc):
+                self.retired["throttled"] += 1
+            elif exc is None or session.errors >= self.max_errors:
+                self.retired["errors"] += 1
+            else:
+                self._idle.append(session)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bootstraps": self.misses,
+                    "retired": dict(self.retired), "idle": len(self._idle), "leased": len(self._leased)}
+
+    def summary(self):
+        s = self.stats()
+        r = s["retired"]
+        return (f"sessions: {s['hits']} hits, {s['misses']} misses ({s['bootstraps']} cookie bootstraps), "
+                f"retired {r['throttled']} on 429 / {r['errors']} on errors / {r['age']} by age")
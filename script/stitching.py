@@ -0,0 +1,233 @@
+# script/stitching.py
+# Stitching engine for overlapping Trends windows, on aligned NumPy arrays.
+# Same median-ratio rule as the original per-window pandas loop (kept below as
+# stitch_windows_pandas for reference and benchmarks):
+# - window i is scaled by median(stitched over the overlap) / median(window i over the overlap)
+#   when both sides have data and the new median is > 0, otherwise left unscaled
+# - window i contributes its dates after the previous window's end
+# Instead of concatenating the accumulated frame once per window, all windows are
+# placed on one date axis, the overlap medians of all windows are taken in one
+# sorted pass, the cumulative scale factors are chained as scalars, and the output
+# is a single gather-and-multiply. Results are bit-identical to the pandas loop.
+#
+# Benchmark: python script/stitching.py bench [n_windows ...]
+
+import sys, time
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+def _axis(windows_list):
+    """Union date axis plus, per window, its positions on the axis and its values.
+
+    Windows are kept ragged (no windows x dates matrix), so memory stays linear
+    in the number of fetched points."""
+    stamps, values = [], []
+    for df, _, _ in windows_list:
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        col = df.iloc[:, 0]
+        if col.dtype == object:  # all-NaN windows are saved without a dtype
+            col = pd.to_numeric(col, errors="coerce")
+        stamps.append(df.index.to_numpy(dtype="datetime64[ns]").view("i8"))
+        values.append(col.to_numpy(dtype=float))
+    axis = np.unique(np.concatenate(stamps))
+    positions = [np.searchsorted(axis, st) for st in stamps]
+    return axis, values, positions
+
+def _ns(stamps):
+    return pd.DatetimeIndex(stamps).as_unit("ns").asi8
+
+def _cuts(axis, ends):
+    # window i takes over the stitched series after the previous window's end
+    day = pd.Timedelta(days=1).value
+    return np.concatenate([[0], np.searchsorted(axis, ends[:-1] + day)])
+
+def _owners(axis, positions, cuts):
+    """Window each date of the stitched series comes from (-1: none) and the
+    index of that date inside the window."""
+    owner = np.full(len(axis), -1)
+    row = np.zeros(len(axis), dtype=int)
+    for i, pos in enumerate(positions):
+        first = np.searchsorted(pos, cuts[i])
+        owner[pos[first:]] = i
+        row[pos[first:]] = np.arange(first, len(pos))
+    return owner, row
+
+def _overlaps(axis, starts, ends):
+    """[lo, hi) positions on the axis of each window's overlap with the previous one."""
+    lo = np.searchsorted(axis, np.maximum(starts[:-1], starts[1:]))
+    hi = np.searchsorted(axis, np.minimum(ends[:-1], ends[1:]), side="right")
+    return lo, np.maximum(hi, lo)
+
+def _span(pos, lo, hi):
+    # slice of a window's rows whose axis positions fall in [lo, hi)
+    return slice(np.searchsorted(pos, lo), np.searchsorted(pos, hi))
+
+def _middles(segments):
+    """Two middle order statistics (equal for odd counts) and the non-NaN count
+    of each 1-D segment, from one sort of a NaN-padded block."""
+    width = max((len(s) for s in segments), default=0)
+    block = np.full((len(segments), max(width, 1)), np.nan)
+    for r, s in enumerate(segments):
+        block[r, :len(s)] = s
+    block.sort(axis=1)  # NaN sorts last
+    n = (~np.isnan(block)).sum(axis=1)
+    rows = np.arange(len(segments))
+    lo = block[rows, np.maximum((n - 1) // 2, 0)]
+    hi = block[rows, np.maximum(n // 2, 0)]
+    return lo, hi, n
+
+def _median(lo, hi, n, scale=1.0):
+    # same arithmetic as np.median on the scaled values: middle element, or the
+    # mean of the two middle elements
+    if n % 2:
+        return lo * scale
+    return (lo * scale + hi * scale) / 2
+
+def _fast_path_ok(owner, lo, hi, starts, ends):
+    # the shortcut needs every overlap to sit on the previous window only, which
+    # holds whenever windows are in order and don't skip over each other
+    if np.any(np.diff(ends) < 0) or np.any(np.diff(starts) < 0):
+        return False
+    for i in range(1, len(ends)):
+        seg = owner[lo[i - 1]:hi[i - 1]]
+        if np.any((seg != i - 1) & (seg != -1)):
+            return False
+    return True
+
+def _sequential(axis, values, positions, cuts, lo, hi):
+    """Reference order of operations on arrays (any window layout)."""
+    out = np.full(len(axis), np.nan)
+    present = np.zeros(len(axis), dtype=bool)
+    out[positions[0]] = values[0]
+    present[positions[0]] = True
+    for i in range(1, len(positions)):
+        old = out[lo[i - 1]:hi[i - 1]][present[lo[i - 1]:hi[i - 1]]]
+        new = values[i][_span(positions[i], lo[i - 1], hi[i - 1])]
+        old, new = old[~np.isnan(old)], new[~np.isnan(new)]
+        row = values[i]
+        if len(old) and len(new) and np.median(new) > 0:
+            row = row * (np.median(old) / np.median(new))
+        first = np.searchsorted(positions[i], cuts[i])
+        out[positions[i][first:]] = row[first:]
+        present[positions[i][first:]] = True
+    return out, present
+
+def stitch_arrays(windows_list):
+    """Stitch [(df, start, end), ...] into (axis, values, present) arrays."""
+    starts = _ns([s for _, s, _ in windows_list])
+    ends = _ns([e for _, _, e in windows_list])
+    axis, values, positions = _axis(windows_list)
+    cuts = _cuts(axis, ends)
+    owner, row = _owners(axis, positions, cuts)
+    lo, hi = _overlaps(axis, starts, ends)
+    dates = pd.DatetimeIndex(axis.view("datetime64[ns]"))
+    if not _fast_path_ok(owner, lo, hi, starts, ends):
+        return (dates,) + _sequential(axis, values, positions, cuts, lo, hi)
+
+    # overlap medians for all windows at once: the old side is the previous
+    # window (times its own, not yet known, scale), the new side window i itself
+    k = len(windows_list) - 1
+    old_seg, new_seg = [], []
+    for i in range(1, k + 1):
+        span = _span(positions[i - 1], lo[i - 1], hi[i - 1])
+        mine = owner[positions[i - 1][span]] == i - 1
+        old_seg.append(values[i - 1][span][mine])
+        new_seg.append(values[i][_span(positions[i], lo[i - 1], hi[i - 1])])
+    old_lo, old_hi, old_n = _middles(old_seg)
+    new_lo, new_hi, new_n = _middles(new_seg)
+
+    # chain the scale factors; an unusable overlap restarts the chain at 1
+    scales = np.ones(k + 1)
+    for j in range(k):
+        if old_n[j] and new_n[j]:
+            new_med = _median(new_lo[j], new_hi[j], new_n[j])
+            if new_med > 0:
+                scales[j + 1] = _median(old_lo[j], old_hi[j], old_n[j], scales[j]) / new_med
+
+    # one gather and one multiply for the whole series
+    present = owner >= 0
+    flat = np.concatenate(values)
+    offsets = np.concatenate([[0], np.cumsum([len(v) for v in values])[:-1]])
+    src = owner[present]
+    out = np.full(len(axis), np.nan)
+    out[present] = flat[offsets[src] + row[present]] * scales[src]
+    return dates, out, present
+
+def stitch_windows(windows_list):
+    """Stitch [(df, start, end), ...] one-column windows into one DataFrame, or None."""
+    if not windows_list:
+        return None
+    first = windows_list[0][0]
+    axis, out, present = stitch_arrays(windows_list)
+    idx = axis[present]
+    idx.name = first.index.name
+    return pd.DataFrame({first.columns[0]: out[present]}, index=idx)
+
+def stitch_windows_pandas(windows_list):
+    """The original per-window concat loop (quadratic in the number of windows)."""
+    if not windows_list:
+        return None
+    stitched = windows_list[0][0].copy().sort_index()
+    for i in range(1, len(windows_list)):
+        prev_df, prev_s, prev_e = windows_list[i - 1]
+        df, s, e = windows_list[i]
+        overlap_start = max(prev_s, s)
+        overlap_end = min(prev_e, e)
+        overlap_old = stitched.loc[overlap_start:overlap_end]
+        overlap_new = df.loc[overlap_start:overlap_end]
+        try:
+            cond = len(overlap_old.dropna()) > 0 and len(overlap_new.dropna()) > 0 and overlap_new.median().iloc[0] > 0
+        except Exception:
+            cond = False
+        if cond:
+            scale = overlap_old.median().iloc[0] / overlap_new.median().iloc[0]
+            df_scaled = df * scale
+        else:
+            df_scaled = df
+        tail = df_scaled.loc[prev_e + timedelta(days=1):]
+        stitched = pd.concat([stitched, tail])
+        stitched = stitched[~stitched.index.duplicated(keep="last")]
+    return stitched.sort_index()
+
+# ----------------- Benchmark -----------------
+def synthetic_windows(n, days=90, step=60, freq="D", seed=0):
+    """n overlapping windows of one random-walk series, each normalized to 0-100.
+
+    Use step < days / 2 to get windows that overlap more than their neighbour
+    (the array engine then takes its sequential path)."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2015-01-01")
+    total = pd.date_range(start, start + pd.Timedelta(days=step * (n - 1) + days), freq=freq)
+    truth = pd.Series(np.exp(np.cumsum(rng.normal(0, 0.05, len(total)))), index=total)
+    windows = []
+    for i in range(n):
+        s = start + pd.Timedelta(days=step * i)
+        e = s + pd.Timedelta(days=days)
+        w = truth.loc[s:e]
+        windows.append(((w / w.max() * 100).round().to_frame("kw"), s.to_pydatetime(), e.to_pydatetime()))
+    return windows
+
+def bench(sizes, **layout):
+    print(f"{'windows':>8} {'pandas s':>10} {'numpy s':>10} {'speedup':>8} identical")
+    for n in sizes:
+        windows = synthetic_windows(n, **layout)
+        t0 = time.perf_counter()
+        ref = stitch_windows_pandas(windows)
+        t1 = time.perf_counter()
+        new = stitch_windows(windows)
+        t2 = time.perf_counter()
+        same = ref.index.equals(new.index) and np.array_equal(
+            ref.iloc[:, 0].to_numpy(dtype=float), new.iloc[:, 0].to_numpy(), equal_nan=True)
+        print(f"{n:>8} {t1 - t0:>10.3f} {t2 - t1:>10.3f} {(t1 - t0) / max(t2 - t1, 1e-9):>8.1f} {same}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "bench":
+        print("Usage: python script/stitching.py bench [n_windows ...]")
+        sys.exit(1)
+    sizes = [int(a) for a in sys.argv[2:]] or [3, 25, 100, 300, 600]
+    print("neighbouring overlaps (fast path):")
+    bench(sizes)
+    print("deep overlaps, step 30 / 270 days (sequential path):")
+    bench(sizes, days=270, step=30)
@@ -0,0 +1,197 @@
+# script/streaming_merge.py
+# Constant-memory wide merge for very large keyword sets.
+# pd.concat(dfs, axis=1) keeps every keyword frame plus the concatenated copy in
+# memory at once. Here the output is built in column chunks instead:
+# 1. each input is parsed once (one file at a time) and its dates and values are
+#    spilled to a binary file next to the output; only the union date index is kept
+# 2. MERGE_CHUNK_COLUMNS keywords at a time are aligned on that index from the
+#    spill and appended to a keyword-major float64 scratch file
+# 3. the CSV is written in row blocks of about the same number of cells, and the
+#    columnar store (script/columnar_store.py) is filled from the scratch file
+# Peak memory is about chunk columns x dates values, not the whole dataset; the
+# spill and scratch files (about 3x the values as float64) are removed at the end.
+# The output is byte-identical to the pd.concat path in script/incremental_merge.py.
+#
+# Benchmark: python script/streaming_merge.py bench [n_keywords ...] [--chunk C] [--dates D]
+
+import argparse, os, resource, subprocess, sys, tempfile, time
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+import columnar_store, profiling
+
+CHUNK_COLUMNS = int(os.environ.get("MERGE_CHUNK_COLUMNS", "256"))
+
+def _column(read_column, name, path):
+    # one deduplicated column as a Series, or None if unreadable
+    df = read_column(name, path)
+    if df is None:
+        return None
+    df = df[~df.index.duplicated(keep="last")]
+    return df[name]
+
+class _Scratch:
+    """Keyword-major float64 matrix in a file, read with plain preads: slicing
+    keywords gives a contiguous read, dates(r0, r1) one short read per keyword.
+    Unlike a memmap, nothing stays resident after a block is used."""
+
+    def __init__(self, path, shape):
+        self.path, self.shape = path, shape
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read(self, offset, count):
+        return np.frombuffer(os.pread(self.fd, count * 8, offset * 8), dtype=float)
+
+    def __getitem__(self, rows):
+        start, stop, _ = rows.indices(self.shape[0])
+        return self._read(start * self.shape[1], (stop - start) * self.shape[1]).reshape(-1, self.shape[1])
+
+    def dates(self, r0, r1):
+        """dates x keywords block for dates r0:r1."""
+        n_kw, n_dates = self.shape
+        out = np.empty((r1 - r0, n_kw))
+        for k in range(n_kw):
+            out[:, k] = self._read(k * n_dates + r0, r1 - r0)
+        return out
+
+    def close(self):
+        os.close(self.fd)
+
+def _frame(block, index, names, is_int):
+    # one float and one int64 block, then the original column order (much cheaper
+    # than astype() on thousands of single columns)
+    cols = np.asarray(names, dtype=object)
+    parts = [pd.DataFrame(block[:, ~is_int], index=index, columns=cols[~is_int])]
+    if is_int.any():
+        parts.append(pd.DataFrame(block[:, is_int].astype("int64"), index=index, columns=cols[is_int]))
+    return pd.concat(parts, axis=1)[names] if len(parts) > 1 else parts[0]
+
+def _spill(columns, read_column, f):
+    """Parse every input once and append its (stamps, values) to f.
+    Returns (union axis as int64 ns, [(name, offset, length, integer dtype)], index name)."""
+    axis, spilled, index_names, offset = np.array([], dtype="i8"), [], set(), 0
+    for name, path, _ in columns:
+        s = _column(read_column, name, path)
+        if s is None:
+            continue
+        stamps = pd.DatetimeIndex(s.index).as_unit("ns").asi8
+        f.write(stamps.tobytes())
+        f.write(pd.to_numeric(s, errors="coerce").to_numpy(dtype=float).tobytes())
+        axis = np.union1d(axis, stamps)
+        spilled.append((name, offset, len(s), is_integer_dtype(s.dtype)))
+        index_names.add(s.index.name)
+        offset += 16 * len(s)
+    # pd.concat keeps the index name only when every input agrees on it
+    return axis, spilled, (index_names.pop() if len(index_names) == 1 else None)
+
+def stream_merge(columns, out_path, read_column, chunk_columns=CHUNK_COLUMNS):
+    """Write the wide merge of `columns` ((name, path, info) tuples) to out_path and
+    its columnar store, chunk_columns keywords at a time. Returns the names of the
+    columns written (unreadable files are left out)."""
+    chunk_columns = max(1, chunk_columns)
+    spill_path, scratch_path = out_path + ".spill.tmp", out_path + ".columns.tmp"
+    try:
+        with profiling.span("parse"), open(spill_path, "wb") as f:
+            axis, spilled, index_name = _spill(columns, read_column, f)
+        if not spilled:
+            return []
+        names = [name for name, _, _, _ in spilled]
+        n_dates = len(axis)
+        # keyword-major matrix on the union axis, one column chunk at a time
+        with profiling.span("align"), open(spill_path, "rb") as src, open(scratch_path, "wb") as dst:
+            for c0 in range(0, len(spilled), chunk_columns):
+                part = spilled[c0:c0 + chunk_columns]
+                block = np.full((len(part), n_dates), np.nan)
+                for j, (_, offset, n, _) in enumerate(part):
+                    src.seek(offset)
+                    stamps = np.fromfile(src, dtype="i8", count=n)
+                    block[j, np.searchsorted(axis, stamps)] = np.fromfile(src, dtype=float, count=n)
+                dst.write(block.tobytes())
+        os.remove(spill_path)
+        # an integer column stays integer only if it covers every date, as with pd.concat
+        is_int = np.array([i and n == n_dates for _, _, n, i in spilled], dtype=bool)
+        index = pd.DatetimeIndex(axis.view("datetime64[ns]"), name=index_name)
+        data = _Scratch(scratch_path, (len(names), n_dates))
+        try:
+            rows = max(1, chunk_columns * n_dates // len(names))
+            tmp = out_path + ".tmp"
+            with profiling.span("write"):
+                with open(tmp, "w", newline="", encoding="utf-8") as f:
+                    for r0 in range(0, n_dates, rows):
+                        r1 = min(r0 + rows, n_dates)
+                        _frame(data.dates(r0, r1), index[r0:r1], names, is_int).to_csv(f, header=r0 == 0)
+                os.replace(tmp, out_path)
+                columnar_store.write_matrix(out_path, index, names, data, chunk=chunk_columns)
+        finally:
+            data.close()
+    finally:
+        for p in (spill_path, scratch_path):
+            if os.path.exists(p):
+                os.remove(p)
+    return names
+
+# ----------------- Benchmark -----------------
+def _read_csv_column(name, path):
+    df = pd.read_csv(path, index_col=0, parse_dates=True)
+    df.columns = [name]
+    return df
+
+def synthetic_inputs(directory, n, n_dates=570, seed=0):
+    """n weekly keyword files with ragged starts/ends and gaps, like raw_weekly/."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2014-12-28", periods=n_dates, freq="W-SUN", name="date")
+    columns = []
+    for i in range(n):
+        lo, hi = sorted(rng.integers(0, n_dates, 2))
+        s = pd.Series(rng.integers(0, 101, hi - lo + 1), index=dates[lo:hi + 1], name=f"kw_{i}")
+        if i % 3 == 0:
+            s = s.astype(float) * rng.random()
+        path = os.path.join(directory, f"kw_{i}_weekly.csv")
+        s.to_frame().to_csv(path)
+        columns.append((f"kw_{i}", path, {}))
+    return columns
+
+def _bench_child(mode, directory, n, chunk):
+    # runs in its own process so ru_maxrss is the peak of this merge alone
+    import incremental_merge
+    columns = [(f"kw_{i}", os.path.join(directory, f"kw_{i}_weekly.csv"), {}) for i in range(n)]
+    out = os.path.join(directory, f"out_{mode}.csv")
+    t0 = time.perf_counter()
+    if mode == "concat":
+        merged = incremental_merge.concat_columns(columns, _read_csv_column, [c[0] for c in columns], {c[0]: {} for c in columns})
+        incremental_merge._write(merged, out)
+        columnar_store.write(merged, out)
+    else:
+        stream_merge(columns, out, _read_csv_column, chunk)
+    elapsed = time.perf_counter() - t0
+    from manifest import file_sha256
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file_sha256(out))
+
+def bench(sizes, chunk, n_dates):
+    print(f"chunk {chunk} columns, {n_dates} dates per keyword axis")
+    print(f"{'keywords':>8} {'concat s':>9} {'concat MiB':>11} {'stream s':>9} {'stream MiB':>11} identical")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as d:
+            synthetic_inputs(d, n, n_dates)
+            res = {}
+            for mode in ("concat", "stream"):
+                out = subprocess.run([sys.executable, __file__, "_child", mode, d, str(n), str(chunk)],
+                                     check=True, capture_output=True, text=True).stdout.split()
+                res[mode] = (float(out[0]), int(out[1]) / 1024, out[2])
+            (tc, mc, hc), (ts, ms, hs) = res["concat"], res["stream"]
+            print(f"{n:>8} {tc:>9.2f} {mc:>11.0f} {ts:>9.2f} {ms:>11.0f} {hc == hs}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_child":
+        _bench_child(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+        sys.exit(0)
+    ap = argparse.ArgumentParser(description="Benchmark the streaming merge against pd.concat.")
+    ap.add_argument("cmd", choices=("bench",))
+    ap.add_argument("sizes", nargs="*", type=int)
+    ap.add_argument("--chunk", type=int, default=CHUNK_COLUMNS)
+    ap.add_argument("--dates", type=int, default=570)
+    args = ap.parse_args()
+    bench(args.sizes or [500, 2000, 8000], args.chunk, args.dates)
@@ -2,8 +2,13 @@
 # Sync master keyword file with status files and enforce deletions as specified.
 # WARNING: This script WILL delete raw CSV files for keywords removed from processed.txt (no backup).
 
-import os, glob, sys
+import os, re, sys
 import pandas as pd
+from manifest import Manifest
+from incremental_merge import merge_columns, clear_state
+from keyword_queue import KeywordQueue
+from scheduler import reschedule
+import profiling
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 KEYDIR = os.path.join(ROOT, "keywords_monthly")
@@ -11,10 +16,6 @@ DATA_RAW = os.path.join(ROOT, "data_monthly", "raw")
 DATA_MERGED_DIR = os.path.join(ROOT, "data_monthly", "merged")
 
 MASTER = os.path.join(KEYDIR, "all_keywords.txt")
-UNPRO = os.path.join(KEYDIR, "unprocessed.txt")
-PROCING = os.path.join(KEYDIR, "processing.txt")
-PROCED = os.path.join(KEYDIR, "processed.txt")
-FAILED = os.path.join(KEYDIR, "failed.txt")
 
 os.makedirs(DATA_RAW, exist_ok=True)
 os.makedirs(DATA_MERGED_DIR, exist_ok=True)
@@ -26,15 +27,12 @@ def read_set(path):
         items = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
     return set(items)
 
-def write_set(path, s):
-    with open(path, "w", encoding="utf-8") as f:
-        for kw in sorted(s):
-            f.write(kw + "\n")
-
 def delete_raw_files_for_keyword(keyword):
     safe_kw = keyword.replace(" ", "_").replace("/", "_")
-    pattern = os.path.join(DATA_RAW, f"{safe_kw}_*.csv")
-    files = glob.glob(pattern)
+    # exact <safe_kw>_<YYYYMMDD>_<HHMM>.csv names only, so "cement price" does not
+    # take "cement price Sri Lanka" files with it
+    rx = re.compile(rf"^{re.escape(safe_kw)}_\d{{8}}_\d{{4}}\.csv$")
+    files = [os.path.join(DATA_RAW, n) for n in os.listdir(DATA_RAW) if rx.match(n)]
     deleted = []
     for p in files:
         try:
@@ -42,56 +40,47 @@ def delete_raw_files_for_keyword(keyword):
             deleted.append(p)
         except Exception as e:
             print(f"ERROR deleting file {p}: {e}")
+    Manifest.load("monthly").remove(keyword)
     return deleted
 
-def rebuild_merged_from_processed():
-    processed = read_set(PROCED)
+def read_column(colname, fpath):
+    try:
+        df = pd.read_csv(fpath, index_col=0, parse_dates=True)
+    except Exception as e:
+        print(f"Skipping {fpath} during merge: {e}")
+        return None
+    df.columns = [colname]
+    return df
+
+def rebuild_merged_from_processed(queue=None):
+    processed = set((queue or KeywordQueue("monthly")).with_data())
     # remove existing merged file(s) and produce a stable main_dataset.csv from processed
     out_file = os.path.join(DATA_MERGED_DIR, "main_dataset.csv")
-    # collect latest file per processed keyword
-    files = glob.glob(os.path.join(DATA_RAW, "*.csv"))
-    latest = {}
-    for f in files:
-        name = os.path.basename(f)
-        # name format: safe_kw_YYYYMMDD_HHMM.csv; safe_kw may contain underscores
-        parts = name.rsplit("_", 2)
-        if len(parts) >= 2:
-            safe_kw = parts[0]
-        else:
-            safe_kw = name.replace(".csv", "")
-        mtime = os.path.getmtime(f)
-        if safe_kw not in latest or mtime > latest[safe_kw][0]:
-            latest[safe_kw] = (mtime, f)
+    # latest file per processed keyword, from the manifest (see script/manifest.py)
+    manifest = Manifest.load("monthly")
 
-    # build dfs for processed keywords only
-    dfs = []
+    # build columns for processed keywords only
+    columns = []
     for pk in sorted(processed):
         safe_pk = pk.replace(" ", "_").replace("/", "_")
-        if safe_pk in latest:
-            fpath = latest[safe_pk][1]
-            try:
-                df = pd.read_csv(fpath, index_col=0, parse_dates=True)
-                colname = safe_pk
-                df.columns = [colname]
-                dfs.append(df)
-            except Exception as e:
-                print(f"Skipping {fpath} during merge: {e}")
+        fpath = manifest.latest_file(pk)
+        if fpath:
+            columns.append((safe_pk, fpath, manifest.get(pk)))
         else:
             print(f"No raw file found for processed keyword: {pk} (expected safe name {safe_pk})")
 
-    if not dfs:
+    status = merge_columns(columns, out_file, read_column) if columns else "empty"
+    if status == "empty":
         # remove existing merged if exists
         if os.path.exists(out_file):
             os.remove(out_file)
+            clear_state(out_file)
             print("Removed existing merged dataset (no processed keywords).")
         else:
             print("No processed keywords -> no merged dataset.")
         return
-
-    merged = pd.concat(dfs, axis=1)
-    merged.sort_index(inplace=True)
-    merged.to_csv(out_file)
-    print(f"Rebuilt merged dataset -> {out_file}")
+    # unchanged inputs are not re-read; see script/incremental_merge.py
+    print(f"Rebuilt merged dataset ({status}) -> {out_file}")
 
 def main():
     if not os.path.exists(MASTER):
@@ -99,10 +88,18 @@ def main():
         return
 
     master = read_set(MASTER)
-    unpro = read_set(UNPRO)
-    processing = read_set(PROCING)
-    processed = read_set(PROCED)
-    failed = read_set(FAILED)
+    # status comes from the SQLite keyword queue (script/keyword_queue.py)
+    queue = KeywordQueue("monthly")
+    reclaimed = queue.reclaim_expired()
+    if reclaimed:
+        print(f"Returned {reclaimed} keywords with an expired lease to the queue")
+    released = queue.release_due()
+    if released:
+        print(f"Returned {released} failed keywords due for a retry to unprocessed")
+    unpro = set(queue.keywords("unprocessed"))
+    processing = set(queue.keywords("processing"))
+    processed = set(queue.keywords("processed"))
+    failed = set(queue.keywords("failed"))
 
     print("=== Sync report start ===")
     print(f"Master count: {len(master)}")
@@ -149,10 +146,13 @@ def main():
                 processed.remove(kw)
                 removed_from_processed.append((kw, deleted_files))
 
-    # write back status files
-    write_set(UNPRO, unpro)
-    write_set(FAILED, failed)
-    write_set(PROCED, processed)
+    # apply to the queue in one go, then export the .txt files for humans
+    queue.add(added)
+    queue.remove(removed_from_unpro + removed_from_failed + [kw for kw, _ in removed_from_processed])
+    # priorities and refresh times for the fetchers' claims (script/scheduler.py)
+    reschedule("monthly", queue)
+    print(f"Scheduled {len(queue.due())} keywords to fetch (unprocessed or due for a refresh)")
+    queue.export_txt()
 
     # print summary
     if removed_from_unpro:
@@ -175,9 +175,11 @@ def main():
             print(" !", k)
 
     # rebuild merged dataset (based on updated processed.txt)
-    rebuild_merged_from_processed()
+    rebuild_merged_from_processed(queue)
 
     print("=== Sync report end ===")
 
 if __name__ == "__main__":
-    main()
+    profiling.setup("sync_master_and_cleanup", "monthly")
+    with profiling.span("sync"):
+        main()
@@ -0,0 +1,230 @@
+# script/telemetry.py
+# Structured per-request telemetry for the fetchers and a metrics summarizer.
+# Every interest_over_time attempt appends one JSON line to <logs dir>/requests.jsonl
+# (logs/, logs_weekly/, logs_daily/, logs_regional/):
+#   ts, pipeline, worker, keyword, window, attempt, status (HTTP), latency_s, bytes,
+#   http_requests, backoff_s (slept after this attempt), outcome, error
+# outcome is ok / empty / throttled / error, or cached when the response came from the
+# on-disk cache (no request sent). HTTP status and bytes come from a requests response
+# hook installed on the real TrendReq (cookie bootstrap, explore and widget calls all
+# count); with the fake backend only the status of a raised error is known.
+# Files are rotated to requests.jsonl.1 past TELEMETRY_MAX_MB; TRENDS_TELEMETRY=0 turns
+# the logging off.
+#
+# Usage: python script/telemetry.py metrics [monthly|weekly|daily|regional ...] [--since 2025-01-01]
+#            [--until 2025-02-01] [--last 7d] [--by day|hour|run|pipeline|none]
+
+import argparse, json, os, socket, threading, time
+from datetime import datetime, timedelta, timezone
+from throttle import is_throttled
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LOG_DIRS = {
+    "monthly": os.path.join(ROOT, "logs"),
+    "weekly": os.path.join(ROOT, "logs_weekly"),
+    "daily": os.path.join(ROOT, "logs_daily"),
+    "regional": os.path.join(ROOT, "logs_regional"),
+}
+ENABLED = os.environ.get("TRENDS_TELEMETRY", "1") != "0"
+MAX_BYTES = int(float(os.environ.get("TELEMETRY_MAX_MB", "20")) * 1024 * 1024)
+
+_local = threading.local()
+
+def response_hook(response, *args, **kwargs):
+    """requests hook: add the response to the calling thread's open span."""
+    acc = getattr(_local, "acc", None)
+    if acc is not None:
+        acc["bytes"] += len(response.content or b"")
+        acc["status"] = response.status_code
+        acc["http_requests"] += 1
+
+def requests_args(extra=None):
+    """requests_args for TrendReq(...) with the telemetry hook installed."""
+    args = dict(extra or {})
+    args["hooks"] = {"response": [response_hook]}
+    return args
+
+class Span:
+    """One request attempt; finish with ok() or failed()."""
+
+    def __init__(self, log, keyword, window, attempt, cached):
+        self.log = log
+        self.fields = {"keyword": keyword, "window": window, "attempt": attempt}
+        self.cached = cached
+        self.t0 = time.perf_counter()
+        self.acc = _local.acc = {"bytes": 0, "status": None, "http_requests": 0}
+
+    def _write(self, outcome, status, backoff, error=None):
+        _local.acc = None
+        acc = self.acc
+        self.log.write(dict(
+            self.fields,
+            status=acc["status"] or status,
+            latency_s=round(time.perf_counter() - self.t0, 3),
+            bytes=acc["bytes"],
+            http_requests=acc["http_requests"],
+            backoff_s=round(float(backoff), 2),
+            outcome=outcome,
+            error=error,
+        ))
+
+    def ok(self, df):
+        if self.cached:
+            outcome = "cached"
+        else:
+            outcome = "empty" if df is None or df.empty else "ok"
+        self._write(outcome, None if self.cached else 200, 0.0)
+
+    def failed(self, exc, backoff=0.0):
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+        outcome = "throttled" if is_throttled(exc) else "error"
+        self._write(outcome, status, backoff or 0.0, f"{type(exc).__name__}: {exc}"[:200])
+
+class RequestLog:
+    """Append-only JSON-lines request log of one pipeline; thread-safe, and lines
+    from concurrent processes don't interleave (one O_APPEND write each)."""
+
+    def __init__(self, pipeline, path=None, enabled=ENABLED):
+        self.pipeline = pipeline
+        self.path = path or os.path.join(LOG_DIRS[pipeline], "requests.jsonl")
+        self.enabled = enabled
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+
+    def span(self, keyword, window, attempt, cached=False):
+        return Span(self, keyword, window, attempt, cached)
+
+    def write(self, record):
+        if not self.enabled:
+            return
+        now = datetime.now(timezone.utc)
+        line = json.dumps(dict(ts=now.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+                               pipeline=self.pipeline, worker=self.worker, **record),
+                          ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > MAX_BYTES:
+                os.replace(self.path, self.path + ".1")
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+
+# ----------------- Metrics -----------------
+def read_records(pipelines, since=None, until=None):
+    for pipeline in pipelines:
+        path = os.path.join(LOG_DIRS[pipeline], "requests.jsonl")
+        for p in (path + ".1", path):
+            if not os.path.exists(p):
+                continue
+            with open(p, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        ts = datetime.strptime(rec["ts"], "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+                    except (ValueError, KeyError):
+                        continue
+                    if (since and ts < since) or (until and ts >= until):
+                        continue
+                    rec["_ts"] = ts
+                    yield rec
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+GROUPS = {
+    "day": lambda r: r["_ts"].strftime("%Y-%m-%d"),
+    "hour": lambda r: r["_ts"].strftime("%Y-%m-%d %H:00"),
+    "run": lambda r: f"{r['pipeline']} {r['worker']}",
+    "pipeline": lambda r: r["pipeline"],
+    "none": lambda r: "all",
+}
+
+def summarize(records):
+    """Aggregate one group of records."""
+    sent = [r for r in records if r["outcome"] != "cached"]
+    ok = [r for r in sent if r["outcome"] in ("ok", "empty")]
+    latencies = [r["latency_s"] for r in sent]
+    # active time: per worker, first request start to last request end (plus its backoff)
+    spans = {}
+    for r in records:
+        end = r["_ts"].timestamp() + r.get("backoff_s", 0)
+        start = r["_ts"].timestamp() - r["latency_s"]
+        lo, hi = spans.get(r["worker"], (start, end))
+        spans[r["worker"]] = (min(lo, start), max(hi, end))
+    active = sum(hi - lo for lo, hi in spans.values())
+    backoff = sum(r.get("backoff_s", 0) for r in records)
+    return {
+        "requests": len(sent),
+        "cached": len(records) - len(sent),
+        "keywords": len({r["keyword"] for r in records}),
+        "success_rate": len(ok) / len(sent) if sent else None,
+        "throttled": sum(r["outcome"] == "throttled" for r in sent),
+        "errors": sum(r["outcome"] == "error" for r in sent),
+        "empty": sum(r["outcome"] == "empty" for r in sent),
+        "p50_latency_s": _percentile(latencies, 0.5),
+        "p95_latency_s": _percentile(latencies, 0.95),
+        "requests_per_min": len(sent) / (active / 60) if active > 0 else None,
+        "ok_per_min": len(ok) / (active / 60) if active > 0 else None,
+        "mbytes": sum(r.get("bytes") or 0 for r in sent) / 1e6,
+        "backoff_s": backoff,
+        "backoff_share": backoff / active if active > 0 else None,
+        "active_s": active,
+    }
+
+def metrics(pipelines, since=None, until=None, by="day"):
+    groups = {}
+    for rec in read_records(pipelines, since, until):
+        groups.setdefault(GROUPS[by](rec), []).append(rec)
+    return {k: summarize(v) for k, v in sorted(groups.items())}
+
+def _fmt(v, spec):
+    return "-" if v is None else format(v, spec)
+
+def print_metrics(table):
+    if not table:
+        print("No request records in range.")
+        return
+    width = max(len(k) for k in table)
+    print(f"{'group':<{width}} {'reqs':>6} {'cached':>6} {'kws':>5} {'ok%':>6} {'429':>5} {'err':>4} "
+          f"{'p50 s':>6} {'p95 s':>6} {'req/min':>7} {'ok/min':>7} {'MB':>6} {'backoff':>8} {'lost%':>6}")
+    for k, m in table.items():
+        print(f"{k:<{width}} {m['requests']:>6} {m['cached']:>6} {m['keywords']:>5} "
+              f"{_fmt(m['success_rate'] and m['success_rate'] * 100, '6.1f'):>6} {m['throttled']:>5} {m['errors']:>4} "
+              f"{_fmt(m['p50_latency_s'], '6.2f'):>6} {_fmt(m['p95_latency_s'], '6.2f'):>6} "
+              f"{_fmt(m['requests_per_min'], '7.1f'):>7} {_fmt(m['ok_per_min'], '7.1f'):>7} {m['mbytes']:>6.1f} "
+              f"{m['backoff_s']:>7.0f}s {_fmt(m['backoff_share'] and m['backoff_share'] * 100, '6.1f'):>6}")
+
+def _parse_when(text):
+    return datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=timezone.utc) if text else None
+
+def _parse_last(text):
+    units = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+    return datetime.now(timezone.utc) - timedelta(**{units[text[-1]]: float(text[:-1])})
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Summarize fetcher request telemetry.")
+    ap.add_argument("cmd", choices=("metrics",))
+    ap.add_argument("pipelines", nargs="*", help="monthly, weekly, daily and/or regional (default: all)")
+    ap.add_argument("--since", help="YYYY-mm-dd (UTC, inclusive)")
+    ap.add_argument("--until", help="YYYY-mm-dd (UTC, exclusive)")
+    ap.add_argument("--last", help="only the last N m/h/d/w, e.g. 24h or 7d")
+    ap.add_argument("--by", choices=list(GROUPS), default="day")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+    for p in args.pipelines:
+        if p not in LOG_DIRS:
+            ap.error(f"unknown pipeline {p!r} (choose from {', '.join(LOG_DIRS)})")
+    since = _parse_last(args.last) if args.last else _parse_when(args.since)
+    table = metrics(args.pipelines or list(LOG_DIRS), since, _parse_when(args.until), args.by)
+    if args.json:
+        print(json.dumps(table, indent=1))
+    else:
+        print_metrics(table)
@@ -0,0 +1,134 @@
+# script/throttle.py
+# Shared 429-aware throttling for the monthly and weekly fetchers.
+# - AIMD request rate on top of rate_limit.TokenBucket (add on success, halve on 429)
+# - backoff that grows with the current 429 streak, not with the per-keyword attempt
+# - honors Retry-After when Google sends it
+# - circuit breaker: once the recent error rate passes a threshold the run should stop
+#   and re-queue its keyword instead of sleeping through the rest of the runner time
+
+import random, threading, time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from rate_limit import TokenBucket
+
+class CircuitOpen(Exception):
+    """Raised by ThrottleController.before_request() once the breaker has tripped."""
+
+def is_throttled(exc):
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return "429" in str(exc)
+
+def retry_after_seconds(exc):
+    """Seconds requested by a Retry-After header on exc.response, or None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class ThrottleController:
+    """One per run; shared by every request (and every worker thread) of that run."""
+
+    def __init__(self, rate_per_minute, min_rate=1.0, increase=0.5, decrease=0.5,
+                 base_backoff=20, error_backoff=5, max_backoff=600,
+                 window=20, min_samples=5, trip_ratio=0.6,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate_per_minute
+        self.min_rate = min(min_rate, rate_per_minute)
+        self.increase = increase
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.error_backoff = error_backoff
+        self.max_backoff = max_backoff
+        self.min_samples = min_samples
+        self.trip_ratio = trip_ratio
+        self.bucket = TokenBucket(rate_per_minute, clock=clock, sleep=sleep)
+        self._clock = clock
+        self._sleep = sleep
+        self._outcomes = deque(maxlen=window)  # True = success, False = error
+        self._streak = 0  # consecutive 429s across all requests
+        self._cooldown_until = 0.0
+        self._tripped = False
+        self._lock = threading.Lock()
+
+    @property
+    def rate_per_minute(self):
+        return self.bucket.rate_per_minute
+
+    @property
+    def tripped(self):
+        return self._tripped
+
+    def error_rate(self):
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def before_request(self):
+        """Wait out any shared cooldown, then take a token. Returns seconds waited."""
+        if self._tripped:
+            raise CircuitOpen(f"error rate {self.error_rate():.0%} over threshold")
+        waited = 0.0
+        pause = self._cooldown_until - self._clock()
+        if pause > 0:
+            self._sleep(pause)
+            waited += pause
+        return waited + self.bucket.acquire()
+
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append(True)
+            self._streak = 0
+            rate = min(self.max_rate, self.bucket.rate_per_minute + self.increase)
+        self.bucket.set_rate(rate)
+
+    def record_failure(self, exc):
+        """Record a failed request; returns True when it was a 429."""
+        throttled = is_throttled(exc)
+        with self._lock:
+            self._outcomes.append(False)
+            if throttled:
+                self._streak += 1
+                rate = max(self.min_rate, self.bucket.rate_per_minute * self.decrease)
+            else:
+                rate = self.bucket.rate_per_minute
+            n = len(self._outcomes)
+            if n >= self.min_samples and (n - sum(self._outcomes)) / n >= self.trip_ratio:
+                self._tripped = True
+        self.bucket.set_rate(rate)
+        return throttled
+
+    def backoff_for(self, exc):
+        """Seconds to wait before retrying after exc.
+
+        Retry-After wins when present. A 429 waits base_backoff doubled per 429 in
+        the current streak; a one-off non-429 error waits only error_backoff.
+        A 429 also pauses every other worker until the backoff has elapsed."""
+        hinted = retry_after_seconds(exc)
+        if hinted is not None:
+            delay = min(hinted, self.max_backoff)
+        elif is_throttled(exc):
+            delay = min(self.base_backoff * (2 ** max(self._streak - 1, 0)), self.max_backoff)
+            delay *= random.uniform(0.8, 1.2)
+        else:
+            delay = self.error_backoff
+        if is_throttled(exc):
+            with self._lock:
+                self._cooldown_until = max(self._cooldown_until, self._clock() + delay)
+        return delay
@@ -0,0 +1,247 @@
+# script/trends_cache.py
+# Content-addressed on-disk cache for interest_over_time responses.
+# - key = sha256 of the normalized payload (keywords, timeframe, geo, tz, cat, gprop)
+# - closed historical timeframes never expire; timeframes touching the current
+#   partial period expire after PARTIAL_TTL seconds
+# - size-bounded, least-recently-used entries are evicted first (file mtime = last use)
+# - replay-only mode (TRENDS_CACHE_REPLAY=1) never touches the network and raises CacheMiss
+# - CachedTrendReq(validate=...) only caches responses the caller accepts, and forget()
+#   drops an entry the caller rejected, so a bad response is never replayed
+# - build_geo_payload() compares one keyword across several geos in one request
+#   (pytrends' build_payload takes a single geo for all keywords)
+
+import hashlib, json, os, threading, time
+from datetime import datetime, timedelta
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_DIR = os.environ.get("TRENDS_CACHE_DIR", os.path.join(ROOT, "cache", "trends"))
+MAX_BYTES = int(float(os.environ.get("TRENDS_CACHE_MAX_MB", "200")) * 1024 * 1024)
+PARTIAL_TTL = 6 * 3600
+CLOSED_AFTER_DAYS = 7  # a timeframe ending this many days ago has no partial period left
+REPLAY_ONLY = os.environ.get("TRENDS_CACHE_REPLAY", "") not in ("", "0")
+DISABLED = os.environ.get("TRENDS_CACHE", "1") == "0"
+
+class CacheMiss(Exception):
+    """Raised in replay-only mode when a payload is not in the cache."""
+
+def payload_key(kw_list, timeframe, geo, tz, cat=0, gprop=""):
+    payload = {
+        "kw": [k.strip() for k in kw_list],
+        "timeframe": timeframe.strip(),
+        "geo": geo.upper(),
+        "tz": int(tz),
+        "cat": int(cat),
+        "gprop": gprop or "",
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest(), payload
+
+def build_geo_payload(client, keyword, geos, timeframe, cat=0, gprop=""):
+    """Payload comparing keyword across geos (e.g. LK, LK-1 ... LK-4; Google takes up
+    to 5 items). interest_over_time() then has one column per geo, all on one scale."""
+    if hasattr(client, "build_geo_payload"):  # the fake backend
+        return client.build_geo_payload(keyword, geos, timeframe, cat, gprop)
+    client.kw_list = list(geos)  # pytrends names the result columns after kw_list
+    client.token_payload = {
+        "hl": client.hl,
+        "tz": client.tz,
+        "req": json.dumps({"comparisonItem": [{"keyword": keyword, "time": timeframe, "geo": g} for g in geos],
+                           "category": cat, "property": gprop}),
+    }
+    client._tokens()
+
+def ttl_for(timeframe, today=None):
+    """None (never expires) for closed windows, PARTIAL_TTL otherwise."""
+    today = today or datetime.utcnow()
+    try:
+        end = datetime.strptime(timeframe.split(" ")[1], "%Y-%m-%d")
+    except (IndexError, ValueError):
+        return PARTIAL_TTL  # relative timeframes like "today 5-y" always move
+    if end <= today - timedelta(days=CLOSED_AFTER_DAYS):
+        return None
+    return PARTIAL_TTL
+
+class TrendsCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, replay_only=REPLAY_ONLY):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, key):
+        sub = os.path.join(self.root, key[:2])
+        return os.path.join(sub, f"{key}.csv"), os.path.join(sub, f"{key}.json")
+
+    def contains(self, key):
+        data, meta = self._paths(key)
+        if not (os.path.exists(data) and os.path.exists(meta)):
+            return False
+        try:
+            with open(meta, "r", encoding="utf-8") as f:
+                expires = json.load(f).get("expires_at")
+        except (OSError, ValueError):
+            return False
+        return expires is None or expires > time.time()
+
+    def get(self, key):
+        if not self.contains(key):
+            with self._lock:
+                self.misses += 1
+            return None
+        data, _ = self._paths(key)
+        df = pd.read_csv(data, index_col=0, parse_dates=True)
+        os.utime(data, None)  # LRU: mtime is last use
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def delete(self, key):
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._size = None  # recounted by the next evict()
+
+    def put(self, key, payload, df):
+        data, meta = self._paths(key)
+        os.makedirs(os.path.dirname(data), exist_ok=True)
+        ttl = ttl_for(payload["timeframe"])
+        info = {
+            "payload": payload,
+            "fetched_at": time.time(),
+            "expires_at": None if ttl is None else time.time() + ttl,
+        }
+        for path, write in ((data, lambda p: df.to_csv(p)),
+                            (meta, lambda p: _write_json(p, info))):
+            tmp = f"{path}.tmp{threading.get_ident()}"
+            write(tmp)
+            os.replace(tmp, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(data) + os.path.getsize(meta)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for sub in os.listdir(self.root):
+            d = os.path.join(self.root, sub)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                if name.endswith(".csv"):
+                    p = os.path.join(d, name)
+                    st = os.stat(p)
+                    meta = p[:-4] + ".json"
+                    size = st.st_size + (os.path.getsize(meta) if os.path.exists(meta) else 0)
+                    entries.append((st.st_mtime, size, p, meta))
+        return entries
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            entries = self._entries()
+            self._size = sum(e[1] for e in entries)
+            if self._size <= self.max_bytes:
+                return
+            for mtime, size, data, meta in sorted(entries):
+                for p in (data, meta):
+                    if os.path.exists(p):
+                        os.remove(p)
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+def _write_json(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+
+class CachedTrendReq:
+    """Wraps a TrendReq factory so interest_over_time() goes through the cache.
+
+    The real TrendReq (and its cookie bootstrap request) is only built on a
+    miss. build_payload() just records the payload; the token request happens
+    inside interest_over_time() when the data is not cached. Callers check
+    needs_network() to skip throttling for requests that won't hit Google.
+    validate(df), if given, raises (ValueError) for a response the caller can't use;
+    such a response is not cached and the exception reaches the caller."""
+
+    def __init__(self, factory, cache, tz, hl="en-US", validate=None):
+        self.factory = factory
+        self.cache = cache
+        self.tz = tz
+        self.hl = hl
+        self.validate = validate
+        self._client = None
+        self._args = None
+        self._geos = None
+        self._key = None
+        self._payload = None
+
+    def build_payload(self, kw_list, cat=0, timeframe="today 5-y", geo="", gprop=""):
+        self._args = (list(kw_list), cat, timeframe, geo, gprop)
+        self._geos = None
+        self._key, self._payload = payload_key(kw_list, timeframe, geo, self.tz, cat, gprop)
+
+    def build_geo_payload(self, keyword, geos, timeframe, cat=0, gprop=""):
+        """One keyword across several geos, see build_geo_payload()."""
+        self._args = ([keyword], cat, timeframe, ",".join(geos), gprop)
+        self._geos = list(geos)
+        self._key, self._payload = payload_key([keyword], timeframe, ",".join(geos), self.tz, cat, gprop)
+
+    def reset(self, exc=None):
+        """Drop the underlying client after a failed request; the next miss gets
+        another one. A session pool factory decides whether the client is retired."""
+        client, self._client = self._client, None
+        discard = getattr(self.factory, "discard", None)
+        if discard is not None and client is not None:
+            discard(client, exc)
+
+    def forget(self):
+        """Drop the cached response of the current payload (e.g. one the caller rejected)."""
+        if self.cache is not None:
+            self.cache.delete(self._key)
+
+    def is_cached(self):
+        return self.cache is not None and self.cache.contains(self._key)
+
+    def needs_network(self):
+        # replay-only misses raise CacheMiss without a request
+        return not (self.is_cached() or (self.cache is not None and self.cache.replay_only))
+
+    def interest_over_time(self):
+        if self.cache is not None:
+            df = self.cache.get(self._key)
+            if df is not None:
+                return df
+            if self.cache.replay_only:
+                raise CacheMiss(f"not cached: {self._payload}")
+        if self._client is None:
+            self._client = self.factory()
+        kw_list, cat, timeframe, geo, gprop = self._args
+        if self._geos:
+            build_geo_payload(self._client, kw_list[0], self._geos, timeframe, cat, gprop)
+        else:
+            self._client.build_payload(kw_list, cat=cat, timeframe=timeframe, geo=geo, gprop=gprop)
+        df = self._client.interest_over_time()
+        release = getattr(self.factory, "release", None)
+        if release is not None:
+            # back to the pool for the next request, from any thread
+            release(self._client)
+            self._client = None
+        if df is not None and not df.empty:
+            if self.validate is not None:
+                self.validate(df)
+            if self.cache is not None:
+                self.cache.put(self._key, self._payload, df)
+        return df
+
+def default_cache():
+    """Process-wide cache, or None when disabled with TRENDS_CACHE=0."""
+    return None if DISABLED else TrendsCache()
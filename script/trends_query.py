@@ -0,0 +1,139 @@
+# script/trends_query.py
+# Query collected series without reading whole merged CSVs:
+#
+#   sys.path.insert(0, "script"); from trends_query import load
+#   df = load(["Colombo hotel", "fuel"], start="2020-01-01", end="2022-12-31", resolution="monthly")
+#
+# Keywords are matched by their merged column name (merge_weekly.safe_kw: spaces and
+# "/" -> "_"), so both "Colombo hotel" and "Colombo_hotel" work and the returned
+# columns are named like the merged datasets.
+# - weekly / monthly: keywords in the merged columnar store (script/columnar_store.py)
+#   are read from its memory-mapped arrays, only their rows and the requested dates;
+#   keywords not in the store (or a store older than its CSV) come from their latest
+#   raw file in the manifest
+# - daily: data_daily/store/<safe_kw>.npz via the daily manifest
+# Results are kept in an in-process LRU cache (QUERY_CACHE_SIZE, default 64 queries)
+# keyed on the query and the modification times of the sources, so a re-merge or a
+# refetch is picked up without clearing it by hand.
+#
+# Usage: python script/trends_query.py [weekly|monthly|daily] keyword [...] [--start D] [--end D]
+
+import argparse, os, sys
+from functools import lru_cache
+import pandas as pd
+from manifest import Manifest, DATASETS
+import columnar_store, daily_store
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "64"))
+
+# resolution -> (manifest dataset, merged CSV or None)
+SOURCES = {
+    "monthly": ("monthly", columnar_store.MERGED["monthly"]),
+    "weekly": ("weekly", columnar_store.MERGED["weekly"]),
+    "daily": ("daily", None),
+}
+
+def safe_kw(kw):
+    # same naming as script_weekly/merge_weekly.py and the merged CSV columns
+    return kw.replace(" ", "_").replace("/", "_")
+
+def _mtime(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+def _version(resolution):
+    """Changes whenever a source of this resolution is rewritten."""
+    dataset, csv_path = SOURCES[resolution]
+    parts = [_mtime(DATASETS[dataset][0])]
+    if csv_path:
+        parts += [_mtime(csv_path), _mtime(os.path.join(columnar_store.store_dir(csv_path), "keywords.json"))]
+    return tuple(parts)
+
+@lru_cache(maxsize=8)
+def _store(csv_path, version):
+    # the opened store, if it was built from the CSV as it is now
+    if not os.path.exists(csv_path) or not columnar_store.is_current(csv_path):
+        return None
+    return columnar_store.open_store(csv_path)
+
+@lru_cache(maxsize=8)
+def _manifest(dataset, version):
+    manifest = Manifest(dataset) if os.path.exists(DATASETS[dataset][0]) else None
+    by_safe = {safe_kw(kw): kw for kw in (manifest.entries if manifest else {})}
+    return manifest, by_safe
+
+def _raw_column(manifest, keyword, name, resolution, start, end):
+    path = manifest.latest_file(keyword) if manifest else None
+    if path is None:
+        return None
+    if resolution == "daily":
+        s = daily_store.load(os.path.splitext(os.path.basename(path))[0], store_dir=os.path.dirname(path))
+    else:
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        s = df.iloc[:, 0][~df.index.duplicated(keep="last")].sort_index()
+    s = pd.to_numeric(s, errors="coerce").loc[start:end]
+    s.index.name = "date"
+    return s.rename(name)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _query(names, start, end, resolution, version):
+    dataset, csv_path = SOURCES[resolution]
+    store = _store(csv_path, version) if csv_path else None
+    manifest, by_safe = _manifest(dataset, version)
+    cols, missing = {}, []
+    in_store = [n for n in names if store is not None and n in store]
+    if in_store:
+        cols.update(store.frame(in_store, start, end).items())
+    for name in names:
+        if name in cols:
+            continue
+        s = _raw_column(manifest, by_safe.get(name, name), name, resolution, start, end)
+        if s is None:
+            missing.append(name)
+        else:
+            cols[name] = s
+    if missing:
+        raise KeyError(f"No {resolution} data for: {', '.join(missing)}")
+    df = pd.concat([cols[n] for n in names], axis=1) if names else pd.DataFrame()
+    df.index.name = "date"
+    return df
+
+def load(keywords, start=None, end=None, resolution="weekly"):
+    """date x keyword DataFrame of the given keywords between start and end
+    (inclusive, any pandas-parsable date; None = open ended).
+
+    resolution: "weekly", "monthly" or "daily". Raises KeyError for keywords
+    with no data at that resolution. The result is a copy; cached queries are
+    not affected by changes to it."""
+    if resolution not in SOURCES:
+        raise ValueError(f"resolution must be one of {', '.join(SOURCES)}")
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    names = tuple(dict.fromkeys(safe_kw(k) for k in keywords))
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    return _query(names, start, end, resolution, _version(resolution)).copy()
+
+def clear_cache():
+    for fn in (_query, _store, _manifest):
+        fn.cache_clear()
+
+def cache_info():
+    return _query.cache_info()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Print collected series for some keywords.")
+    ap.add_argument("resolution", choices=tuple(SOURCES))
+    ap.add_argument("keywords", nargs="+")
+    ap.add_argument("--start")
+    ap.add_argument("--end")
+    args = ap.parse_args()
+    try:
+        print(load(args.keywords, args.start, args.end, args.resolution).to_string())
+    except KeyError as e:
+        print(e.args[0])
+        sys.exit(1)
@@ -0,0 +1,200 @@
+# script/window_fetch.py
+# Window fetching shared by the weekly and daily fetchers. Google only returns a
+# resolution for timeframes up to some length, so a long series is requested as
+# overlapping windows (put on one scale afterwards by script/stitching.py):
+# - WindowFetcher.fetch() requests one window through the response cache and the
+#   session pool, with retries under the run's throttle, reindexes it on the
+#   pipeline's date grid (W-SUN or D) and checkpoints it; None once every retry failed
+# - WindowFetcher.fetch_many() fetches (kw_search, safe_kw, start, end) jobs on a
+#   thread pool; jobs cut short by the circuit breaker are left out of the result
+# - Checkpoints keeps every window that Google answered (empty answers too) as
+#   <dir>/<safe_kw>/<safe_kw>_<start>_<end>.csv, followed by a .done marker with its
+#   row count, hash and fetch time; a window only counts as fetched when both exist
+#   and agree. max_age_days expires old checkpoints (weekly), closed_after_days only
+#   reuses windows that had no partial period left when they were fetched (daily)
+
+import json, os, random, shutil, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from throttle import CircuitOpen
+from trends_cache import CachedTrendReq, CacheMiss
+from manifest import file_sha256
+
+class Checkpoints:
+    """Window checkpoints of one pipeline under `directory`."""
+
+    def __init__(self, directory, max_age_days=None, closed_after_days=None, dtype=None):
+        self.directory = directory
+        self.max_age_days = max_age_days
+        self.closed_after_days = closed_after_days
+        self.dtype = dtype
+
+    def path(self, safe_kw, start, end):
+        return os.path.join(self.directory, safe_kw, f"{safe_kw}_{start:%Y%m%d}_{end:%Y%m%d}.csv")
+
+    def save(self, safe_kw, start, end, df):
+        path = self.path(safe_kw, start, end)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        df.to_csv(tmp)
+        os.replace(tmp, path)
+        marker = {"rows": len(df), "sha256": file_sha256(path), "fetched_at": datetime.utcnow().isoformat(timespec="seconds")}
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(marker, f)
+        os.replace(tmp, path + ".done")
+
+    def load(self, safe_kw, start, end):
+        """Checkpointed window, or None if it is missing, unfinished, too old or was
+        fetched while its data was still open."""
+        path = self.path(safe_kw, start, end)
+        try:
+            with open(path + ".done", "r", encoding="utf-8") as f:
+                marker = json.load(f)
+            fetched = datetime.fromisoformat(marker["fetched_at"])
+            if self.max_age_days is not None and datetime.utcnow() - fetched > timedelta(days=self.max_age_days):
+                return None
+            if self.closed_after_days is not None and fetched - end < timedelta(days=self.closed_after_days):
+                return None
+            if file_sha256(path) != marker["sha256"]:
+                return None
+            df = pd.read_csv(path, index_col=0, parse_dates=True)
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(df) != marker["rows"]:
+            return None
+        df.columns = [safe_kw]
+        return df if self.dtype is None else df.astype(self.dtype)
+
+    def clear(self, safe_kw):
+        shutil.rmtree(os.path.join(self.directory, safe_kw), ignore_errors=True)
+
+    def prune(self, safe_kw, windows):
+        """Drop checkpoints of windows no longer in the plan (e.g. yesterday's open window)."""
+        folder = os.path.join(self.directory, safe_kw)
+        keep = {os.path.basename(self.path(safe_kw, s, e)) for s, e in windows}
+        keep |= {name + ".done" for name in keep}
+        for name in os.listdir(folder) if os.path.isdir(folder) else []:
+            if name not in keep:
+                os.remove(os.path.join(folder, name))
+
+class WindowFetcher:
+    """Fetches the windows of one pipeline. `requests` is its telemetry.RequestLog,
+    `log` its run log function and `sessions` the default client factory (a
+    sessions.SessionPool)."""
+
+    def __init__(self, checkpoints, sessions, cache, requests, log, tz, geo, freq,
+                 max_retries=5, backoff=20, jitter=(1.0, 3.0)):
+        self.checkpoints = checkpoints
+        self.sessions = sessions
+        self.cache = cache
+        self.requests = requests
+        self.log = log
+        self.tz = tz
+        self.geo = geo
+        self.freq = freq
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.dtype = checkpoints.dtype  # windows come back as they load from a checkpoint
+
+    def bounds(self, start, end):
+        """The requested timeframe: start and end widened to whole periods."""
+        offset = to_offset(self.freq)
+        return offset.rollback(pd.Timestamp(start)), offset.rollforward(pd.Timestamp(end))
+
+    def _check(self, df, full_idx, timeframe):
+        # rows coarser than the pipeline's grid would reindex into gaps
+        if len(df) > 1 and len(full_idx) > 1 and df.index[1] - df.index[0] > full_idx[1] - full_idx[0]:
+            raise ValueError(f"timeframe {timeframe} did not return {self.freq} rows")
+
+    def _frame(self, df, full_idx, safe_kw, timeframe):
+        if df is None or df.empty:
+            return pd.DataFrame(index=full_idx, columns=[safe_kw], dtype=self.dtype)
+        df = df.drop(columns=["isPartial"], errors="ignore")
+        self._check(df, full_idx, timeframe)
+        df = df.rename(columns={df.columns[0]: safe_kw}).reindex(full_idx)
+        return df if self.dtype is None else df.astype(self.dtype)
+
+    def fetch(self, kw_search, safe_kw, start, end, throttle=None, client_factory=None):
+        """Fetch one window and checkpoint it. Returns its DataFrame, or None when
+        every attempt failed (nothing is checkpointed then). Without a throttle,
+        retries back off linearly. Only attempts that sent a request count towards
+        the throttle's circuit breaker."""
+        start_adj, end_adj = self.bounds(start, end)
+        timeframe = f"{start_adj:%Y-%m-%d} {end_adj:%Y-%m-%d}"
+        full_idx = pd.date_range(start_adj, end_adj, freq=self.freq)
+        # a pooled session is only leased if the cache misses; reset() hands a failed one
+        # back. Responses at the wrong resolution are rejected before they are cached.
+        pytrends = CachedTrendReq(client_factory or self.sessions, self.cache, self.tz,
+                                  validate=lambda df: self._check(df, full_idx, timeframe))
+        for attempt in range(1, self.max_retries + 1):
+            span, online = None, False
+            try:
+                pytrends.build_payload([kw_search], timeframe=timeframe, geo=self.geo)
+                online = pytrends.needs_network()
+                if online:
+                    time.sleep(random.uniform(*self.jitter))
+                    if throttle is not None:
+                        throttle.before_request()
+                span = self.requests.span(kw_search, timeframe, attempt, cached=not online)
+                df = pytrends.interest_over_time()
+                span.ok(df)
+                span = None
+                if online and throttle is not None:
+                    throttle.record_success()
+                empty = df is None or df.empty
+                df = self._frame(df, full_idx, safe_kw, timeframe)
+                self.checkpoints.save(safe_kw, start, end, df)
+                if empty:
+                    self.log(f"Window {start.date()}–{end.date()} empty")
+                else:
+                    self.log(f"Window {start.date()}–{end.date()} fetched, shape {df.shape}, "
+                             f"non-null {int(df[safe_kw].notna().sum())}")
+                return df
+            except (CircuitOpen, CacheMiss):
+                raise
+            except Exception as ex:
+                self.log(f"Exception fetching window {start.date()}–{end.date()} (attempt {attempt}): {ex}")
+                pytrends.reset(ex)
+                if not online:
+                    # a cached response that can't be used: drop it and ask Google next time
+                    pytrends.forget()
+                    if span is not None:
+                        span.failed(ex, 0)
+                    continue
+                if throttle is None:
+                    if span is not None:
+                        span.failed(ex, self.backoff * attempt)
+                    time.sleep(self.backoff * attempt)
+                    continue
+                throttle.record_failure(ex)
+                backoff = throttle.backoff_for(ex) if not throttle.tripped and attempt < self.max_retries else 0
+                if span is not None:
+                    span.failed(ex, backoff)
+                if throttle.tripped:
+                    raise CircuitOpen(str(ex))
+                time.sleep(backoff)
+        return None
+
+    def fetch_many(self, jobs, throttle, client_factory=None, max_workers=3, pool=None):
+        """Fetch (kw_search, safe_kw, start, end) jobs on a thread pool.
+
+        All jobs share `throttle`, so the pool size only sets how many requests may be
+        in flight; the request rate is bounded by its token bucket. Returns a dict
+        mapping each job tuple to its window DataFrame, or None if its retries ran out.
+        Jobs cut short by the circuit breaker (or missing from the cache in replay-only
+        mode) are left out of the result. Pass a long-lived `pool` to keep its threads
+        (and their sessions) across calls."""
+        if pool is None:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as own:
+                return self.fetch_many(jobs, throttle, client_factory, max_workers, own)
+        futures = {job: pool.submit(self.fetch, *job, throttle, client_factory) for job in jobs}
+        results = {}
+        for job, fut in futures.items():
+            try:
+                results[job] = fut.result()
+            except (CircuitOpen, CacheMiss) as ex:
+                self.log(f"Window {job[2].date()}–{job[3].date()} for {job[0]} not fetched: {type(ex).__name__}")
+        return results
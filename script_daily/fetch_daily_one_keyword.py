@@ -0,0 +1,221 @@
+# script_daily/fetch_daily_one_keyword.py
+# DAILY FETCHER (same window/stitch design as the weekly fetcher)
+# - Google only returns daily rows for timeframes shorter than ~270 days, so
+#   2015-today is covered by WINDOW_DAYS windows every STEP_DAYS days (~20+ per keyword)
+# - Every window is checkpointed to data_daily/windows/<kw>/ as soon as it arrives, with
+#   a .done marker; windows that were closed when fetched are never requested again, so
+#   a re-run (or a refresh next month) only fetches what is missing plus the open
+#   window ending yesterday
+# - Windows are fetched concurrently under one shared throttle, through the response
+#   cache, by the window fetcher shared with the weekly pipeline (script/window_fetch.py)
+# - Stitched with script/stitching.py and saved to the compact store
+#   (script/daily_store.py, data_daily/store/<kw>.npz); weekly and monthly levels are
+#   averaged from it with daily_store.load(kw, "W" / "M")
+# - Keywords come from keywords_daily/master_keywords.txt through the "daily" queue
+#
+# Usage: python script_daily/fetch_daily_one_keyword.py [--worker] [--shard i/N]
+#            [--lease-minutes M] [--budget-minutes M]
+
+import argparse, os, socket, sys, time, traceback, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pytrends.request import TrendReq
+
+# ----------------- Paths -----------------
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+from throttle import ThrottleController
+from trends_cache import default_cache, CLOSED_AFTER_DAYS
+from manifest import Manifest
+from keyword_queue import KeywordQueue, parse_shard
+from scheduler import reschedule
+from sessions import SessionPool
+from stitching import stitch_windows
+from window_fetch import Checkpoints, WindowFetcher
+import daily_store
+import telemetry
+
+KW_DIR = os.path.join(ROOT, "keywords_daily")
+MASTER = os.path.join(KW_DIR, "master_keywords.txt")
+RAW_WINDOWS = os.path.join(ROOT, "data_daily", "windows")
+LOGS = os.path.join(ROOT, "logs_daily")
+
+os.makedirs(LOGS, exist_ok=True)
+os.makedirs(RAW_WINDOWS, exist_ok=True)
+
+RUN_LOG = os.path.join(LOGS, "runs.log")
+
+QUEUE = KeywordQueue("daily")
+
+GEO = "LK"
+TZ = 330
+
+# ----------------- Window size configuration -----------------
+# 266 days (38 weeks) stays under Google's daily limit; a 196-day step leaves
+# 70 days of overlap for the median scaling
+WINDOW_DAYS = 266
+STEP_DAYS = 196
+START_DATE = datetime(2015, 1, 1)
+MAX_RETRIES = 5
+BACKOFF = 20
+
+# ----------------- Concurrency / worker configuration -----------------
+KEYWORDS_PER_RUN = int(os.environ.get("DAILY_KEYWORDS_PER_RUN", "1"))
+MAX_WORKERS = int(os.environ.get("DAILY_MAX_WORKERS", "3"))
+REQUESTS_PER_MINUTE = float(os.environ.get("DAILY_REQUESTS_PER_MINUTE", "12"))
+FAKE_BACKEND = os.environ.get("TRENDS_FAKE_BACKEND", "") not in ("", "0")
+# TRENDS_BASE_URL=http://127.0.0.1:8765/trends sends pytrends to script/mock_trends_server.py
+if os.environ.get("TRENDS_BASE_URL"):
+    from mock_trends_server import point_pytrends
+    point_pytrends(os.environ["TRENDS_BASE_URL"])
+CACHE = default_cache()
+# One JSON line per Trends request in logs_daily/requests.jsonl (script/telemetry.py)
+REQUESTS = telemetry.RequestLog("daily", os.path.join(LOGS, "requests.jsonl"))
+LEASE_MINUTES = 30
+BUDGET_MINUTES = 300
+
+MIN_JITTER = 1.0
+MAX_JITTER = 3.0
+
+_LOG_LOCK = threading.Lock()
+
+def log(msg):
+    ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    with _LOG_LOCK:
+        print(msg)
+        with open(RUN_LOG, "a", encoding="utf-8") as f:
+            f.write(f"{ts} - {msg}\n")
+
+def sanitize_for_filename(name):
+    s = "".join(c if c.isalnum() or c in (" ", "_") else "_" for c in name)
+    return s.strip().replace(" ", "_")
+
+def make_trendreq(user_agent=None):
+    if FAKE_BACKEND:
+        from fake_trends import FakeTrendReq
+        return FakeTrendReq(hl="en-US", tz=TZ)
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    return TrendReq(hl="en-US", tz=TZ, requests_args=telemetry.requests_args({"headers": headers}))
+
+# warm sessions shared by the window threads, retired after a 429 (script/sessions.py)
+SESSIONS = SessionPool(make_trendreq)
+# open windows (ending less than CLOSED_AFTER_DAYS before they were fetched) are refetched
+CHECKPOINTS = Checkpoints(RAW_WINDOWS, closed_after_days=CLOSED_AFTER_DAYS, dtype="float32")
+WINDOWS = WindowFetcher(CHECKPOINTS, SESSIONS, CACHE, REQUESTS, log, TZ, GEO, "D",
+                        MAX_RETRIES, BACKOFF, (MIN_JITTER, MAX_JITTER))
+
+# ----------------- Windows -----------------
+def compute_windows(today=None):
+    """Fixed (start, end) daily windows from START_DATE; the last one ends yesterday.
+
+    Window bounds don't move between runs (except the last), so their
+    checkpoints stay valid."""
+    today = (today or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    last_day = today - timedelta(days=1)
+    windows = []
+    cur = START_DATE
+    while cur + timedelta(days=WINDOW_DAYS - 1) <= last_day:
+        windows.append((cur, cur + timedelta(days=WINDOW_DAYS - 1)))
+        cur += timedelta(days=STEP_DAYS)
+    if not windows or windows[-1][1] < last_day:
+        # a full-length closing window keeps a long overlap with the one before it
+        windows.append((max(START_DATE, last_day - timedelta(days=WINDOW_DAYS - 1)), last_day))
+    return windows
+
+# ----------------- One keyword -----------------
+def process_keyword(keyword, throttle, pool, client_factory=SESSIONS):
+    """Fetch the missing windows of a keyword, stitch and store it.
+    Returns False when the run should stop (keyword handed back to the queue)."""
+    kw_search = keyword.strip()
+    safe_kw = sanitize_for_filename(keyword)
+    windows = compute_windows()
+    collected = {}
+    for s, e in windows:
+        df = CHECKPOINTS.load(safe_kw, s, e)
+        if df is not None:
+            collected[(s, e)] = df
+    jobs = [(kw_search, safe_kw, s, e) for s, e in windows if (s, e) not in collected]
+    log(f"Daily keyword {keyword}: {len(windows)} windows, {len(collected)} checkpointed, "
+        f"{len(jobs)} to fetch")
+
+    results = WINDOWS.fetch_many(jobs, throttle, client_factory, MAX_WORKERS, pool)
+    for (_, _, s, e), df in results.items():
+        if df is not None:
+            collected[(s, e)] = df
+    if len(results) < len(jobs):
+        # finished windows are checkpointed; the next claim resumes from them
+        QUEUE.requeue(keyword)
+        log(f"Re-queued: {keyword}")
+        return False
+    if len(collected) < len(windows):
+        log(f"FAILED for {keyword}: {len(windows) - len(collected)} windows could not be fetched")
+        QUEUE.fail(keyword, "window fetch failed")
+        return True
+    if not any(int(df[safe_kw].notna().sum()) for df in collected.values()):
+        log(f"Keyword has NO data → FAIL: {keyword}")
+        QUEUE.fail(keyword, "no data")
+        return True
+
+    stitched = stitch_windows([(collected[w], w[0], w[1]) for w in windows])
+    out = daily_store.save(safe_kw, stitched[safe_kw])
+    CHECKPOINTS.prune(safe_kw, windows)
+    Manifest.shared("daily").record(keyword, out)
+    log(f"Saved daily store for {keyword}: {len(stitched)} days -> {out}")
+    QUEUE.complete(keyword)
+    return True
+
+# ----------------- Runs -----------------
+def sync_master():
+    """Queue keywords added to master_keywords.txt (removals are left to the user)
+    and reschedule the queue."""
+    if os.path.exists(MASTER):
+        with open(MASTER, "r", encoding="utf-8") as f:
+            master = [l.strip() for l in f if l.strip() and not l.strip().startswith("#")]
+        added = QUEUE.add(master)
+        if added:
+            log(f"Queued {len(added)} new daily keywords")
+    # priorities and refresh times for the claims below (script/scheduler.py)
+    reschedule("daily", QUEUE)
+
+def run_worker(shard=None, lease_minutes=LEASE_MINUTES, budget_minutes=BUDGET_MINUTES, max_keywords=None):
+    """Claim and process keywords until the queue (or shard) is empty, the budget is
+    spent or max_keywords have been claimed. Returns the number of keywords claimed."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.time() + budget_minutes * 60
+    throttle = ThrottleController(REQUESTS_PER_MINUTE, base_backoff=BACKOFF)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        while time.time() < deadline and (max_keywords is None or done < max_keywords):
+            keywords = QUEUE.claim(1, lease=lease_minutes * 60, shard=shard, worker=worker)
+            if not keywords:
+                log("No daily keywords left for this worker.")
+                break
+            done += 1
+            with QUEUE.keep_alive(keywords, lease_minutes * 60, worker):
+                if not process_keyword(keywords[0], throttle, pool, SESSIONS):
+                    break
+    log(f"Worker {worker} finished after {done} keywords; {SESSIONS.summary()}")
+    return done
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch daily Google Trends keywords from the queue.")
+    ap.add_argument("--worker", action="store_true", help="keep claiming keywords until the budget is spent")
+    ap.add_argument("--shard", type=parse_shard, help="only take keywords of shard i of N (e.g. 0/4)")
+    ap.add_argument("--lease-minutes", type=float, default=LEASE_MINUTES)
+    ap.add_argument("--budget-minutes", type=float, default=BUDGET_MINUTES)
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sync_master()
+    max_keywords = None if args.worker or args.shard else max(KEYWORDS_PER_RUN, 1)
+    run_worker(args.shard, args.lease_minutes, args.budget_minutes, max_keywords)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        log("Unexpected error: " + str(e))
+        traceback.print_exc()
+    finally:
+        QUEUE.export_txt()
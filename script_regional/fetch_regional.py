@@ -0,0 +1,300 @@
+# script_regional/fetch_regional.py
+# REGIONAL FETCHER: monthly interest of every keyword in each Sri Lankan province
+# - Jobs are (keyword x province) pairs, "<keyword> @ LK-3", in the "regional" queue;
+#   keywords are the union of keywords_monthly/all_keywords.txt and
+#   keywords_weekly/master_keywords.txt, provinces are regional_cube.REGIONS
+# - One request compares the keyword in the whole country (GEO) and up to
+#   REGIONS_PER_REQUEST provinces, so the 9 provinces take 3 requests, not 9. Each
+#   request is rescaled so the national peak is 100: every request carries the same
+#   national series, so all provinces of a keyword end up on one scale
+# - 2015-01-01 to the end of last month (monthly rows, like the monthly fetcher),
+#   through the response cache, under one shared throttle
+# - Results go to the keyword x region x date cube (script/regional_cube.py,
+#   data_regional/cube/); a job is due again REGIONAL_REFRESH_DAYS after its cell was fetched
+#
+# Usage: python script_regional/fetch_regional.py [--worker] [--shard i/N]
+#            [--lease-minutes M] [--budget-minutes M]
+
+import argparse, os, socket, sys, time, traceback, random, threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pandas as pd
+from pytrends.request import TrendReq
+
+# ----------------- Paths -----------------
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+from throttle import ThrottleController, CircuitOpen
+from trends_cache import CachedTrendReq, CacheMiss, default_cache
+from keyword_queue import KeywordQueue, parse_shard, DAY
+from scheduler import MAX_STALENESS, FAILURE_DECAY
+from sessions import SessionPool
+import regional_cube
+import telemetry
+
+SOURCES = [os.path.join(ROOT, "keywords_monthly", "all_keywords.txt"),
+           os.path.join(ROOT, "keywords_weekly", "master_keywords.txt")]
+LOGS = os.path.join(ROOT, "logs_regional")
+
+os.makedirs(LOGS, exist_ok=True)
+
+RUN_LOG = os.path.join(LOGS, "runs.log")
+
+QUEUE = KeywordQueue("regional")
+
+GEO = "LK"
+TZ = 330
+REGIONS = list(regional_cube.REGIONS)
+REGIONS_PER_REQUEST = 4  # Google compares up to 5 items: GEO + 4 provinces
+SEPARATOR = " @ "
+
+START_DATE = "2015-01-01"
+
+def last_day_of_previous_month():
+    today = datetime.utcnow().replace(day=1)
+    return (today - timedelta(days=1)).strftime("%Y-%m-%d")
+
+TIMEFRAME = f"{START_DATE} {last_day_of_previous_month()}"
+MAX_RETRIES = 5
+BACKOFF = 60
+
+# ----------------- Concurrency / worker configuration -----------------
+JOBS_PER_RUN = int(os.environ.get("REGIONAL_JOBS_PER_RUN", "18"))
+MAX_WORKERS = int(os.environ.get("REGIONAL_MAX_WORKERS", "3"))
+REQUESTS_PER_MINUTE = float(os.environ.get("REGIONAL_REQUESTS_PER_MINUTE", "6"))
+REFRESH_DAYS = float(os.environ.get("REGIONAL_REFRESH_DAYS", "30"))
+FAKE_BACKEND = os.environ.get("TRENDS_FAKE_BACKEND", "") not in ("", "0")
+# TRENDS_BASE_URL=http://127.0.0.1:8765/trends sends pytrends to script/mock_trends_server.py
+if os.environ.get("TRENDS_BASE_URL"):
+    from mock_trends_server import point_pytrends
+    point_pytrends(os.environ["TRENDS_BASE_URL"])
+CACHE = default_cache()
+# One JSON line per Trends request in logs_regional/requests.jsonl (script/telemetry.py)
+REQUESTS = telemetry.RequestLog("regional", os.path.join(LOGS, "requests.jsonl"))
+LEASE_MINUTES = 30
+BUDGET_MINUTES = 300
+
+MIN_JITTER = 1.0
+MAX_JITTER = 3.0
+
+_LOG_LOCK = threading.Lock()
+
+def log(msg):
+    ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    with _LOG_LOCK:
+        print(msg)
+        with open(RUN_LOG, "a", encoding="utf-8") as f:
+            f.write(f"{ts} - {msg}\n")
+
+def make_trendreq(user_agent=None):
+    if FAKE_BACKEND:
+        from fake_trends import FakeTrendReq
+        return FakeTrendReq(hl="en-US", tz=TZ)
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    return TrendReq(hl="en-US", tz=TZ, requests_args=telemetry.requests_args({"headers": headers}))
+
+# warm sessions shared by the request threads, retired after a 429 (script/sessions.py)
+SESSIONS = SessionPool(make_trendreq)
+
+# ----------------- Jobs -----------------
+def job_name(keyword, region):
+    return f"{keyword}{SEPARATOR}{region}"
+
+def parse_job(job):
+    keyword, _, region = job.rpartition(SEPARATOR)
+    return keyword, region
+
+def read_keywords():
+    keywords = []
+    for path in SOURCES:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                keywords += [l.strip() for l in f if l.strip() and not l.strip().startswith("#")]
+    return list(dict.fromkeys(keywords))
+
+def job_schedule(inputs, cube, now):
+    """[(job, priority, due_at)]: jobs never fetched first, then by time since their
+    cell was fetched over REFRESH_DAYS; halved per failure in a row, like the scheduler."""
+    interval = REFRESH_DAYS * DAY
+    rows = []
+    for job, status, cls, failures, retry_at in inputs:
+        keyword, region = parse_job(job)
+        fetched = cube.fetched_at(keyword, region) if cube is not None else None
+        decay = FAILURE_DECAY ** (failures or 0)
+        if fetched is None:
+            priority, due_at = MAX_STALENESS * decay, now
+        else:
+            priority = min(max(now - fetched, 0.0) / interval, MAX_STALENESS) * decay
+            due_at = fetched + interval
+        if cls is not None and retry_at:
+            due_at = max(due_at, retry_at)
+        rows.append((job, round(priority, 4), due_at))
+    return rows
+
+def sync_jobs():
+    """Queue a job per (keyword, province) of the keyword lists, drop jobs of
+    keywords no longer listed, and schedule refreshes from the cube."""
+    keywords = read_keywords()
+    wanted = [job_name(kw, r) for kw in keywords for r in REGIONS]
+    added = QUEUE.add(wanted)
+    if added:
+        log(f"Queued {len(added)} new regional jobs")
+    keep = set(wanted)
+    stale = [job for job, *_ in QUEUE.schedule_inputs() if job not in keep]
+    if stale:
+        QUEUE.remove(stale)
+        log(f"Removed {len(stale)} regional jobs of keywords no longer listed")
+    cube = regional_cube.RegionalCube() if regional_cube.read_meta() else None
+    QUEUE.schedule(job_schedule(QUEUE.schedule_inputs(), cube, time.time()))
+
+# ----------------- Fetch one request -----------------
+def _check_monthly(df):
+    if len(df) > 1 and (df.index[1] - df.index[0]) < timedelta(days=28):
+        raise ValueError(f"timeframe {TIMEFRAME} did not return monthly rows")
+
+def fetch_regions(keyword, regions, throttle, client_factory=SESSIONS):
+    """Compare keyword across GEO and up to REGIONS_PER_REQUEST regions. Returns
+    (date x region DataFrame with the national peak at 100, status); the frame is
+    None when the keyword has no data ("no data") or every attempt failed."""
+    geos = [GEO] + list(regions)
+    label = f"{keyword} [{','.join(regions)}]"
+    # reset() below hands a failed session back; the next attempt leases another.
+    # Responses that aren't monthly are rejected before they are cached.
+    pytrends = CachedTrendReq(client_factory, CACHE, TZ, validate=_check_monthly)
+    for attempt in range(1, MAX_RETRIES + 1):
+        span, online = None, False
+        try:
+            pytrends.build_geo_payload(keyword, geos, TIMEFRAME)
+            online = pytrends.needs_network()
+            if online:
+                time.sleep(random.uniform(MIN_JITTER, MAX_JITTER))
+                throttle.before_request()
+            span = REQUESTS.span(label, TIMEFRAME, attempt, cached=not online)
+            df = pytrends.interest_over_time()
+            span.ok(df)
+            span = None
+            if online:
+                throttle.record_success()
+            if df is None or df.empty:
+                return None, "no data"
+            df = df.drop(columns=["isPartial"], errors="ignore")
+            _check_monthly(df)
+            peak = float(df[GEO].max())
+            if not peak > 0:
+                return None, "no data"
+            return (df[list(regions)].astype(float) * (100.0 / peak)), "ok"
+        except (CircuitOpen, CacheMiss):
+            raise
+        except Exception as ex:
+            log(f"Exception fetching {label} (attempt {attempt}): {ex}")
+            pytrends.reset(ex)
+            if not online:
+                # a cached response that can't be used: drop it and ask Google next time
+                pytrends.forget()
+                if span is not None:
+                    span.failed(ex, 0)
+                if attempt == MAX_RETRIES:
+                    return None, f"error_final: {ex}"
+                continue
+            throttle.record_failure(ex)
+            backoff = throttle.backoff_for(ex) if not throttle.tripped and attempt < MAX_RETRIES else 0
+            if span is not None:
+                span.failed(ex, backoff)
+            if throttle.tripped:
+                raise CircuitOpen(str(ex))
+            if attempt == MAX_RETRIES:
+                return None, f"error_final: {ex}"
+            time.sleep(backoff)
+    return None, "unknown"
+
+# ----------------- A batch of jobs -----------------
+def process_jobs(jobs, throttle, pool, client_factory=SESSIONS):
+    """Fetch the claimed jobs (grouped per keyword, REGIONS_PER_REQUEST regions per
+    request), store them in the cube and finish them in the queue.
+    Returns False when the run should stop (unfinished jobs handed back to the queue)."""
+    by_keyword = {}
+    for job in jobs:
+        keyword, region = parse_job(job)
+        by_keyword.setdefault(keyword, []).append(region)
+    futures = {}
+    for keyword, regions in by_keyword.items():
+        regions = [r for r in REGIONS if r in regions] + [r for r in regions if r not in REGIONS]
+        for i in range(0, len(regions), REGIONS_PER_REQUEST):
+            chunk = tuple(regions[i:i + REGIONS_PER_REQUEST])
+            futures[(keyword, chunk)] = pool.submit(fetch_regions, keyword, chunk, throttle, client_factory)
+
+    results, done, failed, interrupted = {}, [], [], []
+    for (keyword, chunk), fut in futures.items():
+        jobs_of = [job_name(keyword, r) for r in chunk]
+        try:
+            df, status = fut.result()
+        except (CircuitOpen, CacheMiss) as ex:
+            log(f"{keyword} [{','.join(chunk)}] not fetched: {type(ex).__name__}")
+            interrupted += jobs_of
+            continue
+        if df is None:
+            log(f"FAILED {keyword} [{','.join(chunk)}]: {status}")
+            failed += [(job, status) for job in jobs_of]
+            continue
+        results[keyword] = pd.concat([results[keyword], df], axis=1) if keyword in results else df
+        done += jobs_of
+
+    if results:
+        path = regional_cube.update(results, time.time())
+        log(f"Stored {len(done)} regional series of {len(results)} keywords in {path}")
+    for job in done:
+        QUEUE.complete(job)
+    for job, status in failed:
+        QUEUE.fail(job, status)
+    for job in interrupted:
+        QUEUE.requeue(job)
+    if interrupted:
+        log(f"Re-queued {len(interrupted)} regional jobs")
+        return False
+    return True
+
+# ----------------- Runs -----------------
+def run_worker(shard=None, lease_minutes=LEASE_MINUTES, budget_minutes=BUDGET_MINUTES, max_jobs=None):
+    """Claim and process jobs until the queue (or shard) is empty, the budget is
+    spent or max_jobs have been claimed. Returns the number of jobs claimed."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.time() + budget_minutes * 60
+    throttle = ThrottleController(REQUESTS_PER_MINUTE, base_backoff=BACKOFF)
+    batch = len(REGIONS)  # one keyword's worth: ceil(9 / 4) = 3 requests for the pool
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        while time.time() < deadline and (max_jobs is None or done < max_jobs):
+            n = batch if max_jobs is None else min(batch, max_jobs - done)
+            jobs = QUEUE.claim(n, lease=lease_minutes * 60, shard=shard, worker=worker)
+            if not jobs:
+                log("No regional jobs left for this worker.")
+                break
+            done += len(jobs)
+            with QUEUE.keep_alive(jobs, lease_minutes * 60, worker):
+                if not process_jobs(jobs, throttle, pool, SESSIONS):
+                    break
+    log(f"Worker {worker} finished after {done} jobs; {SESSIONS.summary()}")
+    return done
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch provincial Google Trends interest from the queue.")
+    ap.add_argument("--worker", action="store_true", help="keep claiming jobs until the budget is spent")
+    ap.add_argument("--shard", type=parse_shard, help="only take jobs of shard i of N (e.g. 0/4)")
+    ap.add_argument("--lease-minutes", type=float, default=LEASE_MINUTES)
+    ap.add_argument("--budget-minutes", type=float, default=BUDGET_MINUTES)
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sync_jobs()
+    max_jobs = None if args.worker or args.shard else max(JOBS_PER_RUN, 1)
+    run_worker(args.shard, args.lease_minutes, args.budget_minutes, max_jobs)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        log("Unexpected error: " + str(e))
+        traceback.print_exc()
+    finally:
+        QUEUE.export_txt()
@@ -1,33 +1,51 @@
 # script_weekly/fetch_weekly_one_keyword.py
 # WEEKLY FETCHER FOR NORMAL GOOGLE SEARCH TERMS (CORRECT WEEK ALIGNMENT)
-# - Fetches each window sequentially with fresh pytrends session
+# - Fetches windows (of one or more keywords) concurrently on pooled pytrends sessions
+#   (cookies kept across windows and keywords, one user agent per session, retired on a
+#   429), all paced by one shared throttle controller (token bucket + AIMD + circuit breaker)
 # - Does NOT save window files when keyword FAILs
+# - Keywords that last failed for lack of data (the queue's negative cache) are re-probed
+#   with the latest window only; the other windows are fetched only if it has data
+# - Checkpoints every window as it arrives (data_weekly/checkpoints/, with a .done marker);
+#   a re-run of an interrupted keyword only requests the windows still missing
 # - Adds verbose per-window logs
-# - Ensures processing.txt is cleaned up on final move-to-failed/processed
-# - Does median scaling & stitching unchanged
+# - Claims and finishes keywords through the SQLite keyword queue (processing never leaks)
+# - Does median scaling & stitching unchanged (array engine in script/stitching.py)
 
-import os, time, traceback, pandas as pd, random
+import argparse, os, socket, sys, time, traceback, pandas as pd, threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from pytrends.request import TrendReq
 
 # ----------------- Paths -----------------
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+from throttle import ThrottleController
+from trends_cache import default_cache
+from incremental import splice_trailing
+from manifest import Manifest
+from keyword_queue import KeywordQueue, parse_shard
+from sessions import SessionPool
+from stitching import stitch_windows
+from window_fetch import Checkpoints, WindowFetcher
+import telemetry, profiling
 KW_DIR = os.path.join(ROOT, "keywords_weekly")
 RAW_WINDOWS = os.path.join(ROOT, "data_weekly", "raw_windows")
 RAW_WEEKLY = os.path.join(ROOT, "data_weekly", "raw_weekly")
+CHECKPOINT_DIR = os.path.join(ROOT, "data_weekly", "checkpoints")
 LOGS = os.path.join(ROOT, "logs_weekly")
 
 os.makedirs(LOGS, exist_ok=True)
 os.makedirs(RAW_WINDOWS, exist_ok=True)
 os.makedirs(RAW_WEEKLY, exist_ok=True)
 
-UNPRO = os.path.join(KW_DIR, "unprocessed.txt")
-PROCING = os.path.join(KW_DIR, "processing.txt")
-PROCED = os.path.join(KW_DIR, "processed.txt")
-FAILED = os.path.join(KW_DIR, "failed.txt")
 RUN_LOG = os.path.join(LOGS, "runs.log")
 
+# Keyword status lives in keywords_weekly/queue.sqlite (script/keyword_queue.py);
+# the unprocessed/processing/processed/failed.txt files are exports of it
+QUEUE = KeywordQueue("weekly")
+
 GEO = "LK"
 TZ = 330
 
@@ -36,100 +54,97 @@ WINDOW_YEARS = 5
 STEP_YEARS = 4
 START_DATE = datetime(2015, 1, 1)
 MAX_RETRIES = 5
-BACKOFF = 20
+BACKOFF = 20  # first 429 backoff; doubles with each further 429 in a row
+
+# ----------------- Concurrency configuration -----------------
+# Every request of the run (all windows of all keywords) goes through one throttle
+# controller, so more workers raise throughput only up to REQUESTS_PER_MINUTE.
+KEYWORDS_PER_RUN = int(os.environ.get("WEEKLY_KEYWORDS_PER_RUN", "1"))
+MAX_WORKERS = int(os.environ.get("WEEKLY_MAX_WORKERS", "3"))
+REQUESTS_PER_MINUTE = float(os.environ.get("WEEKLY_REQUESTS_PER_MINUTE", "12"))
+# Set TRENDS_FAKE_BACKEND=1 to run against script/fake_trends.py instead of Google
+FAKE_BACKEND = os.environ.get("TRENDS_FAKE_BACKEND", "") not in ("", "0")
+# TRENDS_BASE_URL=http://127.0.0.1:8765/trends sends pytrends to script/mock_trends_server.py
+if os.environ.get("TRENDS_BASE_URL"):
+    from mock_trends_server import point_pytrends
+    point_pytrends(os.environ["TRENDS_BASE_URL"])
+# On-disk response cache shared with the monthly fetcher (script/trends_cache.py)
+CACHE = default_cache()
+# One JSON line per Trends request in logs_weekly/requests.jsonl (script/telemetry.py)
+REQUESTS = telemetry.RequestLog("weekly", os.path.join(LOGS, "requests.jsonl"))
+
+# ----------------- Worker mode -----------------
+# --worker keeps claiming KEYWORDS_PER_RUN keywords at a time under a lease until the
+# wall-clock budget is spent; --shard i/N splits the queue between workers. A dead
+# worker's keywords go back to unprocessed once their lease expires.
+LEASE_MINUTES = 30
+BUDGET_MINUTES = 300
+
+# ----------------- Incremental refresh -----------------
+# A keyword with a stitched weekly file only fetches one trailing window that overlaps
+# it by at least INCREMENTAL_OVERLAP_WEEKS and is at least INCREMENTAL_WEEKS long;
+# new weeks are scaled onto the series. A poor overlap fit falls back to all windows.
+INCREMENTAL = os.environ.get("TRENDS_INCREMENTAL", "1") != "0"
+INCREMENTAL_WEEKS = 52
+INCREMENTAL_OVERLAP_WEEKS = 26
+
+# ----------------- Window checkpoints -----------------
+# Each window is written to CHECKPOINT_DIR/<safe_kw>/ as soon as Google answers it (empty
+# answers too, but not windows whose retries all failed), followed by a .done marker
+# with its row count and hash; a window only counts as fetched when both exist and
+# agree. A keyword interrupted by a crash, the job timeout or the circuit breaker
+# resumes from its checkpoints on the next claim, and so does one with a window whose
+# retries all ran out (failed as "network", so the retry policy decides when). The
+# directory is removed once the keyword is finished; checkpoints older than
+# CHECKPOINT_MAX_AGE_DAYS are refetched.
+CHECKPOINT_MAX_AGE_DAYS = float(os.environ.get("WEEKLY_CHECKPOINT_MAX_AGE_DAYS", "14"))
+
+# ----------------- Negative-cache re-probes -----------------
+# A keyword whose last failure was "empty" (or unclassified) costs one request to
+# re-check instead of a window per 4 years of history; see RETRY_POLICY in keyword_queue.py
+PROBE_CLASSES = ("empty", "unknown")
+
+# What a keyword's plan fetches: every window, one trailing window spliced onto the
+# stitched series (incremental refresh) or the latest window only (re-probe)
+FULL, TRAILING, PROBE = "full", "trailing", "probe"
 
 # ----------------- Small session/jitter config -----------------
-_USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15",
-    "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1"
-]
-MIN_JITTER = 1.0
-MAX_JITTER = 3.0
+# random pause before each online request; WEEKLY_JITTER=0 turns it off for local benchmarks
+MIN_JITTER = 1.0 * float(os.environ.get("WEEKLY_JITTER", "1"))
+MAX_JITTER = 3.0 * float(os.environ.get("WEEKLY_JITTER", "1"))
 
 # ----------------- Logging helpers -----------------
+_LOG_LOCK = threading.Lock()
+
 def log(msg):
     ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-    with open(RUN_LOG, "a", encoding="utf-8") as f:
-        f.write(f"{ts} - {msg}\n")
-    print(msg)
-
-def append_line(path, line):
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
-
-def read_lines(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return [l.rstrip("\n") for l in f if l.strip()]
-
-def pop_keyword():
-    lines = read_lines(UNPRO)
-    if not lines:
-        return None
-    first = lines[0]
-    with open(UNPRO, "w", encoding="utf-8") as f:
-        for l in lines[1:]:
-            f.write(l + "\n")
-    return first
-
-def save_status_move(keyword, target):
-    if os.path.exists(PROCING):
-        lines = read_lines(PROCING)
-        lines = [l for l in lines if l != keyword]
-        with open(PROCING, "w", encoding="utf-8") as f:
-            for l in lines:
-                f.write(l + "\n")
-    append_line(target, keyword)
+    with _LOG_LOCK:
+        with open(RUN_LOG, "a", encoding="utf-8") as f:
+            f.write(f"{ts} - {msg}\n")
+        print(msg)
 
 def sanitize_for_filename(name):
     s = "".join(c if c.isalnum() or c in (" ", "_") else "_" for c in name)
     s = s.strip()
     return s.replace(" ", "_") if s else "keyword"
 
-def _choose_user_agent():
-    return random.choice(_USER_AGENTS)
-
-def _sleep_jitter():
-    time.sleep(random.uniform(MIN_JITTER, MAX_JITTER))
-
-# ----------------- Fetch one window -----------------
-def fetch_window(kw_search, start, end, safe_kw):
-    start_adj = start - timedelta(days=(start.weekday() + 1) % 7)
-    end_adj = end + timedelta(days=(6 - end.weekday()) % 7)
-    timeframe = f"{start_adj:%Y-%m-%d} {end_adj:%Y-%m-%d}"
-
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            # Fresh pytrends session per window
-            ua = _choose_user_agent()
-            pytrends = TrendReq(hl="en-US", tz=TZ, requests_args={"headers": {"User-Agent": ua}})
-
-            _sleep_jitter()
-            pytrends.build_payload([kw_search], timeframe=timeframe, geo=GEO)
-            df = pytrends.interest_over_time()
-
-            full_idx = pd.date_range(start_adj, end_adj, freq="W-SUN")
-            if df is None or df.empty:
-                log(f"Window {start.date()}–{end.date()} empty")
-                return pd.DataFrame(index=full_idx, columns=[safe_kw])
+def make_trendreq(user_agent=None):
+    """New pytrends session with the given user agent (or the offline fake)."""
+    if FAKE_BACKEND:
+        from fake_trends import FakeTrendReq
+        return FakeTrendReq(hl="en-US", tz=TZ)
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    return TrendReq(hl="en-US", tz=TZ, requests_args=telemetry.requests_args({"headers": headers}))
 
-            if "isPartial" in df.columns:
-                df = df.drop(columns=["isPartial"])
+# warm sessions shared by all threads of the process; each new one takes the next
+# user agent of sessions.USER_AGENTS and a 429 retires it (script/sessions.py)
+SESSIONS = SessionPool(make_trendreq)
 
-            df = df.rename(columns={df.columns[0]: safe_kw})
-            df = df.reindex(full_idx)
-
-            log(f"Window {start.date()}–{end.date()} fetched, shape {df.shape}, non-null {int(df[safe_kw].notna().sum())}")
-            return df
-        except Exception as ex:
-            log(f"Exception fetching window {start.date()}–{end.date()} (attempt {attempt}): {ex}")
-            time.sleep(BACKOFF * attempt)
-    # final fallback
-    full_idx = pd.date_range(start_adj, end_adj, freq="W-SUN")
-    return pd.DataFrame(index=full_idx, columns=[safe_kw])
+# ----------------- Windows -----------------
+# fetch, retries and checkpoints are shared with the daily fetcher (script/window_fetch.py)
+CHECKPOINTS = Checkpoints(CHECKPOINT_DIR, max_age_days=CHECKPOINT_MAX_AGE_DAYS)
+WINDOWS = WindowFetcher(CHECKPOINTS, SESSIONS, CACHE, REQUESTS, log, TZ, GEO, "W-SUN",
+                        MAX_RETRIES, BACKOFF, (MIN_JITTER, MAX_JITTER))
 
 # ----------------- Compute windows -----------------
 def compute_windows():
@@ -143,83 +158,199 @@ def compute_windows():
         windows.append((cur, now))
     return windows
 
-# ----------------- Stitching -----------------
-def stitch_windows(windows_list):
-    if not windows_list:
-        return None
-    stitched = windows_list[0][0].copy().sort_index()
-    for i in range(1, len(windows_list)):
-        prev_df, prev_s, prev_e = windows_list[i - 1]
-        df, s, e = windows_list[i]
-        overlap_start = max(prev_s, s)
-        overlap_end = min(prev_e, e)
-        overlap_old = stitched.loc[overlap_start:overlap_end]
-        overlap_new = df.loc[overlap_start:overlap_end]
-        try:
-            cond = len(overlap_old.dropna()) > 0 and len(overlap_new.dropna()) > 0 and overlap_new.median().iloc[0] > 0
-        except Exception:
-            cond = False
-        if cond:
-            scale = overlap_old.median().iloc[0] / overlap_new.median().iloc[0]
-            df_scaled = df * scale
-        else:
-            df_scaled = df
-        tail = df_scaled.loc[prev_e + timedelta(days=1):]
-        stitched = pd.concat([stitched, tail])
-        stitched = stitched[~stitched.index.duplicated(keep="last")]
-    return stitched.sort_index()
-
 # ----------------- Main -----------------
-def main():
-    keyword = pop_keyword()
-    if not keyword:
-        log("No weekly keywords left.")
-        return
-
-    append_line(PROCING, keyword)
-    safe_kw = sanitize_for_filename(keyword)
-    kw_search = keyword.strip()
-    log(f"Fetching weekly keyword: {keyword}")
-
-    win_list = compute_windows()
-    if not win_list:
-        log("No windows computed")
-        save_status_move(keyword, FAILED)
-        return
-
-    collected = []
-    non_empty_count = 0
-    for (s, e) in win_list:
-        df = fetch_window(kw_search, s, e, safe_kw)
-        if int(df[safe_kw].notna().sum()) > 0:
-            non_empty_count += 1
-        collected.append((df, s, e))
-
+def finish_keyword(keyword, safe_kw, collected):
+    non_empty_count = sum(1 for (df, s, e) in collected if int(df[safe_kw].notna().sum()) > 0)
     if non_empty_count == 0:
         log(f"Keyword has NO data → FAIL: {keyword}")
-        save_status_move(keyword, FAILED)
+        CHECKPOINTS.clear(safe_kw)
+        QUEUE.fail(keyword, "no data")
         return
 
     # Save raw windows
     win_dir = os.path.join(RAW_WINDOWS, safe_kw)
     os.makedirs(win_dir, exist_ok=True)
-    for (df, s, e) in collected:
-        fname = f"{safe_kw}_{s.strftime('%Y%m%d')}_{e.strftime('%Y%m%d')}.csv"
-        df.to_csv(os.path.join(win_dir, fname))
+    with profiling.span("save"):
+        for (df, s, e) in collected:
+            fname = f"{safe_kw}_{s.strftime('%Y%m%d')}_{e.strftime('%Y%m%d')}.csv"
+            df.to_csv(os.path.join(win_dir, fname))
 
     # Stitch and save
-    stitched = stitch_windows(collected)
+    with profiling.span("stitch"):
+        stitched = stitch_windows(collected)
     if stitched is None:
         log("Stitching failed")
-        save_status_move(keyword, FAILED)
+        CHECKPOINTS.clear(safe_kw)
+        QUEUE.fail(keyword, "stitching failed")
         return
-    stitched.to_csv(os.path.join(RAW_WEEKLY, f"{safe_kw}_weekly.csv"))
+    out = os.path.join(RAW_WEEKLY, f"{safe_kw}_weekly.csv")
+    with profiling.span("save"):
+        stitched.to_csv(out)
+        Manifest.shared("weekly").record(keyword, out)
+    CHECKPOINTS.clear(safe_kw)
     log(f"Saved stitched weekly file for {keyword}")
-    save_status_move(keyword, PROCED)
+    QUEUE.complete(keyword)
+
+def trailing_window(stitched_file):
+    """(existing series, (start, end)) for an incremental refresh; window None if up to date."""
+    # round_trip: the exact values stitched, as restitch_weekly.py sees them
+    old = pd.read_csv(stitched_file, index_col=0, parse_dates=True, float_precision="round_trip").iloc[:, 0]
+    now = datetime.utcnow() - timedelta(days=1)
+    last = old.index.max().to_pydatetime()
+    if (now - last).days < 7:
+        return old, None
+    start = min(last - timedelta(weeks=INCREMENTAL_OVERLAP_WEEKS), now - timedelta(weeks=INCREMENTAL_WEEKS))
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    return old, (max(start, START_DATE), now)
+
+def finish_incremental(keyword, safe_kw, old, df, s, e):
+    """Splice a trailing window onto the stitched series. Returns False on a poor fit."""
+    with profiling.span("stitch"):
+        spliced, err = splice_trailing(old, df[safe_kw])
+    if spliced is None:
+        log(f"Incremental fit for {keyword} too poor (error {err:.2f}); refetching all windows")
+        return False
+    win_dir = os.path.join(RAW_WINDOWS, safe_kw)
+    os.makedirs(win_dir, exist_ok=True)
+    out = os.path.join(RAW_WEEKLY, f"{safe_kw}_weekly.csv")
+    with profiling.span("save"):
+        # marked as trailing: restitch_weekly.py splices these on instead of stitching them
+        df.to_csv(os.path.join(win_dir, f"{safe_kw}_{s.strftime('%Y%m%d')}_{e.strftime('%Y%m%d')}_trailing.csv"))
+        spliced.to_frame(safe_kw).to_csv(out)
+        Manifest.shared("weekly").record(keyword, out)
+    CHECKPOINTS.clear(safe_kw)
+    log(f"Incremental {keyword}: +{len(spliced) - len(old) + 1} weeks (fit error {err:.2f})")
+    QUEUE.complete(keyword)
+    return True
+
+def process_keywords(keywords, throttle, client_factory=SESSIONS, pool=None):
+    """Fetch, stitch and save claimed keywords. Returns False once the circuit
+    breaker has opened (the rest of the run should stop)."""
+    win_list = compute_windows()
+    plans = {}  # keyword -> (FULL/TRAILING/PROBE, windows to fetch, stitched series for TRAILING)
+    for keyword in keywords:
+        log(f"Fetching weekly keyword: {keyword}")
+        stitched_file = Manifest.shared("weekly").latest_file(keyword)
+        if INCREMENTAL and stitched_file:
+            old, window = trailing_window(stitched_file)
+            if window is None:
+                log(f"Already up to date: {keyword}")
+                QUEUE.complete(keyword)
+                continue
+            plans[keyword] = (TRAILING, [window], old)
+        elif not win_list:
+            log("No windows computed")
+            QUEUE.fail(keyword, "no windows")
+        elif QUEUE.last_failure(keyword) in PROBE_CLASSES:
+            log(f"Re-probing {keyword} (no data last time) with the latest window")
+            plans[keyword] = (PROBE, [win_list[-1]], None)
+        else:
+            plans[keyword] = (FULL, win_list, None)
+
+    interrupted = []
+    while plans:
+        # windows checkpointed by an earlier, interrupted attempt are not requested again
+        results, jobs = {}, []
+        for kw, (_, wins, _) in plans.items():
+            safe_kw = sanitize_for_filename(kw)
+            for (s, e) in wins:
+                job = (kw.strip(), safe_kw, s, e)
+                df = CHECKPOINTS.load(safe_kw, s, e)
+                if df is None:
+                    jobs.append(job)
+                else:
+                    results[job] = df
+        if results:
+            log(f"Resuming from {len(results)} checkpointed windows; {len(jobs)} to fetch")
+        with profiling.span("fetch"):
+            results.update(WINDOWS.fetch_many(jobs, throttle, client_factory, MAX_WORKERS, pool))
+        if throttle.tripped:
+            log(f"Circuit breaker open (error rate {throttle.error_rate():.0%}); ending run early")
+        fallback = {}
+        for keyword, (mode, wins, old) in plans.items():
+            safe_kw = sanitize_for_filename(keyword)
+            keys = [(keyword.strip(), safe_kw, s, e) for (s, e) in wins]
+            if not all(k in results for k in keys):
+                interrupted.append(keyword)
+            elif any(results[k] is None for k in keys):
+                # the windows that did arrive stay checkpointed for the retry
+                log(f"FAILED for {keyword}: {sum(results[k] is None for k in keys)} windows could not be fetched")
+                QUEUE.fail(keyword, "window fetch failed", "network")
+            elif mode == FULL:
+                finish_keyword(keyword, safe_kw, [(results[k], k[2], k[3]) for k in keys])
+            elif mode == PROBE:
+                if int(results[keys[0]][safe_kw].notna().sum()) == 0:
+                    log(f"Probe window still has NO data → FAIL: {keyword}")
+                    CHECKPOINTS.clear(safe_kw)
+                    QUEUE.fail(keyword, "no data (probe)", "empty")
+                else:
+                    log(f"Probe window for {keyword} has data; fetching all windows")
+                    fallback[keyword] = (FULL, win_list, None)
+            elif not finish_incremental(keyword, safe_kw, old, results[keys[0]], keys[0][2], keys[0][3]):
+                fallback[keyword] = (FULL, win_list, None)
+        plans = fallback
+    for keyword in reversed(interrupted):
+        QUEUE.requeue(keyword)
+        log(f"Re-queued: {keyword}")
+    return not (interrupted or throttle.tripped)
+
+def run_worker(shard=None, lease_minutes=LEASE_MINUTES, budget_minutes=BUDGET_MINUTES, max_keywords=None):
+    """Claim and process keywords until the queue (or shard) is empty, the budget is
+    spent or max_keywords have been claimed. Returns the number of keywords claimed.
+
+    One throttle, one thread pool and the session pool serve the whole run."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.time() + budget_minutes * 60
+    throttle = ThrottleController(REQUESTS_PER_MINUTE, base_backoff=BACKOFF)
+    done = 0
+    log(f"Worker {worker} started (shard {shard}, lease {lease_minutes:g} min, budget {budget_minutes:.0f} min)")
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        while time.time() < deadline:
+            n = max(KEYWORDS_PER_RUN, 1)
+            if max_keywords is not None:
+                n = min(n, max_keywords - done)
+                if n <= 0:
+                    break
+            with profiling.span("pop"):
+                keywords = QUEUE.claim(n, lease=lease_minutes * 60, shard=shard, worker=worker)
+            if not keywords:
+                log("No weekly keywords left for this worker.")
+                break
+            done += len(keywords)
+            with QUEUE.keep_alive(keywords, lease_minutes * 60, worker):
+                if not process_keywords(keywords, throttle, SESSIONS, pool):
+                    break
+        else:
+            log("Wall-clock budget spent.")
+    log(f"Worker {worker} finished after {done} keywords; {SESSIONS.summary()}")
+    return done
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Fetch weekly Google Trends keywords from the queue.")
+    ap.add_argument("--worker", action="store_true", help="keep claiming keywords until the budget is spent")
+    ap.add_argument("--shard", type=parse_shard, help="only take keywords of shard i of N (e.g. 0/4)")
+    ap.add_argument("--lease-minutes", type=float, default=LEASE_MINUTES)
+    ap.add_argument("--budget-minutes", type=float, default=BUDGET_MINUTES)
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker or args.shard:
+        run_worker(args.shard, args.lease_minutes, args.budget_minutes)
+        return
+    with profiling.span("pop"):
+        keywords = QUEUE.claim(max(KEYWORDS_PER_RUN, 1))
+    if not keywords:
+        log("No weekly keywords left.")
+        return
+    process_keywords(keywords, ThrottleController(REQUESTS_PER_MINUTE, base_backoff=BACKOFF))
 
 if __name__ == "__main__":
+    profiling.setup("fetch_weekly_one_keyword", "weekly")
     try:
         main()
     except Exception as e:
         log("Unexpected error: " + str(e))
         traceback.print_exc()
+    finally:
+        QUEUE.export_txt()
@@ -2,15 +2,19 @@
 # Merge processed weekly CSVs into a single wide CSV (date x keyword columns)
 
 import os
-import glob
+import sys
 import pandas as pd
 
 # ----------------------------
 # PATH SETUP
 # ----------------------------
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+from manifest import Manifest
+from incremental_merge import merge_columns, clear_state
+from keyword_queue import KeywordQueue
+import profiling
 KEYDIR = os.path.join(ROOT, "keywords_weekly")
-PROCED = os.path.join(KEYDIR, "processed.txt")
 
 RAW_WEEKLY = os.path.join(ROOT, "data_weekly", "raw_weekly")
 MERGED_DIR = os.path.join(ROOT, "data_weekly", "merged")
@@ -19,84 +23,76 @@ os.makedirs(MERGED_DIR, exist_ok=True)
 # ----------------------------
 # Helper Functions
 # ----------------------------
-def read_lines(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return [line.strip() for line in f if line.strip()]
-
 def safe_kw(kw):
     return kw.replace(" ", "_").replace("/", "_")
 
+def read_column(sk, latest_file):
+    try:
+        df = pd.read_csv(latest_file, index_col=0, parse_dates=True)
+
+        # ----------------------------
+        # 🔥 Critical Fix: Drop duplicates
+        # ----------------------------
+        df = df[~df.index.duplicated(keep="last")]
+
+        df.columns = [sk]
+        return df
+
+    except Exception as e:
+        print("Skipping", latest_file, "due to error:", e)
+        return None
+
 # ----------------------------
 # Main Merge Logic
 # ----------------------------
 def main():
-    processed = read_lines(PROCED)
+    processed = KeywordQueue("weekly").with_data()
     if not processed:
         print("No processed keywords. Removing merged dataset if exists.")
         out = os.path.join(MERGED_DIR, "weekly_dataset.csv")
         if os.path.exists(out):
             os.remove(out)
+            clear_state(out)
             print("Removed merged weekly dataset.")
         return
 
-    dfs = []
+    columns = []
     missing = []
+    manifest = Manifest.load("weekly")
 
     for kw in sorted(processed):
         sk = safe_kw(kw)
-        pattern = os.path.join(RAW_WEEKLY, f"{sk}_*.csv")
-        files = glob.glob(pattern)
+        # Latest stitched file, from the manifest (see script/manifest.py)
+        latest_file = manifest.latest_file(kw)
 
-        if not files:
+        if not latest_file:
             missing.append(kw)
             print("No stitched weekly file found for keyword:", kw)
             continue
+        columns.append((sk, latest_file, manifest.get(kw)))
 
-        # Use latest stitched file
-        latest_file = max(files, key=lambda p: os.path.getmtime(p))
-
-        try:
-            df = pd.read_csv(latest_file, index_col=0, parse_dates=True)
-
-            # ----------------------------
-            # 🔥 Critical Fix: Drop duplicates
-            # ----------------------------
-            df = df[~df.index.duplicated(keep="last")]
-
-            df.columns = [sk]
-            dfs.append(df)
-
-        except Exception as e:
-            print("Skipping", latest_file, "due to error:", e)
-
-    if not dfs:
+    if not columns:
         print("No dataframes to merge. All missing or unreadable.")
         return
 
     # ----------------------------
-    # Merge all keywords into one wide dataset
-    # ----------------------------
-    merged = pd.concat(dfs, axis=1)
-
-    # ----------------------------
-    # 🔥 Global deduplication (safety net)
-    # ----------------------------
-    merged = merged[~merged.index.duplicated(keep="last")]
-
-    # Sort index (should already be weekly Sundays)
-    merged.sort_index(inplace=True)
-
-    # ----------------------------
-    # Save result
+    # Merge all keywords into one wide dataset; only stitched files whose
+    # content hash changed since the last merge are re-read and patched in
+    # (full rebuild dedups the index globally as a safety net)
     # ----------------------------
     out_path = os.path.join(MERGED_DIR, "weekly_dataset.csv")
-    merged.to_csv(out_path)
-    print("Weekly merged dataset saved to:", out_path)
+    status = merge_columns(columns, out_path, read_column)
+    if status == "unchanged":
+        print("Weekly merged dataset unchanged:", out_path)
+    elif status == "empty":
+        print("No dataframes to merge. All missing or unreadable.")
+    else:
+        print(f"Weekly merged dataset saved to ({status}):", out_path)
 
     if missing:
         print("\nMissing stitched files for:", missing)
 
 if __name__ == "__main__":
-    main()
+    profiling.setup("merge_weekly", "weekly")
+    with profiling.span("merge"):
+        main()
@@ -0,0 +1,162 @@
+# script_weekly/restitch_weekly.py
+# Offline re-stitch of the whole data_weekly/raw_windows corpus (no network requests).
+# - every directory under raw_windows/ is one keyword; window bounds are parsed from
+#   the file names (<safe_kw>_<YYYYmmdd>_<YYYYmmdd>.csv)
+# - windows covered by a longer window of the same keyword and kind (old open windows
+#   after a refetch) are ignored; a trailing window never hides a regular one
+# - incremental trailing windows (<safe_kw>_<start>_<end>_trailing.csv) are spliced onto
+#   the stitched series in order with incremental.splice_trailing, the rule the weekly
+#   fetcher used when it saved them, so a restitch reproduces the fetcher's output
+# - keywords are stitched on a process pool and each output is replaced atomically
+# - keywords whose window files (and the stitching rule) are unchanged since the last
+#   restitch are skipped; state is kept in data_weekly/restitch_state.json
+# Run script_weekly/merge_weekly.py afterwards to refresh the merged dataset.
+#
+# Usage: python script_weekly/restitch_weekly.py [--force] [--workers N] [--dry-run] [--profile] [keyword_dir ...]
+
+import argparse, json, os, re, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+from manifest import Manifest, file_sha256
+from keyword_queue import KeywordQueue, STATUSES
+from stitching import stitch_windows
+from incremental import splice_trailing
+import profiling
+
+RAW_WINDOWS = os.path.join(ROOT, "data_weekly", "raw_windows")
+RAW_WEEKLY = os.path.join(ROOT, "data_weekly", "raw_weekly")
+STATE = os.path.join(ROOT, "data_weekly", "restitch_state.json")
+
+# bump when the stitching rule changes so every keyword is redone
+STITCH_RULE = "median-ratio/v1+trailing-splice"
+WINDOW_NAME = re.compile(r"_(\d{8})_(\d{8})(_trailing)?\.csv$")
+
+def sanitize_for_filename(name):
+    s = "".join(c if c.isalnum() or c in (" ", "_") else "_" for c in name)
+    return s.strip().replace(" ", "_")
+
+def window_files(kw_dir):
+    """[(path, start, end, trailing)] of a keyword directory, superseded windows dropped
+    (only by a longer window of the same kind)."""
+    found = []
+    for name in os.listdir(kw_dir):
+        m = WINDOW_NAME.search(name)
+        if m:
+            s, e = (datetime.strptime(x, "%Y%m%d") for x in m.groups()[:2])
+            found.append((os.path.join(kw_dir, name), s, e, bool(m.group(3))))
+    found.sort(key=lambda w: (w[1], w[2]))
+    return [w for w in found
+            if not any(o is not w and o[3] == w[3] and o[1] <= w[1] and o[2] >= w[2]
+                       and (o[1], o[2]) != (w[1], w[2]) for o in found)]
+
+def input_hashes(kw_dir):
+    return {os.path.basename(p): file_sha256(p) for p, _, _, _ in window_files(kw_dir)}
+
+def restitch_one(kw_dir):
+    """Stitch one keyword directory into raw_weekly/. Runs in a pool process.
+    Returns (safe_kw, output path or None, message)."""
+    safe_kw = os.path.basename(kw_dir.rstrip(os.sep))
+    windows, trailing = [], []
+    for path, s, e, is_trailing in window_files(kw_dir):
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        df.columns = [safe_kw]
+        (trailing if is_trailing else windows).append((df, s, e))
+    if not windows:
+        return safe_kw, None, "no window files"
+    if not any(df[safe_kw].notna().any() for df, _, _ in windows):
+        return safe_kw, None, "no data"
+    stitched = stitch_windows(windows)
+    spliced = 0
+    for df, _, _ in sorted(trailing, key=lambda w: w[2]):
+        series, last = stitched[safe_kw], df[safe_kw].last_valid_index()
+        if last is None or last <= series.index.max():
+            continue  # nothing past the series (fetched before a later full refetch)
+        out_series, _ = splice_trailing(series, df[safe_kw])
+        if out_series is not None:
+            stitched = out_series.to_frame(safe_kw)
+            spliced += 1
+    out = os.path.join(RAW_WEEKLY, f"{safe_kw}_weekly.csv")
+    tmp = f"{out}.tmp{os.getpid()}"
+    stitched.to_csv(tmp)
+    os.replace(tmp, out)
+    return safe_kw, out, f"{len(windows)} windows + {spliced} trailing, {len(stitched)} weeks"
+
+def load_state():
+    if not os.path.exists(STATE):
+        return {}
+    with open(STATE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state):
+    tmp = STATE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, STATE)
+
+def keywords_by_safe_name(manifest):
+    """safe_kw -> keyword, from the manifest and the weekly queue."""
+    queue = KeywordQueue("weekly")
+    try:
+        queued = {kw for status in STATUSES for kw in queue.keywords(status)}
+    finally:
+        queue.close()
+    names = {}
+    for kw in set(manifest.entries) | queued:
+        names.setdefault(sanitize_for_filename(kw), kw)
+    return names
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Re-stitch data_weekly/raw_windows without fetching.")
+    ap.add_argument("dirs", nargs="*", help="keyword directory names (default: all)")
+    ap.add_argument("--force", action="store_true", help="restitch unchanged keywords too")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--dry-run", action="store_true", help="only list what would be restitched")
+    args = ap.parse_args(argv)
+
+    t0 = time.time()
+    names = args.dirs or sorted(d for d in os.listdir(RAW_WINDOWS) if os.path.isdir(os.path.join(RAW_WINDOWS, d)))
+    state = load_state()
+    todo, hashes = [], {}
+    with profiling.span("scan"):
+        for name in names:
+            kw_dir = os.path.join(RAW_WINDOWS, name)
+            hashes[name] = input_hashes(kw_dir)
+            prev = state.get(name, {})
+            out = os.path.join(RAW_WEEKLY, f"{name}_weekly.csv")
+            unchanged = (prev.get("inputs") == hashes[name] and prev.get("rule") == STITCH_RULE
+                         and os.path.exists(out) and prev.get("output_sha256") == file_sha256(out))
+            if args.force or not unchanged:
+                todo.append(kw_dir)
+    print(f"{len(names)} keyword directories, {len(todo)} to restitch, {len(names) - len(todo)} unchanged")
+    if args.dry_run or not todo:
+        return
+
+    manifest = Manifest.shared("weekly")
+    keywords = keywords_by_safe_name(manifest)
+    done = failed = 0
+    with profiling.span("stitch"), ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for safe_kw, out, msg in pool.map(restitch_one, todo, chunksize=8):
+            if out is None:
+                failed += 1
+                print(f"Skipped {safe_kw}: {msg}")
+                continue
+            done += 1
+            state[safe_kw] = {"inputs": hashes[safe_kw], "rule": STITCH_RULE, "output_sha256": file_sha256(out)}
+            keyword = keywords.get(safe_kw)
+            if keyword is None:
+                print(f"Restitched {safe_kw} ({msg}); no keyword in the manifest or queue for it")
+            else:
+                manifest.record(keyword, out, save=False)
+    with profiling.span("save"):
+        manifest.save()
+        save_state(state)
+    print(f"Restitched {done} keywords ({failed} skipped) in {time.time() - t0:.1f}s")
+
+if __name__ == "__main__":
+    profiling.setup("restitch_weekly", "weekly")
+    main()
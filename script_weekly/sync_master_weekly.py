@@ -3,11 +3,17 @@
 # Prepares unprocessed/processing/processed/failed files for weekly fetching
 
 import os
+import sys
 
 # ----------------------------
 # PATH SETUP
 # ----------------------------
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+from manifest import Manifest
+from keyword_queue import KeywordQueue
+from scheduler import reschedule
+import profiling
 KEYDIR = os.path.join(ROOT, "keywords_weekly")
 
 MASTER = os.path.join(KEYDIR, "master_keywords.txt")
@@ -19,6 +25,7 @@ FAILED = os.path.join(KEYDIR, "failed.txt")
 
 RAW_WINDOWS = os.path.join(ROOT, "data_weekly", "raw_windows")
 RAW_WEEKLY = os.path.join(ROOT, "data_weekly", "raw_weekly")
+CHECKPOINTS = os.path.join(ROOT, "data_weekly", "checkpoints")
 MERGED_DIR = os.path.join(ROOT, "data_weekly", "merged")
 
 os.makedirs(RAW_WINDOWS, exist_ok=True)
@@ -35,22 +42,25 @@ def read_set(path):
     with open(path, "r", encoding="utf-8") as f:
         return {line.strip() for line in f if line.strip()}
 
-def write_set(path, s):
-    """Write set to file, ensuring file exists and flush to disk"""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        for kw in sorted(s):
-            f.write(kw + "\n")
-        f.flush()
-        os.fsync(f.fileno())
-    # DEBUG: confirm file contents
-    with open(path, "r", encoding="utf-8") as f:
-        lines = f.read().splitlines()
-    print(f"DEBUG: {path} written, {len(lines)} lines")
-
 def safe_kw(kw):
     return kw.replace(" ", "_").replace("/", "_")
 
+def sanitize_for_filename(name):
+    # same naming as the fetcher's window checkpoints
+    s = "".join(c if c.isalnum() or c in (" ", "_") else "_" for c in name)
+    return s.strip().replace(" ", "_")
+
+def delete_checkpoints(keyword):
+    """Remove the window checkpoints of an unfinished fetch (see fetch_weekly_one_keyword.py)."""
+    folder = os.path.join(CHECKPOINTS, sanitize_for_filename(keyword))
+    if not os.path.isdir(folder):
+        return []
+    deleted = [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+    for p in deleted:
+        os.remove(p)
+    os.rmdir(folder)
+    return deleted
+
 def delete_raw_files_for_keyword(keyword):
     sk = safe_kw(keyword)
     deleted = []
@@ -65,12 +75,15 @@ def delete_raw_files_for_keyword(keyword):
                 deleted.append(p)
         os.rmdir(folder)
 
+    deleted += delete_checkpoints(keyword)
+
     # Delete stitched weekly file
     weekly_file = os.path.join(RAW_WEEKLY, f"{sk}_weekly.csv")
     if os.path.exists(weekly_file):
         os.remove(weekly_file)
         deleted.append(weekly_file)
 
+    Manifest.load("weekly").remove(keyword)
     return deleted
 
 # ----------------------------
@@ -83,10 +96,18 @@ def main():
         return
 
     master = read_set(MASTER)
-    unpro = read_set(UNPRO)
-    processing = read_set(PROCING)
-    processed = read_set(PROCED)
-    failed = read_set(FAILED)
+    # status comes from the SQLite keyword queue (script/keyword_queue.py)
+    queue = KeywordQueue("weekly")
+    reclaimed = queue.reclaim_expired()
+    if reclaimed:
+        print(f"Returned {reclaimed} keywords with an expired lease to the queue")
+    released = queue.release_due()
+    if released:
+        print(f"Returned {released} failed keywords due for a retry to unprocessed")
+    unpro = set(queue.keywords("unprocessed"))
+    processing = set(queue.keywords("processing"))
+    processed = set(queue.keywords("processed"))
+    failed = set(queue.keywords("failed"))
 
     print("=== Weekly Sync Report ===")
     print(f"Master: {len(master)} | unprocessed: {len(unpro)} | processing: {len(processing)} | processed: {len(processed)} | failed: {len(failed)}")
@@ -95,7 +116,7 @@ def main():
     # 1) Add new keywords from master → unprocessed
     # ----------------------------------
     added = []
-    for kw in master:
+    for kw in sorted(master):
         if kw not in unpro and kw not in processing and kw not in processed and kw not in failed:
             unpro.add(kw)
             added.append(kw)
@@ -112,6 +133,8 @@ def main():
     removed_failed = [kw for kw in failed if kw not in master]
     for kw in removed_failed:
         failed.remove(kw)
+    for kw in removed_unpro + removed_failed:
+        delete_checkpoints(kw)
 
     removed_processed = []
     for kw in list(processed):
@@ -124,12 +147,15 @@ def main():
             removed_processed.append((kw, deleted_files))
 
     # ----------------------------------
-    # 3) Save all sets at the end with flush
+    # 3) Apply to the queue, then export the .txt files for humans
     # ----------------------------------
-    write_set(UNPRO, unpro)
-    write_set(PROCING, processing)
-    write_set(PROCED, processed)
-    write_set(FAILED, failed)
+    queue.add(added)
+    queue.remove(removed_unpro + removed_failed + [kw for kw, _ in removed_processed])
+    # priorities and refresh times for the fetchers' claims (script/scheduler.py)
+    reschedule("weekly", queue)
+    print(f"Scheduled {len(queue.due())} keywords to fetch (unprocessed or due for a refresh)")
+    queue.export_txt()
+    print(", ".join(f"{status}: {n}" for status, n in queue.counts().items()))
 
     if removed_unpro:
         print("Removed from unprocessed:", removed_unpro)
@@ -145,4 +171,6 @@ def main():
     print("=== Weekly Sync Complete ===")
 
 if __name__ == "__main__":
-    main()
+    profiling.setup("sync_master_weekly", "weekly")
+    with profiling.span("sync"):
+        main()
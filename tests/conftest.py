@@ -0,0 +1,7 @@
+# Shared pytest setup: the pipeline modules import each other by bare name, the way
+# the scripts run them (python script/<module>.py), so both script dirs go on sys.path.
+import os, sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for d in ("script", "script_weekly"):
+    sys.path.insert(0, os.path.join(ROOT, d))
@@ -0,0 +1,52 @@
+import importlib
+import pytest
+import keyword_queue, telemetry
+from fake_trends import FakeTrendReq
+from sessions import SessionPool
+
+KEYWORDS = ["tea", "Colombo hotel", "Bentota hotel", "Kandy", "Ella train", "Galle fort", "Sigiriya",
+            "Mirissa whale", "Nuwara Eliya", "Yala safari", "Arugam Bay", "Jaffna", "Trincomalee",
+            "Negombo beach", "Dambulla", "Hikkaduwa", "Adams Peak", "Polonnaruwa", "Unawatuna", "Hatton"]
+
+class Throttle:
+    tripped = False
+
+    def before_request(self):
+        pass
+
+    def record_success(self):
+        pass
+
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    # the fetcher opens its queue on import; keep it out of keywords_monthly/
+    monkeypatch.setitem(keyword_queue.PIPELINES, "monthly", (str(tmp_path), None))
+    module = importlib.import_module("fetch_one_keyword")
+    monkeypatch.setattr(module, "FAKE_BACKEND", True)
+    monkeypatch.setattr(module, "SESSIONS", SessionPool(module.make_trendreq, user_agents=None))
+    monkeypatch.setattr(module, "CACHE", None)
+    monkeypatch.setattr(module, "THROTTLE", Throttle())
+    monkeypatch.setattr(module, "REQUESTS", telemetry.RequestLog("monthly", str(tmp_path / "requests.jsonl"), enabled=False))
+    monkeypatch.setattr(module, "RUN_LOG", str(tmp_path / "runs.log"))
+    FakeTrendReq.configure()
+    return module
+
+def test_batches_take_fewer_requests_than_keywords(fetcher):
+    results = {}
+    for i in range(0, len(KEYWORDS), fetcher.BATCH_SIZE):
+        fetcher.fetch_batch(KEYWORDS[i:i + fetcher.BATCH_SIZE], results)
+    batched = FakeTrendReq.calls
+    assert "refetching as" in open(fetcher.RUN_LOG, encoding="utf-8").read()  # some were drowned out
+    # refetching every drowned-out keyword alone took 20 requests for these 20
+    assert batched <= 0.8 * len(KEYWORDS)
+
+    for kw in KEYWORDS:
+        df, status = results[kw]
+        alone, _ = fetcher.fetch_keyword(kw)
+        assert status == "ok"
+        assert (df[fetcher.safe_name(kw)] - alone[fetcher.safe_name(kw)]).abs().max() <= 2
+    assert FakeTrendReq.calls - batched == len(KEYWORDS)
+
+def test_similar_volume_groups(fetcher):
+    groups = fetcher.similar_volume_groups({"a": 70, "b": 60, "c": 50, "d": 12, "e": 10, "f": 0})
+    assert groups == [["a", "b"], ["c"], ["d", "e"], ["f"]]
@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import columnar_store
+from incremental_merge import merge_columns, load_state
+from manifest import file_sha256
+
+def _read(name, path):
+    df = pd.read_csv(path, index_col=0, parse_dates=True)
+    df.columns = [name]
+    return df
+
+def _save(tmp_path, name, series):
+    path = str(tmp_path / f"{name}.csv")
+    series.rename(name).to_csv(path)
+    info = {"sha256": file_sha256(path), "start": str(series.index.min().date()),
+            "end": str(series.index.max().date()), "rows": len(series)}
+    return name, path, info
+
+@pytest.fixture
+def inputs(tmp_path):
+    weeks = pd.date_range("2020-01-05", periods=60, freq="W-SUN", name="date")
+    rng = np.random.default_rng(1)
+    return {
+        "ints": pd.Series(rng.integers(0, 101, 60), index=weeks),
+        "short": pd.Series(rng.integers(0, 101, 30), index=weeks[10:40]),
+        "floats": pd.Series(rng.random(50) * 100, index=weeks[5:55]),
+    }
+
+def _columns(tmp_path, inputs):
+    return [_save(tmp_path, name, s) for name, s in inputs.items()]
+
+def _rebuilt(tmp_path, columns):
+    # a full rebuild of the same inputs, for comparison
+    out = str(tmp_path / "rebuilt" / "merged.csv")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    assert merge_columns(columns, out, _read) == "rebuilt"
+    return open(out, "rb").read()
+
+def test_patch_matches_full_rebuild(tmp_path, inputs):
+    out = str(tmp_path / "merged.csv")
+    assert merge_columns(_columns(tmp_path, inputs), out, _read) == "rebuilt"
+    assert merge_columns(_columns(tmp_path, inputs), out, _read) == "unchanged"
+    # a refresh extends one series and a new keyword arrives
+    weeks = pd.date_range("2020-01-05", periods=64, freq="W-SUN", name="date")
+    inputs["ints"] = pd.Series(np.arange(64) % 101, index=weeks)
+    inputs["new"] = pd.Series(np.linspace(0, 1, 20) / 3, index=weeks[44:])
+    columns = _columns(tmp_path, inputs)
+    assert merge_columns(columns, out, _read) == "patched"
+    assert open(out, "rb").read() == _rebuilt(tmp_path, columns)
+    assert columnar_store.is_current(out)
+    assert load_state(out)["inputs"]["ints"]["integer"]
+
+def test_patch_never_parses_the_merged_csv(tmp_path, inputs, monkeypatch):
+    out = str(tmp_path / "merged.csv")
+    merge_columns(_columns(tmp_path, inputs), out, _read)
+    inputs["short"] = inputs["short"] + 1
+    parsed = []
+    def read(name, path):
+        parsed.append(path)
+        return _read(name, path)
+    assert merge_columns(_columns(tmp_path, inputs), out, read) == "patched"
+    assert parsed == [str(tmp_path / "short.csv")]
+
+@pytest.mark.parametrize("break_it", ["state", "output", "store", "shrink"])
+def test_falls_back_to_rebuild(tmp_path, inputs, break_it):
+    out = str(tmp_path / "merged.csv")
+    merge_columns(_columns(tmp_path, inputs), out, _read)
+    inputs["floats"] = inputs["floats"] * 0.5
+    if break_it == "state":
+        os.remove(os.path.splitext(out)[0] + ".state.json")
+    elif break_it == "output":
+        with open(out, "a") as f:
+            f.write("2030-01-06,1,2,3\n")
+    elif break_it == "store":
+        columnar_store.remove(out)
+    else:
+        inputs["ints"] = inputs["ints"].iloc[5:]
+    columns = _columns(tmp_path, inputs)
+    assert merge_columns(columns, out, _read) == "rebuilt"
+    assert open(out, "rb").read() == _rebuilt(tmp_path, columns)
@@ -0,0 +1,145 @@
+import time
+import pytest
+import keyword_queue
+from keyword_queue import KeywordQueue
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setitem(keyword_queue.PIPELINES, "weekly", (str(tmp_path), "master_keywords.txt"))
+    q = KeywordQueue("weekly")
+    yield q
+    q.close()
+
+def _expire(queue, keyword):
+    queue.conn.execute("UPDATE keywords SET lease_until = ? WHERE keyword = ?", (time.time() - 1, keyword))
+
+def test_claim_takes_queue_order_and_never_twice(queue):
+    queue.add(["a", "b", "c"])
+    assert queue.claim(2, worker="w1") == ["a", "b"]
+    assert queue.claim(2, worker="w2") == ["c"]
+    assert queue.claim(2) == []
+    assert queue.counts()["processing"] == 3
+    assert queue.info("a")["worker"] == "w1"
+
+def test_claim_respects_shards(queue):
+    words = [f"kw{i}" for i in range(20)]
+    queue.add(words)
+    shards = [set(queue.claim(20, shard=(i, 3))) for i in range(3)]
+    assert set().union(*shards) == set(words)
+    assert sum(len(s) for s in shards) == len(words)
+    for i, taken in enumerate(shards):
+        assert all(keyword_queue.shard_key(kw) % 3 == i for kw in taken)
+
+def test_complete_and_priority_order(queue):
+    queue.add(["a", "b"])
+    queue.schedule([("b", 5.0, None), ("a", 1.0, None)])
+    assert queue.claim() == ["b"]
+    queue.complete("b")
+    assert queue.info("b")["status"] == "processed"
+    assert queue.info("b")["has_data"] == 1
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.add(["a", "b"])
+    queue.claim(2, lease=60, worker="dead")
+    _expire(queue, "a")
+    assert queue.reclaim_expired() == 1
+    assert queue.status_of("a") == "unprocessed"
+    assert queue.status_of("b") == "processing"
+    assert queue.claim(worker="w2") == ["a"]
+
+def test_reclaim_keeps_keywords_with_data_processed(queue):
+    # a refresh of an existing keyword whose worker died must not drop it from the merge
+    queue.add(["a"])
+    queue.complete(queue.claim()[0])
+    queue.schedule([("a", 1.0, time.time() - 1)])
+    assert queue.claim(lease=60) == ["a"]
+    _expire(queue, "a")
+    assert queue.reclaim_expired() == 1
+    info = queue.info("a")
+    assert info["status"] == "processed"
+    assert info["due_at"] <= time.time()
+    assert queue.claim() == ["a"]
+
+def test_renew_extends_only_own_lease(queue):
+    queue.add(["a"])
+    queue.claim(lease=60, worker="w1")
+    before = queue.info("a")["lease_until"]
+    queue.renew(["a"], 600, worker="w2")
+    assert queue.info("a")["lease_until"] == before
+    queue.renew(["a"], 600, worker="w1")
+    assert queue.info("a")["lease_until"] > before + 500
+
+def test_fail_schedules_retry_by_class(queue):
+    queue.add(["a", "b"])
+    queue.claim(2)
+    queue.fail("a", "The request failed: Google returned a response with code 429")
+    queue.fail("b", "no data")
+    a, b = queue.info("a"), queue.info("b")
+    assert (a["status"], a["failure_class"], a["failures"]) == ("failed", "throttled", 1)
+    assert b["failure_class"] == "empty"
+    assert b["retry_at"] - b["updated_at"] == pytest.approx(keyword_queue.NEGATIVE_TTL)
+    # failed keywords are not claimed before their retry time, then come back
+    assert queue.claim() == []
+    queue.conn.execute("UPDATE keywords SET retry_at = ? WHERE keyword = 'a'", (time.time() - 1,))
+    assert queue.claim() == ["a"]
+    # a second failure of the same class in a row doubles the delay
+    queue.fail("a", "429 Too Many Requests")
+    a2 = queue.info("a")
+    assert a2["failures"] == 2
+    assert a2["retry_at"] - a2["updated_at"] == pytest.approx(keyword_queue.retry_delay("throttled", 2))
+
+def test_failed_refresh_keeps_data(queue):
+    queue.add(["a"])
+    queue.complete(queue.claim()[0])
+    queue.schedule([("a", 1.0, time.time() - 1)])
+    queue.claim()
+    queue.fail("a", "Connection timed out")
+    info = queue.info("a")
+    assert info["status"] == "processed"
+    assert info["due_at"] == info["retry_at"]
+
+def test_requeue_front_and_back(queue):
+    queue.add(["a", "b", "c"])
+    assert queue.claim(3) == ["a", "b", "c"]
+    queue.requeue("c")
+    queue.requeue("a", front=False)
+    queue.requeue("b")
+    assert queue.keywords("unprocessed") == ["b", "c", "a"]
+    assert queue.claim(3) == ["b", "c", "a"]
+
+def test_requeue_of_refresh_stays_processed(queue):
+    queue.add(["a"])
+    queue.complete(queue.claim()[0])
+    queue.schedule([("a", 1.0, time.time() - 1)])
+    queue.claim()
+    queue.requeue("a")
+    assert queue.status_of("a") == "processed"
+    assert queue.claim() == ["a"]
+
+def test_merge_membership_follows_data_not_lease(queue):
+    queue.add(["refreshing", "new", "failed_refresh"])
+    for kw in queue.claim(3):
+        if kw != "new":
+            queue.complete(kw)
+    queue.schedule([("refreshing", 1.0, time.time() - 1), ("failed_refresh", 1.0, time.time() - 1)])
+    assert queue.claim(2) == ["refreshing", "failed_refresh"]
+    queue.fail("failed_refresh", "Connection timed out")
+    # "refreshing" is leased by a worker and "new" has never finished
+    assert queue.keywords("processed") == ["failed_refresh"]
+    assert queue.with_data() == ["refreshing", "failed_refresh"]
+
+def test_first_open_imports_the_txt_exports(tmp_path, monkeypatch):
+    monkeypatch.setitem(keyword_queue.PIPELINES, "weekly", (str(tmp_path), "master_keywords.txt"))
+    (tmp_path / "processed.txt").write_text("done\n", encoding="utf-8")
+    (tmp_path / "unprocessed.txt").write_text("b\na\n\n", encoding="utf-8")
+    (tmp_path / "failed.txt").write_text("broken\n", encoding="utf-8")
+    q = KeywordQueue("weekly")
+    try:
+        assert q.keywords("unprocessed") == ["b", "a"]
+        # processed keywords keep their data through a rebuilt queue
+        assert q.with_data() == ["done"]
+        assert q.info("broken")["failure_class"] == "unknown"
+        q.export_txt()
+        assert (tmp_path / "unprocessed.txt").read_text(encoding="utf-8") == "b\na\n"
+    finally:
+        q.close()
@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+import manifest
+
+def _dataset(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    keywords = tmp_path / "all_keywords.txt"
+    keywords.write_text("Colombo hotel\nColombo\n", encoding="utf-8")
+    monkeypatch.setitem(manifest.DATASETS, "monthly", (
+        str(tmp_path / "manifest.json"), str(raw), [str(keywords)], manifest.DATASETS["monthly"][3]))
+    monkeypatch.setitem(manifest.DATASETS, "weekly", (
+        str(tmp_path / "weekly.json"), str(raw), [str(keywords)], manifest.DATASETS["weekly"][3]))
+    return raw
+
+def _write(path, freq, periods, end):
+    idx = pd.date_range(end=end, periods=periods, freq=freq, name="date")
+    pd.DataFrame({"v": range(periods)}, index=idx).to_csv(path)
+
+def test_rebuild_takes_fetch_time_from_file_name(tmp_path, monkeypatch):
+    raw = _dataset(tmp_path, monkeypatch)
+    _write(raw / "Colombo_hotel_20251218_0456.csv", "MS", 12, "2025-11-01")
+    _write(raw / "Colombo_hotel_20250101_0000.csv", "MS", 12, "2024-12-01")
+    _write(raw / "Colombo_20251101_1200.csv", "MS", 12, "2025-10-01")
+    m = manifest.rebuild("monthly")
+    # latest file per keyword, and no prefix mix-up between Colombo and Colombo hotel
+    assert m.get("Colombo hotel")["file"].endswith("Colombo_hotel_20251218_0456.csv")
+    assert m.get("Colombo hotel")["updated"] == "2025-12-18T04:56:00Z"
+    assert m.get("Colombo")["updated"] == "2025-11-01T12:00:00Z"
+
+def test_rebuild_without_timestamp_uses_data_end(tmp_path, monkeypatch):
+    raw = _dataset(tmp_path, monkeypatch)
+    _write(raw / "Colombo_weekly.csv", "W-SUN", 10, "2025-11-30")
+    m = manifest.rebuild("weekly")
+    # one week past the last week, not the time of the rebuild
+    assert m.get("Colombo")["updated"] == "2025-12-07T00:00:00Z"
+    assert os.path.exists(tmp_path / "weekly.json")
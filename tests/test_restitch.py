@@ -0,0 +1,42 @@
+import os, shutil
+import pandas as pd
+import restitch_weekly
+from conftest import ROOT
+from incremental import splice_trailing
+
+FIXTURE = os.path.join(ROOT, "data_weekly", "raw_windows", "Bentota_hotel")
+
+def test_restitch_reproduces_incremental_splice(tmp_path, monkeypatch):
+    kw_dir = tmp_path / "raw_windows" / "Bentota_hotel"
+    shutil.copytree(FIXTURE, kw_dir)
+    monkeypatch.setattr(restitch_weekly, "RAW_WEEKLY", str(tmp_path))
+    _, base_path, _ = restitch_weekly.restitch_one(str(kw_dir))
+
+    # what the fetcher does on a refresh: read the stitched file, fetch a trailing
+    # window on its own scale with one new week, splice it on, save both
+    old = pd.read_csv(base_path, index_col=0, parse_dates=True, float_precision="round_trip").iloc[:, 0]
+    recent = old.dropna().iloc[-60:] * 0.7
+    new_week = old.index.max() + pd.Timedelta(weeks=1)
+    window = pd.concat([recent, pd.Series([recent.iloc[-1]], index=[new_week])]).round()
+    window = window.to_frame("Bentota_hotel")
+    s, e = window.index.min(), window.index.max()
+    window.to_csv(kw_dir / f"Bentota_hotel_{s:%Y%m%d}_{e:%Y%m%d}_trailing.csv")
+    spliced, _ = splice_trailing(old, window["Bentota_hotel"])
+    assert spliced is not None
+    fetcher_out = tmp_path / "fetcher.csv"
+    spliced.to_frame("Bentota_hotel").to_csv(fetcher_out)
+
+    _, out, msg = restitch_weekly.restitch_one(str(kw_dir))
+    assert "1 trailing" in msg
+    assert open(out, "rb").read() == fetcher_out.read_bytes()
+
+def test_trailing_window_never_supersedes_a_regular_one(tmp_path):
+    kw_dir = tmp_path / "Bentota_hotel"
+    kw_dir.mkdir()
+    names = ["Bentota_hotel_20150101_20200101.csv", "Bentota_hotel_20190101_20240101.csv",
+             "Bentota_hotel_20230101_20250301.csv", "Bentota_hotel_20221001_20250601_trailing.csv",
+             "Bentota_hotel_20230101_20250101.csv"]  # an older open window: superseded
+    for name in names:
+        (kw_dir / name).write_text("date,Bentota_hotel\n")
+    kept = [os.path.basename(p) for p, _, _, _ in restitch_weekly.window_files(str(kw_dir))]
+    assert kept == [names[0], names[1], names[3], names[2]]  # by start date
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+import pandas as pd
+import pytest
+import keyword_queue, manifest, scheduler
+from keyword_queue import KeywordQueue, DAY
+
+NOW = datetime(2026, 10, 17, tzinfo=timezone.utc).timestamp()
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setitem(keyword_queue.PIPELINES, "monthly", (str(tmp_path), None))
+    monkeypatch.setitem(manifest.DATASETS, "monthly", (str(tmp_path / "manifest.json"),) + manifest.DATASETS["monthly"][1:])
+    q = KeywordQueue("monthly")
+    yield q
+    q.close()
+
+def _file(tmp_path, name, values):
+    path = tmp_path / name
+    idx = pd.date_range(end="2026-09-01", periods=len(values), freq="MS", name="date")
+    pd.DataFrame({"v": values}, index=idx).to_csv(path)
+    return path
+
+def _entry(m, kw, path, updated):
+    m.record(kw, str(path), save=False, updated=updated)
+
+def _plan(queue, m):
+    return {r["keyword"]: r for r in scheduler.plan("monthly", queue, m, NOW)}
+
+def test_flat_series_is_due_one_interval_after_its_fetch(tmp_path, queue):
+    queue.add(["flat"])
+    queue.complete(queue.claim()[0])
+    m = manifest.Manifest("monthly", load=False)
+    _entry(m, "flat", _file(tmp_path, "flat.csv", [50] * 12), "2026-10-01T00:00:00Z")
+    row = _plan(queue, m)["flat"]
+    fetched = datetime(2026, 10, 1, tzinfo=timezone.utc).timestamp()
+    assert row["volatility"] == 0.0
+    assert row["due_at"] == fetched + scheduler.REFRESH_DAYS["monthly"] * DAY
+    assert row["staleness"] == pytest.approx(16 / 30, abs=1e-3)
+
+def test_fetch_time_comes_from_the_file_name(tmp_path, queue):
+    # a manifest rebuilt (or written) today must not make a file fetched last December fresh
+    queue.add(["old"])
+    queue.complete(queue.claim()[0])
+    m = manifest.Manifest("monthly", load=False)
+    _entry(m, "old", _file(tmp_path, "old_20251218_0456.csv", [50] * 12), "2026-10-16T12:00:00Z")
+    row = _plan(queue, m)["old"]
+    assert row["due_at"] < NOW
+    assert row["staleness"] == pytest.approx(scheduler.MAX_STALENESS)
+
+def test_volatile_and_never_fetched_come_first(tmp_path, queue):
+    queue.add(["flat", "volatile", "new"])
+    for kw in queue.claim(2):
+        queue.complete(kw)
+    m = manifest.Manifest("monthly", load=False)
+    _entry(m, "flat", _file(tmp_path, "flat.csv", [50] * 12), "2026-09-17T00:00:00Z")
+    _entry(m, "volatile", _file(tmp_path, "volatile.csv", [10, 90] * 6), "2026-09-17T00:00:00Z")
+    plan = scheduler.plan("monthly", queue, m, NOW)
+    assert [r["keyword"] for r in plan] == ["new", "volatile", "flat"]
+    rows = {r["keyword"]: r for r in plan}
+    assert rows["new"]["due_at"] == NOW
+    # the volatility boost brings the refresh forward
+    assert rows["volatile"]["due_at"] < rows["flat"]["due_at"]
+
+def test_failures_delay_the_refresh_until_the_retry_time(tmp_path, queue):
+    queue.add(["kw"])
+    queue.complete(queue.claim()[0])
+    m = manifest.Manifest("monthly", load=False)
+    _entry(m, "kw", _file(tmp_path, "kw.csv", [50] * 12), "2026-10-01T00:00:00Z")
+    before = _plan(queue, m)["kw"]
+    queue.fail("kw", "Connection reset by peer")
+    info = queue.info("kw")
+    assert info["status"] == "processed"  # keeps its data
+    after = _plan(queue, m)["kw"]
+    assert after["failures"] == 1
+    assert after["priority"] == pytest.approx(before["priority"] * scheduler.FAILURE_DECAY, abs=1e-4)
+    assert after["due_at"] == max(before["due_at"] + scheduler.REFRESH_DAYS["monthly"] * DAY, info["retry_at"])
+
+def test_reschedule_makes_due_keywords_claimable(tmp_path, queue):
+    queue.add(["old", "fresh"])
+    for kw in queue.claim(2):
+        queue.complete(kw)
+    m = manifest.Manifest("monthly", load=False)
+    _entry(m, "old", _file(tmp_path, "old_20251218_0456.csv", [50] * 12), None)
+    _entry(m, "fresh", _file(tmp_path, "fresh_20261016_0000.csv", [50] * 12), None)
+    scheduler.reschedule("monthly", queue, m, NOW)
+    assert [kw for kw, _, _ in queue.due(NOW)] == ["old"]
@@ -0,0 +1,64 @@
+import glob, os
+from datetime import datetime
+import pandas as pd
+import pytest
+import telemetry
+from conftest import ROOT
+from fake_trends import FakeTrendReq, true_volume
+from stitching import stitch_windows, stitch_windows_pandas
+from window_fetch import Checkpoints, WindowFetcher
+
+# the weekly fetcher's layout: 5-year windows every 4 years, the last one open
+WEEKLY = [(datetime(2015, 1, 1), datetime(2020, 1, 1)), (datetime(2019, 1, 1), datetime(2024, 1, 1)),
+          (datetime(2023, 1, 1), datetime(2026, 9, 30))]
+DAILY = [(datetime(2020, 1, 1), datetime(2020, 9, 22)), (datetime(2020, 7, 15), datetime(2021, 4, 6)),
+         (datetime(2021, 1, 27), datetime(2021, 10, 19))]
+
+def _fetcher(tmp_path, freq):
+    FakeTrendReq.configure()
+    log = telemetry.RequestLog("weekly", str(tmp_path / "requests.jsonl"), enabled=False)
+    return WindowFetcher(Checkpoints(str(tmp_path / freq)), FakeTrendReq, None, log, lambda msg: None,
+                         330, "LK", freq, max_retries=1, backoff=0, jitter=(0, 0))
+
+def _windows(fetcher, keyword, layout, max_workers):
+    jobs = [(keyword, keyword, s, e) for s, e in layout]
+    results = fetcher.fetch_many(jobs, None, max_workers=max_workers)
+    return [(results[job], job[2], job[3]) for job in jobs]
+
+@pytest.mark.parametrize("freq,layout", [("W-SUN", WEEKLY), ("D", DAILY)])
+@pytest.mark.parametrize("keyword", ["tea", "Colombo hotel"])
+def test_array_engine_matches_pandas_loop(tmp_path, freq, layout, keyword):
+    windows = _windows(_fetcher(tmp_path, freq), keyword, layout, 1)
+    fast, loop = stitch_windows(windows), stitch_windows_pandas(windows)
+    # the date index may differ in resolution (ns vs us) and freq, not in its dates
+    pd.testing.assert_frame_equal(fast, loop, check_index_type=False, check_freq=False)
+    assert fast.to_csv() == loop.to_csv()
+
+@pytest.mark.parametrize("engine", [stitch_windows, stitch_windows_pandas])
+def test_engines_reproduce_the_committed_weekly_file(engine):
+    windows = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "data_weekly", "raw_windows", "Bentota_hotel", "Bentota_hotel_*.csv"))):
+        s, e = (datetime.strptime(x, "%Y%m%d") for x in os.path.basename(path)[:-4].split("_")[-2:])
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        df.columns = ["Bentota_hotel"]
+        windows.append((df, s, e))
+    with open(os.path.join(ROOT, "data_weekly", "raw_weekly", "Bentota_hotel_weekly.csv"), encoding="utf-8") as f:
+        assert engine(windows).to_csv() == f.read()
+
+@pytest.mark.parametrize("freq,layout", [("W-SUN", WEEKLY), ("D", DAILY)])
+def test_stitched_series_follows_the_true_volume(tmp_path, freq, layout):
+    stitched = stitch_windows(_windows(_fetcher(tmp_path, freq), "tea", layout, 1))["tea"].dropna()
+    ratio = stitched / true_volume("tea", stitched.index)
+    # every window is rounded to whole points, so only about a percent of drift
+    assert ratio.std() / ratio.mean() < 0.02
+
+@pytest.mark.parametrize("freq,layout", [("W-SUN", WEEKLY), ("D", DAILY)])
+def test_concurrent_fetch_stitches_like_sequential(tmp_path, freq, layout):
+    sequential = stitch_windows(_windows(_fetcher(tmp_path / "seq", freq), "tea", layout, 1))
+    fetcher = _fetcher(tmp_path / "par", freq)
+    FakeTrendReq.latency = 0.01  # let the threads finish out of order
+    try:
+        concurrent = stitch_windows(_windows(fetcher, "tea", layout, 3))
+    finally:
+        FakeTrendReq.latency = 0.0
+    assert concurrent.to_csv() == sequential.to_csv()
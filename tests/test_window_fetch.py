@@ -0,0 +1,126 @@
+import os
+import pandas as pd
+from datetime import datetime
+import telemetry
+from fake_trends import FakeTrendReq, interest_frame
+from trends_cache import TrendsCache, payload_key
+from window_fetch import Checkpoints, WindowFetcher
+
+START, END = datetime(2020, 1, 1), datetime(2024, 6, 30)
+
+class Failing:
+    """Client factory whose sessions can't even be built."""
+    calls = 0
+
+    def __call__(self, user_agent=None):
+        self.calls += 1
+        raise ConnectionError("no route to host")
+
+class Monthly(FakeTrendReq):
+    """Answers every window with monthly rows, as Google does for too long a timeframe."""
+
+    def interest_over_time(self):
+        return interest_frame(self.kw_list, "2015-01-01 2024-06-30")
+
+class Throttle:
+    tripped = False
+
+    def __init__(self):
+        self.requests = self.failures = 0
+
+    def before_request(self):
+        self.requests += 1
+
+    def record_success(self):
+        pass
+
+    def record_failure(self, exc):
+        self.failures += 1
+
+    def backoff_for(self, exc):
+        return 0
+
+def _fetcher(tmp_path, freq="W-SUN", cache=None, **checkpoints):
+    FakeTrendReq.configure()
+    log = telemetry.RequestLog("weekly", str(tmp_path / "requests.jsonl"), enabled=False)
+    return WindowFetcher(Checkpoints(str(tmp_path / "checkpoints"), **checkpoints), FakeTrendReq, cache,
+                         log, lambda msg: None, 330, "LK", freq, max_retries=2, backoff=0, jitter=(0, 0))
+
+def test_fetch_checkpoints_the_window(tmp_path):
+    fetcher = _fetcher(tmp_path, max_age_days=14)
+    df = fetcher.fetch("tea", "tea", START, END)
+    assert df.index[0].weekday() == 6 and df.index[-1] >= END
+    assert df["tea"].notna().all()
+    path = fetcher.checkpoints.path("tea", START, END)
+    assert os.path.exists(path) and os.path.exists(path + ".done")
+    assert fetcher.checkpoints.load("tea", START, END).equals(df)
+
+def test_exhausted_retries_return_none_and_checkpoint_nothing(tmp_path):
+    fetcher = _fetcher(tmp_path, max_age_days=14)
+    factory = Failing()
+    assert fetcher.fetch("tea", "tea", START, END, client_factory=factory) is None
+    assert factory.calls == 2
+    assert not os.path.exists(fetcher.checkpoints.path("tea", START, END))
+
+def test_checkpoint_needs_an_intact_marker(tmp_path):
+    fetcher = _fetcher(tmp_path, max_age_days=14)
+    fetcher.fetch("tea", "tea", START, END)
+    path = fetcher.checkpoints.path("tea", START, END)
+    with open(path, "a") as f:
+        f.write("2024-07-07,1\n")
+    assert fetcher.checkpoints.load("tea", START, END) is None
+    fetcher.fetch("tea", "tea", START, END)
+    os.remove(path + ".done")
+    assert fetcher.checkpoints.load("tea", START, END) is None
+
+def test_open_daily_window_is_not_reused(tmp_path):
+    fetcher = _fetcher(tmp_path, "D", closed_after_days=7, dtype="float32")
+    closed = (datetime(2020, 1, 1), datetime(2020, 9, 22))
+    df = fetcher.fetch("tea", "tea", *closed)
+    assert len(df) == 266 and df["tea"].dtype == "float32"
+    assert fetcher.checkpoints.load("tea", *closed).equals(df)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    open_window = (today.replace(year=today.year - 1), today)
+    fetcher.fetch("tea", "tea", *open_window)
+    assert fetcher.checkpoints.load("tea", *open_window) is None
+
+def test_prune_keeps_planned_windows(tmp_path):
+    fetcher = _fetcher(tmp_path, "D", closed_after_days=7, dtype="float32")
+    a, b = (datetime(2020, 1, 1), datetime(2020, 9, 22)), (datetime(2020, 7, 15), datetime(2021, 4, 6))
+    fetcher.fetch_many([("tea", "tea", *a), ("tea", "tea", *b)], None, max_workers=2)
+    fetcher.checkpoints.prune("tea", [a])
+    assert sorted(os.listdir(tmp_path / "checkpoints" / "tea")) == ["tea_20200101_20200922.csv",
+                                                                   "tea_20200101_20200922.csv.done"]
+
+def test_fetch_many_leaves_out_windows_cut_short(tmp_path):
+    from throttle import CircuitOpen
+
+    class Tripped:
+        tripped = True
+
+        def before_request(self):
+            raise CircuitOpen("open")
+
+    fetcher = _fetcher(tmp_path, max_age_days=14)
+    jobs = [("tea", "tea", START, END)]
+    assert fetcher.fetch_many(jobs, Tripped()) == {}
+
+def test_coarse_response_is_not_cached(tmp_path):
+    cache = TrendsCache(str(tmp_path / "cache"))
+    fetcher, throttle = _fetcher(tmp_path, cache=cache, max_age_days=14), Throttle()
+    assert fetcher.fetch("tea", "tea", START, END, throttle, client_factory=Monthly) is None
+    # every attempt went to Google and counted against the circuit breaker
+    assert throttle.requests == throttle.failures == 2
+    assert not any(name.endswith(".csv") for _, _, names in os.walk(cache.root) for name in names)
+
+def test_coarse_cached_response_is_dropped_and_refetched(tmp_path):
+    cache = TrendsCache(str(tmp_path / "cache"))
+    fetcher, throttle = _fetcher(tmp_path, cache=cache, max_age_days=14), Throttle()
+    s, e = fetcher.bounds(START, END)
+    key, payload = payload_key(["tea"], f"{s:%Y-%m-%d} {e:%Y-%m-%d}", "LK", 330)
+    cache.put(key, payload, interest_frame(["tea"], "2015-01-01 2024-06-30"))
+    df = fetcher.fetch("tea", "tea", START, END, throttle)
+    assert df is not None and df["tea"].notna().all()
+    # the replayed bad frame cost no request and no failure
+    assert (throttle.requests, throttle.failures) == (1, 0)
+    assert cache.get(key).index[1] - cache.get(key).index[0] == pd.Timedelta(weeks=1)